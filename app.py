@@ -1,33 +1,50 @@
 import sys
 import os
 import datetime
-import queue
-import threading
+import hashlib
+import hmac
 import logging
+import threading
+import click
+from functools import wraps
+from types import SimpleNamespace
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, session
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_migrate import Migrate, upgrade
 from flask_wtf import FlaskForm, CSRFProtect
 from cachetools import TTLCache
 from flasgger import Swagger
 from logging.handlers import RotatingFileHandler
+from werkzeug.utils import secure_filename
 from forms import IgImportForm
 from services import (
     services_bp,
-    fetch_packages_from_registries,
-    normalize_package_data,
-    cache_packages,
-    import_package_and_dependencies,
+    log_feed_report,
+    refresh_package_cache,
+    load_cached_packages,
+    load_package_versions_data,
+    cached_package_to_dict,
+    version_key,
     parse_package_filename,
     construct_tgz_filename,
     get_package_description,
-    parse_test_data_folder
+    parse_test_data_folder,
+    ingest_test_data_upload,
+    read_test_data_resource,
+    get_ig_resource_types,
+    query_test_data_page
 )
 from models import db, CachedPackage, RegistryCacheInfo, ProcessedIg, TestDataResource
+from catalog import CatalogSnapshot, sort_versions
+from catalog_store import CatalogStore, CatalogStoreError
+from job_logs import LogBroker, current_job
+from scheduler import SingleFlightTask
+from jobs import ImportJobEngine, import_job_to_dict, DEPENDENCY_MODES
+from registry_mirror import mirror_bp
 
 # App setup
 app = Flask(__name__)
-app.config.from_pyfile('config.py')
+app.config.from_object('config.Config')
 db.init_app(app)
 csrf = CSRFProtect(app)
 migrate = Migrate(app, db)
@@ -50,6 +67,8 @@ swagger = Swagger(app)
 
 # Register blueprints
 app.register_blueprint(services_bp, url_prefix='/api')
+if app.config['REGISTRY_MIRROR_ENABLED']:
+    app.register_blueprint(mirror_bp, url_prefix=app.config['REGISTRY_MIRROR_PREFIX'])
 
 # Logging setup
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -63,139 +82,89 @@ file_handler.setLevel(logging.DEBUG)
 logging.getLogger().addHandler(file_handler)
 logger.info(f"File logging initialized to {log_file_path}")
 
-# In-memory cache
-package_cache = TTLCache(maxsize=100, ttl=300)
+# Rendered package details, keyed by (catalog version, lowercase name, tarball state)
+package_cache = TTLCache(maxsize=app.config.get('PACKAGE_DETAILS_CACHE_SIZE', 512), ttl=300)
+package_cache_lock = threading.Lock()
+
+def package_tarball_state(name, version):
+    # Imports in any worker replace the tarball, which changes the key everywhere.
+    tgz_filename = construct_tgz_filename(name, version) if name and version else None
+    if not tgz_filename:
+        return None
+    try:
+        stat = os.stat(os.path.join(app.config['FHIR_PACKAGES_DIR'], tgz_filename))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
-# Log queue for SSE
-log_queue = queue.Queue()
+# Per-job log channels for SSE
+log_broker = LogBroker(
+    spool_dir=app.config['JOB_LOG_SPOOL_DIR'],
+    buffer_size=app.config['JOB_LOG_BUFFER_SIZE'],
+    retention=app.config['JOB_LOG_RETENTION']
+)
+sse_slots = threading.BoundedSemaphore(max(1, app.config['SSE_MAX_STREAMS']))
 class StreamLogHandler(logging.Handler):
     def __init__(self):
         super().__init__(level=logging.INFO)
         self.formatter = logging.Formatter('%(levelname)s:%(name)s:%(message)s')
     def emit(self, record):
         if record.name == 'services' and record.levelno == logging.INFO:
-            msg = self.format(record)
-            log_queue.put(msg)
+            job_id = current_job.get()
+            if job_id:
+                log_broker.publish(job_id, self.format(record))
 services_logger = logging.getLogger('services')
 services_logger.addHandler(StreamLogHandler())
 
+import_jobs = ImportJobEngine(
+    app, log_broker,
+    max_workers=app.config['IMPORT_JOB_WORKERS'],
+    stale_after=app.config['IMPORT_JOB_STALE_SECONDS']
+)
+
 # Ensure directories
 os.makedirs(app.config['FHIR_PACKAGES_DIR'], exist_ok=True)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['TEST_DATA_FOLDER'], exist_ok=True)
+os.makedirs(app.config['TEST_DATA_UPLOAD_FOLDER'], exist_ok=True)
 
-# Context processor
-@app.context_processor
-def inject_app_mode():
-    return dict(app_mode=app.config.get('APP_MODE', 'lite'), site_name='FHIR Test Data App')
+# Catalog snapshot shared by all workers through a memory-mapped file
+catalog_store = CatalogStore(app.config['CATALOG_SNAPSHOT_DIR'])
 
-# Routes
-@app.route('/')
-def index():
-    return render_template('index.html', now=datetime.datetime.now())
+def get_catalog():
+    generation = catalog_store.generation()
+    catalog = app.config.get('PACKAGE_CATALOG')
+    if catalog is None or catalog.version != generation:
+        packages = catalog_store.load()
+        if packages is None:
+            # Version 0 marks "nothing usable published", so the next visit reseeds the snapshot.
+            catalog = CatalogSnapshot((), version=0)
+        else:
+            catalog = CatalogSnapshot(packages, packages.timestamp, version_key=version_key, version=packages.generation)
+        app.config['PACKAGE_CATALOG'] = catalog
+    return catalog
 
-@app.route('/search-and-import')
-def search_and_import():
-    page = request.args.get('page', 1, type=int)
-    per_page = 50
-    in_memory_packages = app.config.get('MANUAL_PACKAGE_CACHE')
-    in_memory_timestamp = app.config.get('MANUAL_CACHE_TIMESTAMP')
-    db_timestamp_info = RegistryCacheInfo.query.first()
-    db_timestamp = db_timestamp_info.last_fetch_timestamp if db_timestamp_info else None
-    normalized_packages = None
-    fetch_failed_flag = session.get('fetch_failed', False)
-    display_timestamp = None
-    is_fetching = False
-    fetch_in_progress = session.get('fetch_in_progress', False)
-
-    if fetch_in_progress and in_memory_packages is not None:
-        session['fetch_in_progress'] = False
-        normalized_packages = in_memory_packages
-        display_timestamp = in_memory_timestamp
-        fetch_failed_flag = session.get('fetch_failed', False)
-    elif in_memory_packages is not None:
-        normalized_packages = in_memory_packages
-        display_timestamp = in_memory_timestamp
-    else:
-        try:
-            cached_packages = CachedPackage.query.all()
-            if cached_packages:
-                normalized_packages = [
-                    {
-                        'name': pkg.package_name,
-                        'version': pkg.version,
-                        'latest_absolute_version': pkg.latest_absolute_version,
-                        'latest_official_version': pkg.latest_official_version,
-                        'author': pkg.author or '',
-                        'fhir_version': pkg.fhir_version or '',
-                        'url': pkg.url or '',
-                        'canonical': pkg.canonical or '',
-                        'dependencies': pkg.dependencies or [],
-                        'version_count': pkg.version_count or 1,
-                        'all_versions': pkg.all_versions or [{'version': pkg.version, 'pubDate': ''}],
-                        'registry': pkg.registry or ''
-                    } for pkg in cached_packages
-                ]
-                app.config['MANUAL_PACKAGE_CACHE'] = normalized_packages
-                app.config['MANUAL_CACHE_TIMESTAMP'] = db_timestamp or datetime.datetime.now(datetime.timezone.utc)
-                display_timestamp = app.config['MANUAL_CACHE_TIMESTAMP']
-            else:
-                is_fetching = True
-        except Exception as db_err:
-            logger.error(f"Error loading packages from database: {db_err}", exc_info=True)
-            flash("Error loading package cache. Fetching from registries...", "warning")
-            is_fetching = True
+def publish_catalog(packages, timestamp):
+    catalog_store.publish(packages, timestamp)
+    return get_catalog()
 
-    if normalized_packages is None:
-        try:
-            while not log_queue.empty():
-                log_queue.get()
-            session['fetch_in_progress'] = True
-            raw_packages = fetch_packages_from_registries(search_term='')
-            if not raw_packages:
-                normalized_packages = []
-                fetch_failed_flag = True
-                session['fetch_failed'] = True
-                app.config['MANUAL_PACKAGE_CACHE'] = []
-                app.config['MANUAL_CACHE_TIMESTAMP'] = None
-            else:
-                normalized_packages = normalize_package_data(raw_packages)
-                now_ts = datetime.datetime.now(datetime.timezone.utc)
-                app.config['MANUAL_PACKAGE_CACHE'] = normalized_packages
-                app.config['MANUAL_CACHE_TIMESTAMP'] = now_ts
-                cache_packages(normalized_packages, db, CachedPackage)
-                if db_timestamp_info:
-                    db_timestamp_info.last_fetch_timestamp = now_ts
-                else:
-                    db_timestamp_info = RegistryCacheInfo(last_fetch_timestamp=now_ts)
-                    db.session.add(db_timestamp_info)
-                db.session.commit()
-                session['fetch_failed'] = False
-                fetch_failed_flag = False
-                display_timestamp = now_ts
-        except Exception as fetch_err:
-            logger.error(f"Error fetching packages: {fetch_err}", exc_info=True)
-            normalized_packages = []
-            fetch_failed_flag = True
-            session['fetch_failed'] = True
-            app.config['MANUAL_PACKAGE_CACHE'] = []
-            app.config['MANUAL_CACHE_TIMESTAMP'] = None
-            flash("Error fetching package list.", "error")
-
-    if not isinstance(normalized_packages, list):
-        normalized_packages = []
-        fetch_failed_flag = True
-        session['fetch_failed'] = True
-
-    total_packages = len(normalized_packages)
-    start = (page - 1) * per_page
-    end = start + per_page
-    packages_processed = [
-        {**pkg, 'display_version': pkg.get('latest_official_version') or pkg.get('latest_absolute_version') or 'N/A'}
-        for pkg in normalized_packages
-    ]
-    packages_on_page = packages_processed[start:end]
-    total_pages = max(1, (total_packages + per_page - 1) // per_page)
+def preload_catalog(path):
+    # Seed an empty store from an exported snapshot so a fresh container serves without network access.
+    if not path:
+        return
+    if not os.path.exists(path):
+        logger.warning(f"Catalog preload file {path} does not exist")
+        return
+    try:
+        if catalog_store.import_snapshot(path, if_missing=True):
+            logger.info(f"Preloaded catalog from {path}")
+    except CatalogStoreError as e:
+        logger.error(f"Could not preload catalog from {path}: {e}")
+
+preload_catalog(app.config['CATALOG_PRELOAD_PATH'])
+
+def build_pagination(items, page, per_page, total):
+    total_pages = max(1, (total + per_page - 1) // per_page)
 
     def iter_pages(left_edge=1, left_current=1, right_current=2, right_edge=1):
         pages = []
@@ -214,11 +183,11 @@ def search_and_import():
             pages.append(i)
         return pages
 
-    pagination = SimpleNamespace(
-        items=packages_on_page,
+    return SimpleNamespace(
+        items=items,
         page=page,
         pages=total_pages,
-        total=total_packages,
+        total=total,
         per_page=per_page,
         has_prev=(page > 1),
         has_next=(page < total_pages),
@@ -227,129 +196,150 @@ def search_and_import():
         iter_pages=iter_pages()
     )
 
+def require_api_key(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        provided = request.headers.get('X-API-Key', '')
+        if not hmac.compare_digest(provided.encode(), app.config['API_KEY'].encode()):
+            return jsonify({"status": "error", "message": "Invalid or missing API key"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# Context processor
+@app.context_processor
+def inject_app_mode():
+    return dict(app_mode=app.config.get('APP_MODE', 'lite'), site_name='FHIR Test Data App')
+
+# Routes
+@app.route('/')
+def index():
+    return render_template('index.html', now=datetime.datetime.now())
+
+@app.route('/search-and-import')
+def search_and_import():
+    page = request.args.get('page', 1, type=int)
+    per_page = 50
+    catalog = get_catalog()
+    if not catalog.version:
+        # Nothing published yet: seed the snapshot from the database, or fetch in the background.
+        try:
+            cached_packages = load_cached_packages()
+            if cached_packages:
+                db_timestamp_info = RegistryCacheInfo.query.first()
+                db_timestamp = db_timestamp_info.last_fetch_timestamp if db_timestamp_info else None
+                catalog = publish_catalog(cached_packages, db_timestamp or datetime.datetime.now(datetime.timezone.utc))
+        except Exception as db_err:
+            logger.error(f"Error loading packages from database: {db_err}", exc_info=True)
+            flash("Error loading package cache. Fetching from registries...", "warning")
+        if not catalog.version:
+            catalog_refresh.trigger()
+    packages_on_page = catalog.page(page, per_page)
+    pagination = build_pagination(packages_on_page, page, per_page, len(catalog))
+
     form = IgImportForm()
     return render_template('search_and_import_ig.html',
                            packages=packages_on_page,
                            pagination=pagination,
                            form=form,
-                           fetch_failed=fetch_failed_flag,
-                           last_cached_timestamp=display_timestamp,
-                           is_fetching=is_fetching)
+                           fetch_failed=app.config.get('MANUAL_FETCH_FAILED', False),
+                           last_cached_timestamp=catalog.timestamp,
+                           is_fetching=catalog_refresh.running or not catalog.version)
 
 @app.route('/api/refresh-cache-task', methods=['POST'])
 @csrf.exempt
 def refresh_cache_task():
-    while not log_queue.empty():
-        log_queue.get_nowait()
-    logger.info("Received API request to refresh cache.")
-    thread = threading.Thread(target=perform_cache_refresh_and_log, daemon=True)
-    thread.start()
-    return jsonify({"status": "accepted", "message": "Cache refresh started."}), 202
-
-def perform_cache_refresh_and_log():
+    job_id = log_broker.open()
+    logger.info(f"Received API request to refresh cache (job {job_id}).")
+    if not catalog_refresh.trigger(job_id=job_id):
+        log_broker.close(job_id)
+        return jsonify({"status": "running", "message": "A cache refresh is already running."}), 202
+    return jsonify({
+        "status": "accepted",
+        "message": "Cache refresh started.",
+        "job_id": job_id,
+        "log_stream": url_for('stream_import_logs', job_id=job_id)
+    }), 202
+
+def perform_cache_refresh_and_log(job_id=None, scheduled=False):
     with app.app_context():
-        logger.info("Starting background cache refresh")
-        try:
-            app.config['MANUAL_PACKAGE_CACHE'] = None
-            app.config['MANUAL_CACHE_TIMESTAMP'] = None
-            timestamp_info = RegistryCacheInfo.query.first()
-            if timestamp_info:
-                timestamp_info.last_fetch_timestamp = None
-            db.session.query(CachedPackage).delete()
-            db.session.flush()
-            raw_packages = fetch_packages_from_registries(search_term='')
-            fetch_failed = not raw_packages
-            normalized_packages = normalize_package_data(raw_packages) if raw_packages else []
-            now_ts = datetime.datetime.now(datetime.timezone.utc)
-            app.config['MANUAL_PACKAGE_CACHE'] = normalized_packages
-            app.config['MANUAL_CACHE_TIMESTAMP'] = now_ts
-            session['fetch_failed'] = fetch_failed
-            if not fetch_failed and normalized_packages:
-                cache_packages(normalized_packages, db, CachedPackage)
-            if not fetch_failed:
-                if timestamp_info:
-                    timestamp_info.last_fetch_timestamp = now_ts
-                else:
-                    timestamp_info = RegistryCacheInfo(last_fetch_timestamp=now_ts)
-                    db.session.add(timestamp_info)
-                db.session.commit()
-            else:
+        catalog = get_catalog()
+        if scheduled and catalog.timestamp:
+            timestamp = catalog.timestamp
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+            age = (datetime.datetime.now(datetime.timezone.utc) - timestamp).total_seconds()
+            if age < catalog_refresh.interval / 2:
+                logger.debug(f"Catalog refreshed {age:.0f}s ago; skipping scheduled refresh")
+                return
+        job_id = job_id or log_broker.open()
+        with log_broker.job(job_id):
+            logger.info(f"Starting {'scheduled' if scheduled else 'background'} cache refresh")
+            try:
+                refresh = refresh_package_cache(current_packages=catalog.packages if catalog.version else None)
+                log_feed_report(refresh['feeds'])
+                app.config['MANUAL_FETCH_FAILED'] = refresh['fetch_failed']
+                # The previous snapshot keeps serving until the new one is published in one swap.
+                if not refresh['fetch_failed']:
+                    publish_catalog(refresh['packages'], refresh['timestamp'])
+            except Exception as e:
                 db.session.rollback()
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"Critical error during cache refresh: {e}", exc_info=True)
-            log_queue.put(f"CRITICAL ERROR: {e}")
-        finally:
-            log_queue.put("[DONE]")
+                logger.error(f"Critical error during cache refresh: {e}", exc_info=True)
+                log_broker.publish(job_id, f"CRITICAL ERROR: {e}")
+
+catalog_refresh = SingleFlightTask(
+    'catalog-refresh', perform_cache_refresh_and_log,
+    interval=app.config['CATALOG_REFRESH_INTERVAL'],
+    jitter=app.config['CATALOG_REFRESH_JITTER'],
+    lock_path=os.path.join(app.config['CATALOG_SNAPSHOT_DIR'], 'refresh.lock')
+)
+
+@app.before_request
+def start_background_tasks():
+    catalog_refresh.start()
 
 @app.route('/stream-import-logs')
-def stream_import_logs():
+@app.route('/stream-import-logs/<job_id>')
+def stream_import_logs(job_id=None):
+    job_id = job_id or request.args.get('job_id')
+    if not job_id:
+        return jsonify({"status": "error", "message": "A job_id is required."}), 400
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', 0, type=int)
+    heartbeat = app.config['SSE_HEARTBEAT_INTERVAL']
+    max_duration = app.config['SSE_MAX_STREAM_SECONDS']
+    if not sse_slots.acquire(blocking=False):
+        logger.warning(f"Refusing log stream for job {job_id}: {app.config['SSE_MAX_STREAMS']} streams already open")
+        body = {"status": "busy", "message": "Too many open log streams; poll the job status instead.", "job_id": job_id}
+        if import_jobs.get(job_id) is not None:
+            body['status_url'] = url_for('api_import_job', job_id=job_id)
+        response = jsonify(body)
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(heartbeat))
+        return response
     def generate():
-        while True:
-            try:
-                msg = log_queue.get(timeout=300)
-                clean_msg = str(msg).replace('INFO:services:', '').replace('INFO:app:', '').strip()
-                yield f"data: {clean_msg}\n\n"
-                if msg == '[DONE]':
-                    break
-            except queue.Empty:
-                yield "data: ERROR: Timeout waiting for logs.\n\n"
-                yield "data: [DONE]\n\n"
-                break
-    return Response(generate(), mimetype='text/event-stream')
+        yield f"retry: {int(heartbeat * 1000)}\n\n"
+        for event in log_broker.follow(job_id, after=last_event_id, heartbeat=heartbeat, max_duration=max_duration):
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            event_id, msg = event
+            clean_msg = str(msg).replace('INFO:services:', '').replace('INFO:app:', '').strip()
+            yield f"id: {event_id}\ndata: {clean_msg}\n\n"
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(sse_slots.release)
+    return response
 
 @app.route('/api/search-packages', methods=['GET'])
 def api_search_packages():
     search_term = request.args.get('search', '').lower()
     page = request.args.get('page', 1, type=int)
     per_page = 50
-    all_cached_packages = app.config.get('MANUAL_PACKAGE_CACHE') or []
-    if search_term:
-        filtered_packages = [
-            pkg for pkg in all_cached_packages
-            if search_term in pkg.get('name', '').lower() or search_term in pkg.get('author', '').lower()
-        ]
-    else:
-        filtered_packages = all_cached_packages
-    filtered_packages = [
-        {**pkg, 'display_version': pkg.get('latest_official_version') or pkg.get('latest_absolute_version') or 'N/A'}
-        for pkg in filtered_packages
-    ]
-    total_filtered = len(filtered_packages)
-    start = (page - 1) * per_page
-    end = start + per_page
-    packages_on_page = filtered_packages[start:end]
-    total_pages = max(1, (total_filtered + per_page - 1) // per_page)
-
-    def iter_pages(left_edge=1, left_current=1, right_current=2, right_edge=1):
-        pages = []
-        last_page = 0
-        for i in range(1, min(left_edge + 1, total_pages + 1)):
-            pages.append(i)
-            last_page = i
-        if last_page < page - left_current - 1:
-            pages.append(None)
-        for i in range(max(last_page + 1, page - left_current), min(page + right_current + 1, total_pages + 1)):
-            pages.append(i)
-            last_page = i
-        if last_page < total_pages - right_edge:
-            pages.append(None)
-        for i in range(max(last_page + 1, total_pages - right_edge + 1), total_pages + 1):
-            pages.append(i)
-        return pages
-
-    pagination = SimpleNamespace(
-        items=packages_on_page,
-        page=page,
-        pages=total_pages,
-        total=total_filtered,
-        per_page=per_page,
-        has_prev=(page > 1),
-        has_next=(page < total_pages),
-        prev_num=page - 1 if page > 1 else None,
-        next_num=page + 1 if page < total_pages else None,
-        iter_pages=iter_pages()
-    )
+    catalog = get_catalog()
+    packages_on_page, total_filtered = catalog.search_page(search_term, page, per_page)
+    pagination = build_pagination(packages_on_page, page, per_page, total_filtered)
     return render_template('_search_results_table.html', packages=packages_on_page, pagination=pagination)
 
 @app.route('/import-ig', methods=['GET', 'POST'])
@@ -360,37 +350,20 @@ def import_ig():
         name = form.package_name.data
         version = form.package_version.data
         dependency_mode = form.dependency_mode.data
-        while not log_queue.empty():
-            log_queue.get()
         try:
-            result = import_package_and_dependencies(name, version, dependency_mode=dependency_mode)
-            if result['errors'] and not result['downloaded']:
-                error_msg = result['errors'][0]
-                simplified_msg = error_msg
-                if "HTTP error" in error_msg and "404" in error_msg:
-                    simplified_msg = "Package not found (404)."
-                elif "HTTP error" in error_msg:
-                    simplified_msg = f"Registry error: {error_msg.split(': ', 1)[-1]}"
-                elif "Connection error" in error_msg:
-                    simplified_msg = "Could not connect to registry."
-                flash(f"Failed to import {name}#{version}: {simplified_msg}", "error")
-                if is_ajax:
-                    return jsonify({"status": "error", "message": simplified_msg}), 400
-                return render_template('import_ig.html', form=form)
-            else:
-                if result['errors']:
-                    flash(f"Partially imported {name}#{version} with errors.", "warning")
-                else:
-                    flash(f"Successfully imported {name}#{version}!", "success")
-                if is_ajax:
-                    return jsonify({"status": "success", "message": f"Imported {name}#{version}", "redirect": url_for('search_and_import')}), 200
-                return redirect(url_for('search_and_import'))
+            job_id, created = import_jobs.submit(name, version, dependency_mode)
         except Exception as e:
-            logger.error(f"Unexpected error during IG import: {e}", exc_info=True)
+            logger.error(f"Unexpected error queueing IG import: {e}", exc_info=True)
             flash(f"Error importing IG: {e}", "error")
             if is_ajax:
                 return jsonify({"status": "error", "message": str(e)}), 500
             return render_template('import_ig.html', form=form)
+        message = f"Import of {name}#{version} started." if created else f"Import of {name}#{version} is already running."
+        if is_ajax:
+            return jsonify(import_job_links(job_id, status="accepted", message=message,
+                                            redirect=url_for('search_and_import'))), 202
+        flash(message, "info")
+        return redirect(url_for('search_and_import'))
     else:
         for field, errors in form.errors.items():
             for error in errors:
@@ -399,95 +372,189 @@ def import_ig():
             return jsonify({"status": "error", "message": "Form validation failed", "errors": form.errors}), 400
         return render_template('import_ig.html', form=form)
 
+def import_job_links(job_id, **extra):
+    return dict(extra, job_id=job_id,
+                status_url=url_for('api_import_job', job_id=job_id),
+                log_stream=url_for('stream_import_logs', job_id=job_id))
+
+@app.route('/api/import-jobs', methods=['GET', 'POST'])
+@csrf.exempt
+def api_import_jobs():
+    if request.method == 'GET':
+        jobs = import_jobs.recent(limit=min(request.args.get('limit', 50, type=int), 500), status=request.args.get('status'))
+        return jsonify([import_job_to_dict(job) for job in jobs])
+    data = request.get_json(silent=True) or {}
+    name = data.get('package_name')
+    version = data.get('version')
+    dependency_mode = data.get('dependency_mode', 'recursive')
+    if not name or not version:
+        return jsonify({"status": "error", "message": "package_name and version are required"}), 400
+    if dependency_mode not in DEPENDENCY_MODES:
+        return jsonify({"status": "error", "message": f"Unknown dependency_mode {dependency_mode}"}), 400
+    job_id, created = import_jobs.submit(name, version, dependency_mode)
+    return jsonify(import_job_links(job_id, status="accepted", created=created)), 202
+
+@app.route('/api/import-jobs/<job_id>')
+def api_import_job(job_id):
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(import_job_to_dict(job))
+
 @app.route('/package-details/<name>')
 def package_details_view(name):
-    from services import safe_parse_version
-    packages = None
-    source = "Not Found"
-    in_memory_cache = app.config.get('MANUAL_PACKAGE_CACHE')
-    if in_memory_cache:
-        cached_data = [pkg for pkg in in_memory_cache if pkg.get('name', '').lower() == name.lower()]
-        if cached_data:
-            packages = cached_data
-            source = "In-Memory Cache"
-    if packages is None:
+    catalog = get_catalog()
+    package = catalog.get(name)
+    source = "In-Memory Cache"
+    if package is None:
         try:
-            db_packages = CachedPackage.query.filter(CachedPackage.package_name.ilike(name)).all()
-            if db_packages:
-                packages = db_packages
+            db_package = CachedPackage.query.filter_by(package_name_lower=name.lower()).first()
+            if db_package:
+                package = cached_package_to_dict(db_package)
                 source = "Database"
         except Exception as db_err:
             logger.error(f"Database error querying package '{name}': {db_err}", exc_info=True)
-    if packages is None:
-        try:
-            raw_packages = fetch_packages_from_registries(search_term=name)
-            normalized_packages = normalize_package_data(raw_packages)
-            packages = [pkg for pkg in normalized_packages if pkg.get('name', '').lower() == name.lower()]
-            source = "Fetched from Registries"
-        except Exception as fetch_err:
-            logger.error(f"Error fetching package '{name}': {fetch_err}", exc_info=True)
-            flash(f"Error fetching package details.", "error")
-            return redirect(url_for('search_and_import'))
-    if not packages:
+    if package is None:
         flash(f"Package {name} not found.", "error")
         return redirect(url_for('search_and_import'))
-    is_dict_list = isinstance(packages[0], dict)
-    package = packages[0]
-    latest_absolute_version = package.get('latest_absolute_version') if is_dict_list else package.version
-    latest_official_version = package.get('latest_official_version') if is_dict_list else package.latest_official_version
-    all_versions = package.get('all_versions', []) if is_dict_list else package.all_versions or []
-    dependencies = package.get('dependencies', []) if is_dict_list else package.dependencies or []
-    actual_package_name = package.get('name', name) if is_dict_list else package.package_name
-    package_json = {
-        'name': actual_package_name,
-        'version': latest_absolute_version,
-        'author': package.get('author') if is_dict_list else package.author,
-        'fhir_version': package.get('fhir_version') if is_dict_list else package.fhir_version,
-        'canonical': package.get('canonical', '') if is_dict_list else package.canonical or '',
-        'dependencies': dependencies,
-        'url': package.get('url') if is_dict_list else package.url,
-        'registry': package.get('registry', 'https://packages.simplifier.net'),
-        'description': get_package_description(actual_package_name, latest_absolute_version, app.config['FHIR_PACKAGES_DIR'])
-    }
-    versions_sorted = sorted(all_versions, key=lambda x: safe_parse_version(x['version']), reverse=True)
-    return render_template('package_details.html',
-                           package_json=package_json,
-                           dependencies=dependencies,
-                           versions=[v['version'] for v in versions_sorted],
-                           package_name=actual_package_name,
-                           latest_official_version=latest_official_version)
+    actual_package_name = package.get('name') or name
+    latest_absolute_version = package.get('latest_absolute_version')
+    cache_key = (catalog.version, name.lower(), package_tarball_state(actual_package_name, latest_absolute_version))
+    with package_cache_lock:
+        cached = package_cache.get(cache_key)
+    if cached is None:
+        logger.debug(f"Rendering details for package '{name}' from {source}")
+        if source == "Database":
+            versions = sort_versions(package['all_versions'], version_key)
+        else:
+            versions = catalog.sorted_versions(name)
+        dependencies = package.get('dependencies') or []
+        package_json = {
+            'name': actual_package_name,
+            'version': latest_absolute_version,
+            'author': package.get('author'),
+            'fhir_version': package.get('fhir_version'),
+            'canonical': package.get('canonical') or '',
+            'dependencies': dependencies,
+            'url': package.get('url'),
+            'registry': package.get('registry') or 'https://packages.simplifier.net',
+            'description': get_package_description(actual_package_name, latest_absolute_version, app.config['FHIR_PACKAGES_DIR'])
+        }
+        # Pending flash messages are per-user, so a page that shows them must not be shared.
+        has_flashes = bool(session.get('_flashes'))
+        body = render_template('package_details.html',
+                               package_json=package_json,
+                               dependencies=dependencies,
+                               versions=list(versions),
+                               package_name=actual_package_name,
+                               latest_official_version=package.get('latest_official_version'))
+        if has_flashes:
+            return body
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        cached = (etag, body)
+        with package_cache_lock:
+            package_cache[cache_key] = cached
+    etag, body = cached
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/package-details/<name>/versions')
+def package_versions_data(name):
+    try:
+        versions_data = load_package_versions_data(name)
+    except Exception as e:
+        logger.error(f"Error loading feed entries for package '{name}': {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+    if not versions_data:
+        return jsonify({"status": "error", "message": f"Package {name} not found"}), 404
+    return jsonify({"name": name, "versions_data": versions_data})
 
 @app.route('/test-data', methods=['GET', 'POST'])
 def test_data():
     form = FlaskForm()
-    ig_filter = request.form.get('ig_filter') if request.method == 'POST' else None
+    ig_filter = request.form.get('ig_filter') if request.method == 'POST' else request.args.get('ig_filter')
+    after = None if request.method == 'POST' else request.args.get('after', type=int)
+    per_page = 100
+    resource_types = None
+    if ig_filter:
+        try:
+            pkg_name, pkg_version = ig_filter.split('#')
+            resource_types = get_ig_resource_types(pkg_name, pkg_version)
+        except Exception as e:
+            logger.error(f"Error applying IG filter: {e}", exc_info=True)
+            flash("Error applying filter.", "error")
     try:
-        test_resources = TestDataResource.query.all()
-        processed_igs = ProcessedIg.query.order_by(ProcessedIg.package_name, ProcessedIg.version).all()
+        test_resources, next_after = query_test_data_page(resource_types, after=after, per_page=per_page)
+        processed_igs = db.session.query(ProcessedIg.package_name, ProcessedIg.version).order_by(
+            ProcessedIg.package_name, ProcessedIg.version).all()
         ig_choices = [('', 'No Filter')] + [(f"{ig.package_name}#{ig.version}", f"{ig.package_name}#{ig.version}") for ig in processed_igs]
     except Exception as e:
         logger.error(f"Error fetching test data or IGs: {e}", exc_info=True)
         flash("Error loading test data.", "error")
-        test_resources = []
+        test_resources, next_after = [], None
         ig_choices = [('', 'No Filter')]
-    if ig_filter and ig_filter != '':
-        try:
-            pkg_name, pkg_version = ig_filter.split('#')
-            selected_ig = ProcessedIg.query.filter_by(package_name=pkg_name, version=pkg_version).first()
-            if selected_ig:
-                ig_resource_types = {info['type'] for info in selected_ig.resource_types_info if info.get('type')}
-                test_resources = [res for res in test_resources if res.resource_type in ig_resource_types]
-        except Exception as e:
-            logger.error(f"Error applying IG filter: {e}", exc_info=True)
-            flash("Error applying filter.", "error")
     return render_template('test_data.html',
                            form=form,
                            test_resources=test_resources,
                            ig_choices=ig_choices,
-                           selected_ig=ig_filter)
+                           selected_ig=ig_filter,
+                           is_first_page=not after,
+                           next_after=next_after)
+
+@app.route('/api/test-data/upload', methods=['POST'])
+@csrf.exempt
+@require_api_key
+def upload_test_data():
+    filename = secure_filename(request.args.get('filename', ''))
+    if not filename.lower().endswith(('.json', '.ndjson')):
+        return jsonify({"status": "error", "message": "filename must end in .json or .ndjson"}), 400
+    try:
+        result = ingest_test_data_upload(request.stream, filename)
+    except Exception as e:
+        logger.error(f"Error ingesting upload {filename}: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(dict(result, status="success")), 201
+
+@app.route('/api/test-data/<int:resource_id>')
+def get_test_data_resource(resource_id):
+    resource = db.session.get(TestDataResource, resource_id)
+    if resource is None:
+        return jsonify({"status": "error", "message": "Resource not found"}), 404
+    try:
+        content = read_test_data_resource(resource)
+    except OSError as e:
+        logger.error(f"Error reading test data resource {resource_id}: {e}")
+        return jsonify({"status": "error", "message": "Resource file is unavailable"}), 410
+    return Response(content, mimetype='application/fhir+json')
+
+@app.cli.command('export-catalog')
+@click.argument('path')
+def export_catalog_command(path):
+    if catalog_store.load() is None:
+        packages = load_cached_packages()
+        if not packages:
+            print("No catalog to export: refresh the registry cache first.")
+            sys.exit(1)
+        db_timestamp_info = RegistryCacheInfo.query.first()
+        publish_catalog(packages, db_timestamp_info.last_fetch_timestamp if db_timestamp_info else None)
+    packages = catalog_store.export_snapshot(path)
+    print(f"Exported {len(packages)} packages (generation {packages.generation}) to {path} ({os.path.getsize(path)} bytes)")
+
+@app.cli.command('import-catalog')
+@click.argument('path')
+def import_catalog_command(path):
+    try:
+        generation = catalog_store.import_snapshot(path)
+    except CatalogStoreError as e:
+        print(f"Import failed: {e}")
+        sys.exit(1)
+    print(f"Imported {len(catalog_store.load())} packages from {path} as generation {generation}")
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        upgrade()
         parse_test_data_folder(app.config['TEST_DATA_FOLDER'])
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,105 @@
+"""Compare the legacy per-row cache_packages loop with the bulk upsert path.
+
+Usage: python benchmarks/bench_cache_packages.py [--packages 10000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, CachedPackage
+from services import cache_packages
+
+
+def synthetic_catalog(count, revision=0):
+    packages = []
+    for i in range(count):
+        version = f"1.{i % 7}.{revision}"
+        packages.append({
+            'name': f"example.fhir.bench{i:05d}",
+            'version': version,
+            'latest_absolute_version': version,
+            'latest_official_version': version,
+            'author': f"Author {i % 50}",
+            'fhir_version': '4.0.1',
+            'url': f"https://example.org/fhir/bench{i:05d}",
+            'canonical': f"https://example.org/fhir/bench{i:05d}",
+            'dependencies': [{'name': 'hl7.fhir.r4.core', 'version': '4.0.1'}],
+            'version_count': 3,
+            'all_versions': [{'version': f"1.{n}.{revision}", 'pubDate': f"2024-0{n + 1}-01"} for n in range(3)],
+            'registry': 'https://packages.fhir.org'
+        })
+    return packages
+
+
+def legacy_cache_packages(normalized_packages):
+    for package in normalized_packages:
+        existing = CachedPackage.query.filter_by(package_name=package['name'], version=package['version']).first()
+        if existing:
+            existing.author = package['author']
+            existing.fhir_version = package['fhir_version']
+            existing.version_count = package['version_count']
+            existing.url = package['url']
+            existing.all_versions = package['all_versions']
+            existing.dependencies = package['dependencies']
+            existing.latest_absolute_version = package['latest_absolute_version']
+            existing.latest_official_version = package['latest_official_version']
+            existing.canonical = package['canonical']
+            existing.registry = package.get('registry', '')
+        else:
+            db.session.add(CachedPackage(
+                package_name=package['name'],
+                version=package['version'],
+                author=package['author'],
+                fhir_version=package['fhir_version'],
+                version_count=package['version_count'],
+                url=package['url'],
+                all_versions=package['all_versions'],
+                dependencies=package['dependencies'],
+                latest_absolute_version=package['latest_absolute_version'],
+                latest_official_version=package['latest_official_version'],
+                canonical=package['canonical'],
+                registry=package.get('registry', '')
+            ))
+    db.session.commit()
+
+
+def timed(label, count, func, *args):
+    started = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {count:>7} rows  {elapsed:8.3f}s  {count / elapsed:10.0f} rows/s")
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            fresh = synthetic_catalog(count)
+            updated = synthetic_catalog(count)
+            for package in updated:
+                package['author'] += ' (updated)'
+
+            timed('legacy insert', count, legacy_cache_packages, fresh)
+            timed('legacy update', count, legacy_cache_packages, updated)
+            db.session.query(CachedPackage).delete()
+            db.session.commit()
+            db.session.expunge_all()
+
+            timed('bulk upsert insert', count, cache_packages, fresh, db, CachedPackage)
+            timed('bulk upsert update', count, cache_packages, updated, db, CachedPackage)
+            assert db.session.query(CachedPackage).count() == count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--packages', type=int, default=10000)
+    run(parser.parse_args().packages)
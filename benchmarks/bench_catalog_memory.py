@@ -0,0 +1,74 @@
+"""Report the memory a worker spends on the package catalog, before and after the compact layout.
+
+Usage: python benchmarks/bench_catalog_memory.py [--entries 100000]
+"""
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_normalize import legacy_normalize_package_data, synthetic_feed
+from catalog_store import CatalogStore
+from services import group_feed_entries, normalize_package_data
+
+
+def measure(label, func, *args):
+    gc.collect()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    print(f"{label:<44} {(current - before) / 2 ** 20:9.1f} MiB held  {(peak - before) / 2 ** 20:9.1f} MiB peak")
+    return result
+
+
+def db_loaded_form(packages):
+    # What load_cached_packages used to rebuild from the JSON columns, next to the feed copy.
+    return [json.loads(json.dumps({key: value for key, value in pkg.items() if key != 'versions_data'}))
+            for pkg in packages]
+
+
+def decode_all(packages):
+    return list(packages)
+
+
+def from_feed_text(normalize, feed_text):
+    # Parse inside the measurement: whatever the catalog keeps referencing from the feed counts against it.
+    return normalize(group_feed_entries(json.loads(feed_text)))
+
+
+def run(count):
+    logging.getLogger('services').setLevel(logging.ERROR)
+    feed_text = json.dumps(synthetic_feed(count))
+    tracemalloc.start()
+    legacy = measure('legacy: normalized dicts with versions_data', from_feed_text, legacy_normalize_package_data, feed_text)
+    measure('legacy: DB-loaded copy', db_loaded_form, legacy)
+    legacy_bytes = sum(len(json.dumps(pkg, separators=(',', ':'))) for pkg in legacy)
+    del legacy
+    packages = measure('compact: normalized dicts', from_feed_text, normalize_package_data, feed_text)
+    with tempfile.TemporaryDirectory() as directory:
+        store = CatalogStore(directory)
+        store.publish(packages, datetime.datetime.now(datetime.timezone.utc))
+        snapshot_bytes = os.path.getsize(store.snapshot_path)
+        mapped = measure('compact: mapped snapshot (per worker)', store.load)
+        measure('compact: every record decoded (__slots__)', decode_all, mapped)
+        del mapped
+    tracemalloc.stop()
+    print(f"{len(packages)} packages from {count} feed entries")
+    print(f"snapshot size: legacy JSON records {legacy_bytes / 2 ** 20:.1f} MiB, "
+          f"columnar {snapshot_bytes / 2 ** 20:.1f} MiB (page cache, shared by all workers)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=100000)
+    run(parser.parse_args().entries)
@@ -0,0 +1,178 @@
+"""Compare the baseline normalize_package_data with the single-pass, memoized version.
+
+Usage: python benchmarks/bench_normalize.py [--entries 100000]
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services
+from services import normalize_package_data, safe_parse_version
+
+logger = logging.getLogger('services')
+
+
+def synthetic_feed(count, seed=42):
+    rng = random.Random(seed)
+    suffixes = ['', '', '', '-ballot', '-draft', '-cibuild', '-snapshot', '-rc1', '-preview', ' nightly']
+    entries = []
+    for i in range(count):
+        package = i // 5
+        version = f"{rng.randint(0, 6)}.{rng.randint(0, 12)}.{rng.randint(0, 30)}{rng.choice(suffixes)}"
+        name = f"example.fhir.bench{package:05d}"
+        entry = {
+            'author': f"Author {package % 50}",
+            'fhirVersion': rng.choice(['4.0.1', '5.0.0', '3.0.2']),
+            'url': f"https://example.org/fhir/bench{package:05d}",
+            'canonical': f"https://example.org/fhir/bench{package:05d}",
+            'dependencies': {'hl7.fhir.r4.core': '4.0.1'} if i % 3 else ['hl7.terminology@5.0.0'],
+            'versions': [{'version': version, 'pubDate': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"}],
+            'registry': 'https://packages.fhir.org'
+        }
+        if i % 4 == 0:
+            entry['name'] = f"{name.upper() if i % 8 == 0 else name}#{version}"
+        else:
+            entry['name'] = name
+            entry['version'] = version
+        entries.append(entry)
+    return entries
+
+
+# normalize_package_data from the baseline release, unchanged apart from the reread_raw_name switch
+# (off by default, so the timing is the baseline's). It reads `raw_name` left over
+# from the grouping loop, i.e. the name of the last feed entry, instead of each entry's own name, so
+# display names and "name#version" versions can come from an unrelated package. reread_raw_name=True
+# applies only that fix, which is the behaviour normalize_package_data now has.
+def baseline_normalize_package_data(raw_packages, reread_raw_name=False):
+    packages_grouped = defaultdict(list)
+    for entry in raw_packages:
+        if not isinstance(entry, dict):
+            continue
+        raw_name = entry.get('name') or entry.get('title') or ''
+        name_part = raw_name.split('#', 1)[0].strip().lower()
+        if name_part:
+            packages_grouped[name_part].append(entry)
+    normalized_list = []
+    for name_key, entries in packages_grouped.items():
+        latest_absolute_data = None
+        latest_official_data = None
+        latest_absolute_ver = safe_parse_version("0.0.0a0")
+        latest_official_ver = safe_parse_version("0.0.0a0")
+        all_versions = []
+        package_name_display = name_key
+        processed_versions = set()
+        for package_entry in entries:
+            for version_info in package_entry.get('versions', []):
+                if isinstance(version_info, dict) and 'version' in version_info:
+                    version_str = version_info.get('version', '')
+                    if version_str and version_str not in processed_versions:
+                        all_versions.append(version_info)
+                        processed_versions.add(version_str)
+        processed_entries = []
+        for package_entry in entries:
+            if reread_raw_name:
+                raw_name = package_entry.get('name') or package_entry.get('title') or ''
+            version_str = package_entry.get('version') or (raw_name.split('#')[1] if '#' in raw_name else '')
+            if not version_str:
+                continue
+            current_display_name = raw_name.split('#')[0].strip()
+            if current_display_name and current_display_name != name_key:
+                package_name_display = current_display_name
+            entry_with_version = package_entry.copy()
+            entry_with_version['version'] = version_str
+            processed_entries.append(entry_with_version)
+            try:
+                current_ver = safe_parse_version(version_str)
+                if latest_absolute_data is None or current_ver > latest_absolute_ver:
+                    latest_absolute_ver = current_ver
+                    latest_absolute_data = entry_with_version
+                if re.match(r'^\d+\.\d+\.\d+(?:-[a-zA-Z0-9\.]+)?$', version_str):
+                    if latest_official_data is None or current_ver > latest_official_ver:
+                        latest_official_ver = current_ver
+                        latest_official_data = entry_with_version
+            except Exception as e:
+                logger.error(f"Error comparing version '{version_str}': {e}")
+        if latest_absolute_data:
+            final_absolute_version = latest_absolute_data.get('version', 'unknown')
+            final_official_version = latest_official_data.get('version') if latest_official_data else None
+            author = str(latest_absolute_data.get('author') or '')
+            fhir_version = latest_absolute_data.get('fhirVersion') or 'unknown'
+            url = str(latest_absolute_data.get('url') or '')
+            canonical = str(latest_absolute_data.get('canonical') or url)
+            dependencies = []
+            dependencies_raw = latest_absolute_data.get('dependencies', [])
+            if isinstance(dependencies_raw, dict):
+                dependencies = [{"name": str(dn), "version": str(dv)} for dn, dv in dependencies_raw.items()]
+            elif isinstance(dependencies_raw, list):
+                for dep in dependencies_raw:
+                    if isinstance(dep, str) and '@' in dep:
+                        dep_name, dep_version = dep.split('@', 1)
+                        dependencies.append({"name": dep_name, "version": dep_version})
+                    elif isinstance(dep, dict) and 'name' in dep:
+                        dependencies.append(dep)
+            all_versions.sort(key=lambda x: x.get('pubDate', ''), reverse=True)
+            normalized_entry = {
+                'name': package_name_display,
+                'version': final_absolute_version,
+                'latest_absolute_version': final_absolute_version,
+                'latest_official_version': final_official_version,
+                'author': author.strip(),
+                'fhir_version': fhir_version.strip(),
+                'url': url.strip(),
+                'canonical': canonical.strip(),
+                'dependencies': dependencies,
+                'version_count': len(all_versions),
+                'all_versions': all_versions,
+                'versions_data': processed_entries,
+                'registry': latest_absolute_data.get('registry', '')
+            }
+            normalized_list.append(normalized_entry)
+    normalized_list.sort(key=lambda x: x.get('name', '').lower())
+    return normalized_list
+
+
+def timed(label, count, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {count:>7} entries  {elapsed:8.3f}s  {count / elapsed:10.0f} entries/s")
+    return result
+
+
+def comparable(packages):
+    # versions_data is no longer part of the catalog (it is loaded per package on demand) and
+    # display_version was added after the baseline.
+    return [
+        dict({key: value for key, value in pkg.items() if key != 'versions_data'},
+             display_version=pkg['latest_official_version'] or pkg['latest_absolute_version'] or 'N/A')
+        for pkg in packages
+    ]
+
+
+def run(count):
+    # Unparseable versions log a warning per parse; keep the output readable.
+    logging.getLogger('services').setLevel(logging.ERROR)
+    feed = synthetic_feed(count)
+    baseline = timed('baseline', count, baseline_normalize_package_data, feed)
+    expected = comparable(baseline_normalize_package_data(feed, reread_raw_name=True))
+    services._version_key.cache_clear()
+    actual = timed('single pass (cold memo)', count, normalize_package_data, feed)
+    assert actual == expected, "normalize_package_data output differs from the baseline with raw_name re-read"
+    actual = timed('single pass (warm memo)', count, normalize_package_data, feed)
+    assert actual == expected
+    changed = sum(1 for old, new in zip(comparable(baseline), actual) if old != new) + abs(len(baseline) - len(actual))
+    print(f"{len(expected)} packages, version key memo: {services._version_key.cache_info()}")
+    print(f"{changed} packages differ from the baseline output only because of its stale raw_name")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=100000)
+    run(parser.parse_args().entries)
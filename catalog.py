@@ -0,0 +1,214 @@
+import itertools
+import sys
+import threading
+import logging
+from array import array
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_catalog_versions = itertools.count(1)
+
+GRAM_SIZE = 3
+TIER_EXACT, TIER_PREFIX, TIER_SUBSTRING, TIER_OTHER_FIELD = range(4)
+
+CATALOG_FIELDS = (
+    'name', 'version', 'latest_absolute_version', 'latest_official_version', 'author', 'fhir_version',
+    'url', 'canonical', 'dependencies', 'version_count', 'all_versions', 'registry', 'display_version'
+)
+# Low-cardinality values shared by thousands of packages
+INTERNED_FIELDS = frozenset(('author', 'fhir_version', 'registry'))
+
+def _strip_scheme(value):
+    for prefix in ('https://', 'http://'):
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+            break
+    return value[4:] if value.startswith('www.') else value
+
+def _grams(text, size=GRAM_SIZE):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def sort_versions(all_versions, version_key=None):
+    versions = [v['version'] for v in all_versions if isinstance(v, dict) and v.get('version')]
+    if version_key is not None:
+        versions.sort(key=version_key, reverse=True)
+    return tuple(versions)
+
+class CatalogRecord:
+    __slots__ = CATALOG_FIELDS
+
+    def __init__(self, **values):
+        for field in CATALOG_FIELDS:
+            value = values.get(field)
+            if field in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, field, value)
+
+    @classmethod
+    def from_dict(cls, pkg):
+        return cls(**{field: pkg.get(field) for field in CATALOG_FIELDS})
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in CATALOG_FIELDS else default
+
+    def __getitem__(self, key):
+        if key not in CATALOG_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in CATALOG_FIELDS
+
+    def keys(self):
+        return CATALOG_FIELDS
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in CATALOG_FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, CatalogRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"CatalogRecord(name={self.name!r}, version={self.version!r})"
+
+def search_fields(pkg):
+    return (
+        (pkg.get('name') or '').lower(),
+        (pkg.get('author') or '').lower(),
+        _strip_scheme((pkg.get('canonical') or '').lower())
+    )
+
+def build_postings(fields):
+    postings = {}
+    for position, (name, author, canonical) in enumerate(fields):
+        for gram in _grams(name) | _grams(author) | _grams(canonical):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array('I')
+            posting.append(position)
+    return postings
+
+class PackageSearchIndex:
+    def __init__(self, fields, cache_size=512, postings=None):
+        self.size = len(fields)
+        self._fields = fields
+        self._postings = build_postings(fields) if postings is None else postings
+        self._results = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    def _candidates(self, term):
+        for previous in (term[:-1], term[1:]):
+            if previous and len(previous) >= GRAM_SIZE:
+                with self._lock:
+                    cached = self._results.get(previous)
+                if cached is not None:
+                    return sorted(cached)
+        if len(term) < GRAM_SIZE:
+            return range(self.size)
+        lists = []
+        for gram in _grams(term):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            if len(candidates) * 8 < len(posting):
+                break
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return sorted(candidates)
+
+    def search(self, term):
+        term = (term or '').strip().lower()
+        if not term:
+            return None
+        with self._lock:
+            cached = self._results.get(term)
+        if cached is not None:
+            return cached
+        tiers = ([], [], [], [])
+        fields = self._fields
+        for position in self._candidates(term):
+            name, author, canonical = fields[position]
+            if term in name:
+                if name == term:
+                    tiers[TIER_EXACT].append(position)
+                elif name.startswith(term):
+                    tiers[TIER_PREFIX].append(position)
+                else:
+                    tiers[TIER_SUBSTRING].append(position)
+            elif term in author or term in canonical:
+                tiers[TIER_OTHER_FIELD].append(position)
+        ranked = array('I', itertools.chain(*tiers))
+        with self._lock:
+            self._results[term] = ranked
+        return ranked
+
+class CatalogSnapshot:
+    def __init__(self, packages, timestamp=None, version_key=None, version=None):
+        self.version = next(_catalog_versions) if version is None else version
+        self.timestamp = timestamp
+        if hasattr(packages, 'find'):
+            self.packages = packages
+            self._find = packages.find
+            self._search_fields = packages.search_fields
+            self._postings = getattr(packages, 'postings', None)
+        else:
+            self.packages = tuple(CatalogRecord.from_dict(pkg) for pkg in packages or ())
+            positions = {}
+            for position, pkg in enumerate(self.packages):
+                positions.setdefault((pkg.get('name') or '').lower(), position)
+            self._find = positions.get
+            self._search_fields = None
+            self._postings = None
+        self._version_key = version_key
+        self._sorted_versions = {}
+        self._search_index = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.packages)
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            with self._lock:
+                if self._search_index is None:
+                    fields = self._search_fields
+                    if fields is None:
+                        fields = [search_fields(pkg) for pkg in self.packages]
+                    self._search_index = PackageSearchIndex(fields, postings=self._postings)
+                    logger.debug(f"Built search index for catalog v{self.version} ({len(self.packages)} packages)")
+        return self._search_index
+
+    def get(self, name):
+        position = self._find((name or '').lower())
+        return None if position is None else self.packages[position]
+
+    def sorted_versions(self, name):
+        key = (name or '').lower()
+        versions = self._sorted_versions.get(key)
+        if versions is None:
+            pkg = self.get(key)
+            if pkg is None:
+                return None
+            versions = sort_versions(pkg.get('all_versions') or [], self._version_key)
+            self._sorted_versions[key] = versions
+        return versions
+
+    def page(self, page, per_page):
+        start = max(page - 1, 0) * per_page
+        return self.packages[start:start + per_page]
+
+    def search_page(self, term, page, per_page):
+        positions = self.search_index.search(term)
+        if positions is None:
+            return self.page(page, per_page), len(self.packages)
+        start = max(page - 1, 0) * per_page
+        return [self.packages[position] for position in positions[start:start + per_page]], len(positions)
@@ -0,0 +1,376 @@
+import datetime
+import fcntl
+import gzip
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from collections.abc import Sequence
+from contextlib import contextmanager
+from catalog import CatalogRecord, build_postings, search_fields
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FHCATv3\n'
+HEADER = struct.Struct('=8sQII')
+GENERATION = struct.Struct('=Q')
+FIELD_SEPARATOR = '\0'
+NONE = 0xFFFFFFFF
+STRING_COLUMNS = (
+    'name', 'version', 'latest_absolute_version', 'latest_official_version', 'author', 'fhir_version',
+    'url', 'canonical', 'registry', 'display_version', 'dependencies'
+)
+COLUMNS = STRING_COLUMNS + ('version_count', 'versions_start', 'versions_end')
+SECTIONS = (
+    ('columns', 'I'), ('version_pairs', 'I'), ('name_order', 'I'), ('postings', 'I'),
+    ('string_offsets', 'Q'), ('field_offsets', 'Q'), ('gram_offsets', 'Q'), ('posting_offsets', 'Q'),
+    ('string_data', None), ('field_data', None), ('gram_data', None)
+)
+COPY_BUFFER_SIZE = 1024 * 1024
+
+class CatalogStoreError(Exception):
+    pass
+
+def _align(pos, size=8):
+    return (pos + size - 1) // size * size
+
+def _padding(pos, size=8):
+    return b'\0' * (_align(pos, size) - pos)
+
+class _StringTable:
+    def __init__(self):
+        self.positions = {}
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    def add(self, value):
+        if value is None:
+            return NONE
+        if not isinstance(value, str):
+            value = str(value)
+        position = self.positions.get(value)
+        if position is None:
+            position = self.positions[value] = len(self.offsets) - 1
+            self.data += value.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return position
+
+def encode_snapshot(packages, generation, timestamp=None):
+    # Columnar layout: every string (names, authors, versions, dependency lists) is stored once in a
+    # shared table and packages refer to it by index; versions live in one (version, pubDate) array.
+    strings = _StringTable()
+    columns = [array('I') for _ in COLUMNS]
+    version_pairs = array('I')
+    fields = bytearray()
+    field_offsets = array('Q', [0])
+    all_fields = []
+    for pkg in packages:
+        values = [pkg.get(column) for column in STRING_COLUMNS[:-1]]
+        values.append(json.dumps(pkg.get('dependencies') or [], separators=(',', ':'), default=str))
+        for column, value in zip(columns, values):
+            column.append(strings.add(value))
+        columns[-3].append(int(pkg.get('version_count') or 0))
+        columns[-2].append(len(version_pairs) // 2)
+        for version_info in pkg.get('all_versions') or ():
+            if isinstance(version_info, dict) and version_info.get('version') is not None:
+                version_pairs.append(strings.add(version_info['version']))
+                version_pairs.append(strings.add(version_info.get('pubDate')))
+        columns[-1].append(len(version_pairs) // 2)
+        pkg_fields = tuple(value.replace(FIELD_SEPARATOR, ' ') for value in search_fields(pkg))
+        fields += FIELD_SEPARATOR.join(pkg_fields).encode('utf-8')
+        field_offsets.append(len(fields))
+        all_fields.append(pkg_fields)
+    cells = array('I')
+    for column in columns:
+        cells.extend(column)
+    # Search postings are precomputed so workers never rebuild the n-gram index; grams are kept in
+    # UTF-8 byte order so a lookup is a binary search over the mapped bytes.
+    postings = build_postings(all_fields)
+    gram_data = bytearray()
+    gram_offsets = array('Q', [0])
+    posting_data = array('I')
+    posting_offsets = array('Q', [0])
+    for encoded, gram in sorted((gram.encode('utf-8'), gram) for gram in postings):
+        gram_data += encoded
+        gram_offsets.append(len(gram_data))
+        posting_data.extend(postings[gram])
+        posting_offsets.append(len(posting_data))
+    blocks = {
+        'columns': cells.tobytes(),
+        'version_pairs': version_pairs.tobytes(),
+        'name_order': array('I', sorted(range(len(all_fields)), key=lambda position: all_fields[position][0])).tobytes(),
+        'postings': posting_data.tobytes(),
+        'string_offsets': strings.offsets.tobytes(),
+        'field_offsets': field_offsets.tobytes(),
+        'gram_offsets': gram_offsets.tobytes(),
+        'posting_offsets': posting_offsets.tobytes(),
+        'string_data': bytes(strings.data),
+        'field_data': bytes(fields),
+        'gram_data': bytes(gram_data)
+    }
+    sections = {}
+    body = []
+    pos = 0
+    for name, _ in SECTIONS:
+        sections[name] = [pos, len(blocks[name])]
+        body.append(blocks[name])
+        pos += len(blocks[name])
+        body.append(_padding(pos))
+        pos = _align(pos)
+    meta = json.dumps({
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'sections': sections
+    }).encode('utf-8')
+    header = HEADER.pack(MAGIC, generation, len(all_fields), len(meta)) + meta
+    return b''.join([header, _padding(len(header))] + body)
+
+class MappedSearchFields(Sequence):
+    def __init__(self, packages):
+        self._packages = packages
+
+    def __len__(self):
+        return len(self._packages)
+
+    def __getitem__(self, position):
+        return self._packages.fields_at(position)
+
+class MappedPostings:
+    def __init__(self, packages):
+        self._packages = packages
+
+    def get(self, gram, default=None):
+        packages = self._packages
+        key = gram.encode('utf-8')
+        low, high = 0, len(packages._gram_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if packages._gram_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(packages._gram_offsets) - 1 and packages._gram_at(low) == key:
+            return packages._postings[packages._posting_offsets[low]:packages._posting_offsets[low + 1]]
+        return default
+
+class MappedPackages(Sequence):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise CatalogStoreError(f"Catalog snapshot {path} is truncated")
+        magic, self.generation, count, meta_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise CatalogStoreError(f"Catalog snapshot {path} has an unknown format")
+        meta = json.loads(self._map[HEADER.size:HEADER.size + meta_length])
+        self.timestamp = datetime.datetime.fromisoformat(meta['timestamp']) if meta.get('timestamp') else None
+        view = memoryview(self._map)
+        data_start = _align(HEADER.size + meta_length)
+        self._sections = {}
+        for name, typecode in SECTIONS:
+            offset, length = meta['sections'][name]
+            start = data_start + offset
+            if typecode is None:
+                self._sections[name] = start
+            else:
+                self._sections[name] = view[start:start + length].cast(typecode)
+        cells = self._sections['columns']
+        self._columns = [cells[i * count:(i + 1) * count] for i in range(len(COLUMNS))]
+        self._version_pairs = self._sections['version_pairs']
+        self._name_order = self._sections['name_order']
+        self._string_offsets = self._sections['string_offsets']
+        self._field_offsets = self._sections['field_offsets']
+        self._strings_start = self._sections['string_data']
+        self._fields_start = self._sections['field_data']
+        self._postings = self._sections['postings']
+        self._gram_offsets = self._sections['gram_offsets']
+        self._posting_offsets = self._sections['posting_offsets']
+        self._grams_start = self._sections['gram_data']
+        self._count = count
+        self.search_fields = MappedSearchFields(self)
+        self.postings = MappedPostings(self)
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, position):
+        if position == NONE:
+            return None
+        start = self._strings_start + self._string_offsets[position]
+        end = self._strings_start + self._string_offsets[position + 1]
+        return self._map[start:end].decode('utf-8')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        row = [column[index] for column in self._columns]
+        values = {column: self._string(row[i]) for i, column in enumerate(STRING_COLUMNS)}
+        values['dependencies'] = json.loads(values['dependencies'] or '[]')
+        values['version_count'] = row[-3]
+        pairs = self._version_pairs
+        all_versions = []
+        for i in range(row[-2], row[-1]):
+            # Version numbers and dates repeat across packages; share one string per value.
+            version_info = {'version': sys.intern(self._string(pairs[2 * i]))}
+            if pairs[2 * i + 1] != NONE:
+                version_info['pubDate'] = sys.intern(self._string(pairs[2 * i + 1]))
+            all_versions.append(version_info)
+        values['all_versions'] = all_versions
+        return CatalogRecord(**values)
+
+    def _gram_at(self, position):
+        return self._map[self._grams_start + self._gram_offsets[position]:self._grams_start + self._gram_offsets[position + 1]]
+
+    def fields_at(self, position):
+        start = self._fields_start + self._field_offsets[position]
+        end = self._fields_start + self._field_offsets[position + 1]
+        return tuple(self._map[start:end].decode('utf-8').split(FIELD_SEPARATOR))
+
+    def find(self, name):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.fields_at(self._name_order[middle])[0] < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self.fields_at(self._name_order[low])[0] == name:
+            return self._name_order[low]
+        return None
+
+class CatalogStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, 'catalog.bin')
+        self.generation_path = os.path.join(directory, 'catalog.generation')
+        self.lock_path = os.path.join(directory, 'catalog.lock')
+        self._generation_map = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _map_generation(self):
+        if self._generation_map is None:
+            with self._lock:
+                if self._generation_map is None:
+                    if not os.path.exists(self.generation_path):
+                        with self._exclusive():
+                            if not os.path.exists(self.generation_path):
+                                self._write_generation(0)
+                    with open(self.generation_path, 'rb') as f:
+                        self._generation_map = mmap.mmap(f.fileno(), GENERATION.size, access=mmap.ACCESS_READ)
+        return self._generation_map
+
+    def _write_generation(self, generation):
+        fd = os.open(self.generation_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, GENERATION.pack(generation), 0)
+        finally:
+            os.close(fd)
+
+    def generation(self):
+        return GENERATION.unpack_from(self._map_generation(), 0)[0]
+
+    def load(self):
+        if self.generation() == 0:
+            return None
+        try:
+            return MappedPackages(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        except CatalogStoreError as e:
+            # e.g. a snapshot written by an older release; it is rebuilt on the next publish.
+            logger.warning(f"Ignoring catalog snapshot: {e}")
+            return None
+
+    def _install(self, write):
+        generation = self.generation() + 1
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.catalog.', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f, generation)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._write_generation(generation)
+        return generation, size
+
+    def publish(self, packages, timestamp=None):
+        self._map_generation()
+        with self._exclusive():
+            generation, size = self._install(lambda f, generation: f.write(encode_snapshot(packages, generation, timestamp)))
+        logger.info(f"Published catalog snapshot generation {generation} ({size} bytes)")
+        return generation
+
+    def export_snapshot(self, path, compresslevel=6):
+        packages = self.load()
+        if packages is None:
+            raise CatalogStoreError("No catalog snapshot has been published")
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-export.', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compresslevel, mtime=0) as f:
+                f.write(packages._map)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"Exported catalog generation {packages.generation} ({len(packages)} packages) to {path}")
+        return packages
+
+    def import_snapshot(self, path, if_missing=False):
+        self._map_generation()
+
+        def write(f, generation):
+            try:
+                with gzip.open(path, 'rb') as src:
+                    header = src.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        raise CatalogStoreError(f"Catalog export {path} is truncated")
+                    magic, _, count, meta_length = HEADER.unpack(header)
+                    if magic != MAGIC:
+                        raise CatalogStoreError(f"Catalog export {path} has an unsupported format {magic!r}")
+                    meta = src.read(meta_length)
+                    sections = json.loads(meta).get('sections') or {}
+                    if any(name not in sections for name, _ in SECTIONS):
+                        raise CatalogStoreError(f"Catalog export {path} is missing sections")
+                    # The imported snapshot takes the next local generation so every worker picks it up.
+                    f.write(HEADER.pack(MAGIC, generation, count, meta_length))
+                    f.write(meta)
+                    shutil.copyfileobj(src, f, COPY_BUFFER_SIZE)
+            except (OSError, EOFError, ValueError) as e:
+                raise CatalogStoreError(f"Could not read catalog export {path}: {e}")
+            expected = _align(HEADER.size + meta_length) + max(offset + length for offset, length in sections.values())
+            if f.tell() < expected:
+                raise CatalogStoreError(f"Catalog export {path} is truncated")
+
+        with self._exclusive():
+            if if_missing and self.load() is not None:
+                return None
+            generation, size = self._install(write)
+        logger.info(f"Imported catalog export {path} as generation {generation} ({size} bytes)")
+        return generation
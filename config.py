@@ -5,7 +5,53 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///instance/app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     FHIR_PACKAGES_DIR = os.environ.get('FHIR_PACKAGES_DIR', '/app/instance/fhir_packages')
+    CATALOG_SNAPSHOT_DIR = os.environ.get('CATALOG_SNAPSHOT_DIR', '/app/instance/catalog')
+    CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATALOG_REFRESH_INTERVAL', 6 * 60 * 60))
+    CATALOG_REFRESH_JITTER = float(os.environ.get('CATALOG_REFRESH_JITTER', 0.1))
+    CATALOG_PRELOAD_PATH = os.environ.get('CATALOG_PRELOAD_PATH', '')
+    JOB_LOG_SPOOL_DIR = os.environ.get('JOB_LOG_SPOOL_DIR', '/app/instance/job_logs')
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', '/app/static/uploads')
     TEST_DATA_FOLDER = os.environ.get('TEST_DATA_FOLDER', '/app/test_data')
+    # Kept outside static/ so uploaded resources are only served through the API.
+    TEST_DATA_UPLOAD_FOLDER = os.environ.get('TEST_DATA_UPLOAD_FOLDER', '/app/instance/test_data_uploads')
     APP_BASE_URL = os.environ.get('APP_BASE_URL', 'http://localhost:5000')
     API_KEY = os.environ.get('API_KEY', 'your-fallback-api-key')
+    FHIR_REGISTRY_BASE_URL = os.environ.get('FHIR_REGISTRY_BASE_URL', 'https://packages.fhir.org')
+    REGISTRY_MIRROR_ENABLED = os.environ.get('REGISTRY_MIRROR_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    REGISTRY_MIRROR_PREFIX = os.environ.get('REGISTRY_MIRROR_PREFIX', '/registry')
+    REGISTRY_MIRROR_UPSTREAM = os.environ.get('REGISTRY_MIRROR_UPSTREAM', 'https://packages.fhir.org')
+    REGISTRY_MIRROR_PULL_THROUGH = os.environ.get('REGISTRY_MIRROR_PULL_THROUGH', 'true').lower() in ('1', 'true', 'yes')
+    REGISTRY_MIRROR_METADATA_TTL = int(os.environ.get('REGISTRY_MIRROR_METADATA_TTL', 300))
+    REGISTRY_MIRROR_MAX_AGE = int(os.environ.get('REGISTRY_MIRROR_MAX_AGE', 365 * 24 * 60 * 60))
+    FEED_FETCH_WORKERS = int(os.environ.get('FEED_FETCH_WORKERS', 8))
+    FEED_FETCH_RETRIES = int(os.environ.get('FEED_FETCH_RETRIES', 2))
+    FEED_FETCH_BACKOFF = float(os.environ.get('FEED_FETCH_BACKOFF', 0.5))
+    FEED_CONNECT_TIMEOUT = float(os.environ.get('FEED_CONNECT_TIMEOUT', 5))
+    FEED_READ_TIMEOUT = float(os.environ.get('FEED_READ_TIMEOUT', 30))
+    FEED_FETCH_DEADLINE = float(os.environ.get('FEED_FETCH_DEADLINE', 60))
+    FEED_MAX_BYTES = int(os.environ.get('FEED_MAX_BYTES', 256 * 1024 * 1024))
+    FEED_MAX_ENTRY_BYTES = int(os.environ.get('FEED_MAX_ENTRY_BYTES', 1024 * 1024))
+    FEED_MAX_PACKAGES = int(os.environ.get('FEED_MAX_PACKAGES', 500000))
+    FEED_MAX_RETAINED_ENTRIES = int(os.environ.get('FEED_MAX_RETAINED_ENTRIES', 1000000))
+    FEED_READ_CHUNK_SIZE = int(os.environ.get('FEED_READ_CHUNK_SIZE', 64 * 1024))
+    CACHE_UPSERT_BATCH_SIZE = int(os.environ.get('CACHE_UPSERT_BATCH_SIZE', 500))
+    PACKAGE_DETAILS_CACHE_SIZE = int(os.environ.get('PACKAGE_DETAILS_CACHE_SIZE', 512))
+    IMPORT_MAX_WORKERS = int(os.environ.get('IMPORT_MAX_WORKERS', 4))
+    IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS', 2))
+    IMPORT_JOB_STALE_SECONDS = int(os.environ.get('IMPORT_JOB_STALE_SECONDS', 900))
+    DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+    PACKAGE_STORE_ENABLED = os.environ.get('PACKAGE_STORE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PACKAGE_STORE_MMAP_THRESHOLD = int(os.environ.get('PACKAGE_STORE_MMAP_THRESHOLD', 1024 * 1024))
+    TREE_SHAKE_REMOVE_DEPENDENCIES = os.environ.get('TREE_SHAKE_REMOVE_DEPENDENCIES', 'false').lower() in ('1', 'true', 'yes')
+    # Size of the analysis process pool each gunicorn worker shares between its imports.
+    IG_PROCESS_WORKERS = int(os.environ.get('IG_PROCESS_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    IG_PROCESS_CHUNK_BYTES = int(os.environ.get('IG_PROCESS_CHUNK_BYTES', 4 * 1024 * 1024))
+    IG_PROCESS_ON_IMPORT = os.environ.get('IG_PROCESS_ON_IMPORT', 'true').lower() in ('1', 'true', 'yes')
+    TEST_DATA_SCAN_WORKERS = int(os.environ.get('TEST_DATA_SCAN_WORKERS', 8))
+    TEST_DATA_BATCH_SIZE = int(os.environ.get('TEST_DATA_BATCH_SIZE', 1000))
+    JOB_LOG_BUFFER_SIZE = int(os.environ.get('JOB_LOG_BUFFER_SIZE', 1000))
+    JOB_LOG_RETENTION = int(os.environ.get('JOB_LOG_RETENTION', 3600))
+    SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+    SSE_MAX_STREAM_SECONDS = float(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))
+    # Every open log stream holds a gthread request thread, so cap them below the thread count.
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
@@ -0,0 +1,156 @@
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMPLIES_WITH_EXTENSION = 'http://hl7.org/fhir/StructureDefinition/structuredefinition-compliesWithProfile'
+IMPOSE_PROFILE_EXTENSION = 'http://hl7.org/fhir/StructureDefinition/structuredefinition-imposeProfile'
+EXPECTATION_EXTENSION = 'http://hl7.org/fhir/StructureDefinition/capabilitystatement-expectation'
+CONFORMANCE_TYPES = frozenset((
+    'StructureDefinition', 'SearchParameter', 'CapabilityStatement', 'ImplementationGuide', 'ValueSet',
+    'CodeSystem', 'ConceptMap', 'NamingSystem', 'OperationDefinition', 'CompartmentDefinition',
+    'StructureMap', 'GraphDefinition', 'MessageDefinition', 'TerminologyCapabilities'
+))
+EXPECTATION_RANK = {'SHALL': 3, 'SHOULD': 2, 'MAY': 1, 'SHOULD-NOT': 0}
+SKIPPED_DIRECTORIES = ('package/openapi/', 'package/other/')
+
+def is_analysis_member(name):
+    if not name.startswith('package/') or not name.endswith('.json') or name.startswith(SKIPPED_DIRECTORIES):
+        return False
+    base_name = os.path.basename(name)
+    return not base_name.startswith('.') and base_name != 'package.json'
+
+def _extension_values(element, url):
+    return [ext.get('valueCanonical') or ext.get('valueUri') for ext in element.get('extension', []) or []
+            if isinstance(ext, dict) and ext.get('url') == url and (ext.get('valueCanonical') or ext.get('valueUri'))]
+
+def _analyze_structure_definition(resource):
+    elements = (resource.get('snapshot') or {}).get('element') or (resource.get('differential') or {}).get('element') or []
+    must_support = []
+    optional_usage = []
+    for element in elements:
+        if not isinstance(element, dict) or not element.get('mustSupport'):
+            continue
+        path = element.get('id') or element.get('path')
+        if not path:
+            continue
+        must_support.append(path)
+        if element.get('min', 0) == 0:
+            optional_usage.append(path)
+    return {
+        'name': resource.get('name') or resource.get('id'),
+        'type': resource.get('type'),
+        'url': resource.get('url'),
+        'is_profile': resource.get('derivation') == 'constraint',
+        'must_support': must_support,
+        'optional_usage': optional_usage,
+        'complies_with': _extension_values(resource, COMPLIES_WITH_EXTENSION),
+        'imposed': _extension_values(resource, IMPOSE_PROFILE_EXTENSION)
+    }
+
+def _analyze_capability_statement(resource):
+    expectations = []
+    for rest in resource.get('rest', []) or []:
+        for rest_resource in rest.get('resource', []) or []:
+            resource_type = rest_resource.get('type')
+            for search_param in rest_resource.get('searchParam', []) or []:
+                expectation = next((ext.get('valueCode') for ext in search_param.get('extension', []) or []
+                                    if isinstance(ext, dict) and ext.get('url') == EXPECTATION_EXTENSION), None)
+                expectations.append({
+                    'resource_type': resource_type,
+                    'name': search_param.get('name'),
+                    'definition': search_param.get('definition'),
+                    'expectation': expectation or 'MAY'
+                })
+    return expectations
+
+def _analyze_implementation_guide(resource):
+    examples = []
+    for entry in (resource.get('definition') or {}).get('resource', []) or []:
+        reference = (entry.get('reference') or {}).get('reference')
+        if reference and (entry.get('exampleCanonical') or entry.get('exampleBoolean')):
+            examples.append({'reference': reference, 'profile': entry.get('exampleCanonical')})
+    return examples
+
+def analyze_chunk(members):
+    partial = {'profiles': [], 'examples': [], 'search_params': [], 'expectations': [], 'ig_examples': [], 'errors': 0}
+    for name, data in members:
+        try:
+            resource = json.loads(data)
+        except ValueError:
+            partial['errors'] += 1
+            continue
+        if not isinstance(resource, dict):
+            continue
+        resource_type = resource.get('resourceType')
+        if resource_type == 'StructureDefinition':
+            partial['profiles'].append(_analyze_structure_definition(resource))
+        elif resource_type == 'SearchParameter':
+            partial['search_params'].append({'url': resource.get('url'), 'code': resource.get('code'), 'base': resource.get('base') or []})
+        elif resource_type == 'CapabilityStatement':
+            partial['expectations'].extend(_analyze_capability_statement(resource))
+        elif resource_type == 'ImplementationGuide':
+            partial['ig_examples'].extend(_analyze_implementation_guide(resource))
+        elif resource_type and resource_type not in CONFORMANCE_TYPES:
+            meta_profiles = (resource.get('meta') or {}).get('profile') or []
+            partial['examples'].append({
+                'member': name, 'type': resource_type, 'id': resource.get('id'),
+                'profiles': [p.split('|', 1)[0] for p in meta_profiles if isinstance(p, str)]
+            })
+    return partial
+
+def merge_analysis(partials):
+    profiles = sorted((p for partial in partials for p in partial['profiles']), key=lambda p: (p['name'] or '', p['url'] or ''))
+    examples = sorted((e for partial in partials for e in partial['examples']), key=lambda e: e['member'])
+    profile_names = {p['url']: p['name'] for p in profiles if p['url'] and p['name']}
+    search_param_codes = {sp['url']: sp['code'] for partial in partials for sp in partial['search_params'] if sp['url']}
+
+    example_map = {}
+    examples_by_reference = {f"{e['type']}/{e['id']}": e for e in examples if e['id']}
+    for example in examples:
+        targets = [profile_names[url] for url in example['profiles'] if url in profile_names] or [example['type']]
+        for target in targets:
+            example_map.setdefault(target, []).append(example['member'])
+    for ig_example in (e for partial in partials for e in partial['ig_examples']):
+        example = examples_by_reference.get(ig_example['reference'])
+        target = profile_names.get((ig_example['profile'] or '').split('|', 1)[0])
+        if example and target and example['member'] not in example_map.get(target, []):
+            example_map.setdefault(target, []).append(example['member'])
+
+    resource_types_info = []
+    seen_types = set()
+    for profile in profiles:
+        resource_types_info.append({
+            'name': profile['name'], 'type': profile['type'], 'url': profile['url'], 'is_profile': profile['is_profile'],
+            'must_support': bool(profile['must_support']), 'optional_usage': bool(profile['optional_usage'])
+        })
+        seen_types.add(profile['type'])
+    for resource_type in sorted({e['type'] for e in examples} - seen_types):
+        resource_types_info.append({
+            'name': resource_type, 'type': resource_type, 'url': None, 'is_profile': False,
+            'must_support': False, 'optional_usage': False
+        })
+
+    search_param_conformance = {}
+    for expectation in (e for partial in partials for e in partial['expectations']):
+        code = expectation['name'] or search_param_codes.get(expectation['definition'])
+        if not expectation['resource_type'] or not code:
+            continue
+        type_conformance = search_param_conformance.setdefault(expectation['resource_type'], {})
+        current = type_conformance.get(code)
+        if current is None or EXPECTATION_RANK.get(expectation['expectation'], 0) > EXPECTATION_RANK.get(current, 0):
+            type_conformance[code] = expectation['expectation']
+
+    return {
+        'resource_types_info': resource_types_info,
+        'must_support_elements': {p['name']: p['must_support'] for p in profiles if p['must_support']},
+        'optional_usage_elements': {p['name']: p['optional_usage'] for p in profiles if p['optional_usage']},
+        'complies_with_profiles': {p['name']: p['complies_with'] for p in profiles if p['complies_with']},
+        'imposed_profiles': {p['name']: p['imposed'] for p in profiles if p['imposed']},
+        'examples': example_map,
+        'search_param_conformance': search_param_conformance,
+        'profile_count': len(profiles),
+        'example_count': len(examples),
+        'parse_errors': sum(partial['errors'] for partial in partials)
+    }
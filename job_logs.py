@@ -0,0 +1,175 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DONE = '[DONE]'
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+SPOOL_POLL_INTERVAL = 0.5
+SPOOL_PRUNE_INTERVAL = 60
+
+current_job = contextvars.ContextVar('current_log_job', default=None)
+
+class LogChannel:
+    def __init__(self, job_id, buffer_size=1000, spool_path=None):
+        self.job_id = job_id
+        self.events = deque(maxlen=buffer_size)
+        self.last_id = 0
+        self.closed = False
+        self.updated_at = time.monotonic()
+        self._condition = threading.Condition()
+        self._spool = open(spool_path, 'a', encoding='utf-8') if spool_path else None
+
+    def publish(self, message):
+        with self._condition:
+            if self.closed:
+                return None
+            self.last_id += 1
+            self.events.append((self.last_id, message))
+            self.updated_at = time.monotonic()
+            if self._spool is not None:
+                try:
+                    self._spool.write(json.dumps([self.last_id, message]) + '\n')
+                    self._spool.flush()
+                except OSError as e:
+                    logger.warning(f"Could not spool log for job {self.job_id}: {e}")
+            if message == DONE:
+                self.closed = True
+                if self._spool is not None:
+                    self._spool.close()
+                    self._spool = None
+            self._condition.notify_all()
+            return self.last_id
+
+    def read(self, after, timeout):
+        with self._condition:
+            if self.last_id <= after and not self.closed:
+                self._condition.wait(timeout)
+            return [event for event in self.events if event[0] > after], self.closed
+
+class LogBroker:
+    def __init__(self, spool_dir=None, buffer_size=1000, retention=3600, max_channels=256):
+        self.spool_dir = spool_dir
+        self.buffer_size = buffer_size
+        self.retention = retention
+        self.max_channels = max_channels
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_spool_prune = 0
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+
+    def _spool_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.log") if self.spool_dir else None
+
+    def open(self):
+        # Ids are always minted here, so a caller can never attach to (and later close) another job's channel.
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._channels[job_id] = LogChannel(job_id, self.buffer_size, self._spool_path(job_id))
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._channels.get(job_id)
+
+    def publish(self, job_id, message):
+        channel = self.get(job_id)
+        if channel is not None:
+            channel.publish(message)
+
+    def close(self, job_id):
+        self.publish(job_id, DONE)
+
+    @contextmanager
+    def job(self, job_id):
+        token = current_job.set(job_id)
+        try:
+            yield job_id
+        finally:
+            current_job.reset(token)
+            self.close(job_id)
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, channel in self._channels.items()
+                   if channel.closed and now - channel.updated_at > self.retention]
+        for job_id in expired:
+            del self._channels[job_id]
+        for job_id in [job_id for job_id, channel in self._channels.items() if channel.closed]:
+            if len(self._channels) < self.max_channels:
+                break
+            del self._channels[job_id]
+        if self.spool_dir and now - self._last_spool_prune > SPOOL_PRUNE_INTERVAL:
+            self._last_spool_prune = now
+            cutoff = time.time() - self.retention
+            try:
+                for entry in os.scandir(self.spool_dir):
+                    if entry.name.endswith('.log') and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"Could not prune job log spool: {e}")
+
+    def _read_spool(self, job_id, after, offset, timeout):
+        path = self._spool_path(job_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            events = []
+            closed = False
+            if path and os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith('\n'):
+                            break
+                        offset += len(line.encode('utf-8'))
+                        event_id, message = json.loads(line)
+                        closed = message == DONE
+                        if event_id > after:
+                            events.append((event_id, message))
+            if events or closed or time.monotonic() >= deadline:
+                return events, closed, offset
+            time.sleep(SPOOL_POLL_INTERVAL)
+
+    def exists(self, job_id):
+        path = self._spool_path(job_id)
+        return self.get(job_id) is not None or bool(path and os.path.exists(path))
+
+    def follow(self, job_id, after=0, heartbeat=15, max_duration=300):
+        deadline = time.monotonic() + max_duration
+        if not job_id or not JOB_ID_PATTERN.match(job_id):
+            yield (after + 1, f"ERROR: Unknown log channel {job_id}")
+            yield (after + 2, DONE)
+            return
+        spool_offset = 0
+        seen_channel = False
+        while time.monotonic() < deadline:
+            timeout = min(heartbeat, max(deadline - time.monotonic(), 0))
+            channel = self.get(job_id)
+            if channel is not None:
+                events, closed = channel.read(after, timeout)
+            else:
+                # The job may belong to another worker process; follow its spool file instead.
+                events, closed, spool_offset = self._read_spool(job_id, after, spool_offset, timeout)
+            seen_channel = seen_channel or bool(events) or self.exists(job_id)
+            if not seen_channel:
+                yield (after + 1, f"ERROR: Unknown log channel {job_id}")
+                yield (after + 2, DONE)
+                return
+            if not events and not closed:
+                yield None
+                continue
+            for event in events:
+                after = event[0]
+                yield event
+            if closed:
+                return
@@ -0,0 +1,203 @@
+import datetime
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from models import db, ImportJob
+from services import import_package_and_dependencies, job_heartbeat
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+DEPENDENCY_MODES = ('recursive', 'patch-canonical', 'tree-shaking')
+
+def import_job_key(name, version, dependency_mode):
+    return f"{name.lower()}#{version}#{dependency_mode}"
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _as_utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+def _json_safe(value):
+    return json.loads(json.dumps(value, default=str))
+
+def simplify_import_error(error_msg):
+    if "HTTP error" in error_msg and "404" in error_msg:
+        return "Package not found (404)."
+    if "HTTP error" in error_msg:
+        return f"Registry error: {error_msg.split(': ', 1)[-1]}"
+    if "Connection error" in error_msg:
+        return "Could not connect to registry."
+    return error_msg
+
+def summarize_import_result(result):
+    return _json_safe({
+        'requested': result['requested'],
+        'downloaded': [f"{name}#{version}" for name, version in result['downloaded']],
+        'dependencies': result['dependencies'],
+        'graph': result['graph'],
+        'tree_shaking': result['tree_shaking'],
+        'processing': result['processing']
+    })
+
+def import_job_to_dict(job):
+    return {
+        'id': job.id,
+        'package_name': job.package_name,
+        'version': job.version,
+        'dependency_mode': job.dependency_mode,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'errors': job.errors or [],
+        'result': job.result,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+class JobHeartbeat:
+    def __init__(self, engine, job_id, key):
+        self.engine = engine
+        self.job_id = job_id
+        self.key = key
+        self.interval = max(engine.stale_after / 4, 1)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        # Called from download threads and the analysis loop; writes at most once per interval.
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        with self.engine.app.app_context():
+            self.engine._update(self.job_id, self.key)
+
+class ImportJobEngine:
+    def __init__(self, app, log_broker, max_workers=2, stale_after=900):
+        self.app = app
+        self.log_broker = log_broker
+        self.stale_after = stale_after
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='import-job')
+        self._lock = threading.Lock()
+        self._queued = {}
+        self._queue_heartbeat = None
+
+    def _update(self, job_id, key, expected=('running',), **values):
+        # Writes only land while this worker still owns the job, so a job that was marked
+        # abandoned can never be overwritten by the thread that was running it.
+        table = ImportJob.__table__
+        values['updated_at'] = _now()
+        try:
+            # Job rows are written on their own connection so progress updates never
+            # commit work the import itself still has pending in db.session.
+            with db.engine.begin() as conn:
+                result = conn.execute(table.update().where(
+                    table.c.id == job_id, table.c.status.in_(expected), table.c.active_key == key).values(**values))
+            return result.rowcount > 0
+        except Exception as e:
+            logger.error(f"Could not update import job {job_id}: {e}", exc_info=True)
+            return False
+
+    def _touch_queued(self):
+        interval = max(self.stale_after / 4, 1)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                queued = dict(self._queued)
+            with self.app.app_context():
+                for job_id, key in queued.items():
+                    self._update(job_id, key, expected=('queued',))
+
+    def _find_active(self, key):
+        table = ImportJob.__table__
+        with db.engine.begin() as conn:
+            row = conn.execute(table.select().where(table.c.active_key == key)).first()
+            if row is None:
+                return None
+            if _now() - _as_utc(row.updated_at) < datetime.timedelta(seconds=self.stale_after):
+                return row.id
+            logger.warning(f"Import job {row.id} for {key} stopped reporting progress; marking it failed")
+            conn.execute(table.update().where(table.c.id == row.id).values(
+                status='failed', active_key=None, message="Job was abandoned by its worker.",
+                finished_at=_now(), updated_at=_now()))
+        return None
+
+    def submit(self, name, version, dependency_mode='recursive'):
+        key = import_job_key(name, version, dependency_mode)
+        with self._lock:
+            for _ in range(2):
+                existing = self._find_active(key)
+                if existing is not None:
+                    logger.info(f"Import of {name}#{version} ({dependency_mode}) joined running job {existing}")
+                    return existing, False
+                job_id = self.log_broker.open()
+                now = _now()
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(ImportJob.__table__.insert().values(
+                            id=job_id, package_name=name, version=version, dependency_mode=dependency_mode,
+                            dedupe_key=key, active_key=key, status='queued', progress={'done': 0, 'total': 1},
+                            created_at=now, updated_at=now))
+                except IntegrityError:
+                    # Another worker process claimed the same import first.
+                    self.log_broker.close(job_id)
+                    continue
+                self._queued[job_id] = key
+                if self._queue_heartbeat is None:
+                    self._queue_heartbeat = threading.Thread(target=self._touch_queued, name='import-job-heartbeat', daemon=True)
+                    self._queue_heartbeat.start()
+                self.executor.submit(self._run, job_id, key, name, version, dependency_mode)
+                return job_id, True
+        raise RuntimeError(f"Could not queue import of {name}#{version}")
+
+    def _run(self, job_id, key, name, version, dependency_mode):
+        with self.app.app_context(), self.log_broker.job(job_id):
+            with self._lock:
+                self._queued.pop(job_id, None)
+            if not self._update(job_id, key, expected=('queued',), status='running', started_at=_now()):
+                logger.warning(f"Import job {job_id} was marked abandoned before it started; skipping it")
+                return
+            values = {}
+            token = job_heartbeat.set(JobHeartbeat(self, job_id, key))
+            try:
+                result = import_package_and_dependencies(
+                    name, version, dependency_mode=dependency_mode,
+                    progress=lambda done, total: self._update(job_id, key, progress={'done': done, 'total': total}))
+                errors = result['errors']
+                if errors and not result['downloaded']:
+                    values.update(status='failed', message=simplify_import_error(errors[0]))
+                elif errors:
+                    values.update(status='partial', message=f"Imported {name}#{version} with errors.")
+                else:
+                    values.update(status='succeeded', message=f"Imported {name}#{version}.")
+                values.update(result=summarize_import_result(result), errors=errors)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Import job {job_id} failed: {e}", exc_info=True)
+                values.update(status='failed', message=str(e), errors=[str(e)])
+            finally:
+                job_heartbeat.reset(token)
+                db.session.remove()
+                finished = self._update(job_id, key, active_key=None, finished_at=_now(), **values)
+            if finished:
+                logger.info(f"Import job {job_id} finished: {values.get('status')}")
+            else:
+                logger.warning(f"Import job {job_id} no longer owns its row (marked abandoned?); result not recorded")
+
+    def get(self, job_id):
+        return db.session.get(ImportJob, job_id)
+
+    def recent(self, limit=50, status=None):
+        query = ImportJob.query
+        if status:
+            query = query.filter_by(status=status)
+        return query.order_by(ImportJob.created_at.desc()).limit(limit).all()
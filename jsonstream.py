@@ -0,0 +1,379 @@
+import json
+import re
+
+STRING_END = re.compile(rb'["\\]')
+BETWEEN_BRACKETS = re.compile(rb'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+MEMBER = re.compile(rb'("[^"\\]*(?:\\.[^"\\]*)*")\s*:\s*')
+FIRST_MEMBER = re.compile(rb'\s*("[^"\\]*(?:\\.[^"\\]*)*")\s*:\s*')
+NEXT_MEMBER = re.compile(rb'\s*,\s*("[^"\\]*(?:\\.[^"\\]*)*")\s*:\s*')
+RESOURCE_KEY = re.compile(rb'"resource"\s*:\s*')
+SCALAR_END = re.compile(rb'[\s,}\]]')
+NON_WHITESPACE = re.compile(rb'\S')
+NEWLINE = re.compile(rb'\n')
+QUOTE = ord('"')
+OPENERS = (ord('{'), ord('['))
+
+_decoder = json.JSONDecoder()
+
+class JsonStreamError(Exception):
+    pass
+
+class _FieldsFound(Exception):
+    pass
+
+class ByteWindow:
+    def __init__(self, f, chunk_size=64 * 1024, max_size=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.data = b''
+        self.offset = 0
+        self.eof = False
+        self._text = None
+        self._text_key = None
+
+    @property
+    def end(self):
+        return self.offset + len(self.data)
+
+    def extend(self, keep_from):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        kept = self.data[keep_from - self.offset:]
+        if self.max_size is not None and len(kept) > self.max_size:
+            raise JsonStreamError(f"Value at byte {keep_from} is larger than {self.max_size} bytes")
+        self.data = kept + chunk
+        self.offset = keep_from
+        return True
+
+    def search(self, pattern, pos, keep_from=None):
+        while True:
+            match = pattern.search(self.data, pos - self.offset)
+            if match:
+                return self.offset + match.start()
+            pos = max(pos, self.end)
+            if not self.extend(min(pos if keep_from is None else keep_from, self.end)):
+                return None
+
+    def match(self, pattern, pos):
+        while True:
+            match = pattern.match(self.data, pos - self.offset)
+            if match and match.end() < len(self.data):
+                return match, self.offset
+            if not self.extend(min(pos, self.end)):
+                return match, self.offset
+
+    def byte_at(self, pos):
+        index = pos - self.offset
+        if 0 <= index < len(self.data):
+            return self.data[index:index + 1]
+        while pos >= self.end:
+            if not self.extend(min(pos, self.end)):
+                return None
+        return self.data[pos - self.offset:pos - self.offset + 1]
+
+    def ascii_text(self):
+        key = (self.offset, len(self.data))
+        if self._text_key != key:
+            self._text = self.data.decode('ascii') if self.data.isascii() else None
+            self._text_key = key
+        return self._text
+
+    def slice(self, start, end):
+        return self.data[start - self.offset:end - self.offset]
+
+def _decode_string(raw):
+    if b'\\' in raw:
+        return json.loads(raw)
+    return raw[1:-1].decode('utf-8')
+
+def skip_whitespace(window, pos):
+    pos = window.search(NON_WHITESPACE, pos)
+    if pos is None:
+        raise JsonStreamError("Unexpected end of input")
+    return pos
+
+def skip_string(window, start, keep=False, keep_from=None):
+    pos = start + 1
+    while True:
+        pos = window.search(STRING_END, pos, keep_from=start if keep else keep_from)
+        if pos is None:
+            raise JsonStreamError(f"Unterminated string at byte {start}")
+        if window.byte_at(pos) == b'"':
+            return pos + 1
+        pos += 2
+
+def read_string(window, pos):
+    end = skip_string(window, pos, keep=True)
+    return _decode_string(window.slice(pos, end)), end
+
+def skip_value(window, pos, keep_from=None):
+    first = window.byte_at(pos)
+    if first == b'"':
+        return skip_string(window, pos, keep_from=keep_from)
+    if first not in (b'{', b'['):
+        end = window.search(SCALAR_END, pos, keep_from=pos if keep_from is None else keep_from)
+        return window.end if end is None else end
+    return skip_to_close(window, pos, 0, keep_from)
+
+def skip_to_close(window, pos, depth=1, keep_from=None):
+    while True:
+        data = window.data
+        base = window.offset
+        index = pos - base
+        while True:
+            index = BETWEEN_BRACKETS.match(data, index).end()
+            if index >= len(data):
+                break
+            char = data[index]
+            if char == QUOTE:
+                break
+            depth += 1 if char in OPENERS else -1
+            index += 1
+            if depth == 0:
+                return base + index
+        if index < len(data):
+            pos = skip_string(window, base + index, keep_from=keep_from)
+            continue
+        pos = window.end
+        if not window.extend(pos if keep_from is None else keep_from):
+            raise JsonStreamError("Unexpected end of input")
+
+def read_scalar(window, pos):
+    first = window.byte_at(pos)
+    if first == b'"':
+        return read_string(window, pos)
+    if first in (b'{', b'['):
+        return None, skip_value(window, pos)
+    end = skip_value(window, pos)
+    try:
+        return json.loads(window.slice(pos, end)), end
+    except ValueError as e:
+        raise JsonStreamError(f"Invalid scalar at byte {pos}: {e}")
+
+def next_member(window, pos, first=False):
+    # Members are separated by exactly one comma: no leading, doubled or trailing commas.
+    match = (FIRST_MEMBER if first else NEXT_MEMBER).match(window.data, pos - window.offset)
+    if match and match.end() < len(window.data):
+        return _decode_string(match.group(1)), window.offset + match.end()
+    pos = skip_whitespace(window, pos)
+    char = window.byte_at(pos)
+    if char == b'}':
+        return None, pos + 1
+    if not first:
+        if char != b',':
+            raise JsonStreamError(f"Expected ',' or '}}' at byte {pos}")
+        pos = skip_whitespace(window, pos + 1)
+        char = window.byte_at(pos)
+    if char == b'"':
+        match, base = window.match(MEMBER, pos)
+        if match is not None:
+            return _decode_string(match.group(1)), base + match.end()
+    raise JsonStreamError(f"Expected a key at byte {pos}")
+
+def next_item(window, pos, first=False):
+    pos = skip_whitespace(window, pos)
+    char = window.byte_at(pos)
+    if char == b']':
+        return None, pos + 1
+    if not first:
+        if char != b',':
+            raise JsonStreamError(f"Expected ',' or ']' at byte {pos}")
+        pos = skip_whitespace(window, pos + 1)
+        char = window.byte_at(pos)
+    if char in (b',', b']'):
+        raise JsonStreamError(f"Expected a value at byte {pos}")
+    return pos, pos
+
+def expect_end(window, pos):
+    end = window.search(NON_WHITESPACE, pos)
+    if end is not None:
+        raise JsonStreamError(f"Unexpected data after the top-level value at byte {end}")
+
+def read_value(window, pos):
+    end = skip_value(window, pos, keep_from=pos)
+    try:
+        return json.loads(window.slice(pos, end)), end
+    except ValueError as e:
+        raise JsonStreamError(f"Invalid value at byte {pos}: {e}")
+
+def scan_object(window, pos, on_value):
+    if window.byte_at(pos) != b'{':
+        raise JsonStreamError(f"Expected an object at byte {pos}")
+    pos += 1
+    first = True
+    while True:
+        key, pos = next_member(window, pos, first)
+        if key is None:
+            return pos
+        first = False
+        pos = on_value(key, pos)
+
+def scan_array(window, pos, on_item):
+    if window.byte_at(pos) != b'[':
+        raise JsonStreamError(f"Expected an array at byte {pos}")
+    pos += 1
+    first = True
+    while True:
+        item, pos = next_item(window, pos, first)
+        if item is None:
+            return pos
+        first = False
+        pos = on_item(item)
+
+def scan_object_fields(window, pos, fields, stop_when_found=False):
+    wanted = set(fields)
+    found = {}
+
+    def on_value(key, value_pos):
+        if key not in wanted:
+            return skip_value(window, value_pos)
+        value, end = read_scalar(window, value_pos)
+        if value is not None:
+            found[key] = value
+        if wanted <= found.keys():
+            raise _FieldsFound(end)
+        return end
+
+    try:
+        end = scan_object(window, pos, on_value)
+    except _FieldsFound as done:
+        end = None if stop_when_found else skip_to_close(window, done.args[0])
+    return found, end
+
+def read_top_level_fields(f, fields, chunk_size=64 * 1024):
+    window = ByteWindow(f, chunk_size)
+    pos = window.search(NON_WHITESPACE, 0)
+    if pos is None:
+        return {}
+    if window.byte_at(pos) != b'{':
+        raise JsonStreamError("Top-level value is not an object")
+    return scan_object_fields(window, pos, fields, stop_when_found=True)[0]
+
+def iter_array_member(f, key, max_item_bytes=None, chunk_size=64 * 1024):
+    # Yields the items of a top-level array member one at a time; only one item is ever buffered.
+    window = ByteWindow(f, chunk_size, max_item_bytes)
+    pos = window.search(NON_WHITESPACE, 0)
+    if pos is None:
+        raise JsonStreamError("Empty document")
+    if window.byte_at(pos) != b'{':
+        raise JsonStreamError("Top-level value is not an object")
+    pos += 1
+    first = True
+    while True:
+        member, pos = next_member(window, pos, first)
+        if member is None:
+            expect_end(window, pos)
+            return
+        first = False
+        if member != key or window.byte_at(pos) != b'[':
+            pos = skip_value(window, pos)
+            continue
+        pos = skip_whitespace(window, pos + 1)
+        if window.byte_at(pos) == b']':
+            pos += 1
+            continue
+        while True:
+            value, pos = read_value(window, pos)
+            pos = skip_whitespace(window, pos)
+            separator = window.byte_at(pos)
+            if separator not in (b',', b']'):
+                raise JsonStreamError(f"Expected ',' or ']' at byte {pos}")
+            yield value
+            if separator == b']':
+                pos += 1
+                break
+            pos = skip_whitespace(window, pos + 1)
+            if window.byte_at(pos) in (b',', b']'):
+                raise JsonStreamError(f"Expected a value after ',' at byte {pos}")
+
+def _read_buffered_entry(window, pos, fields):
+    for retry in (False, True):
+        text = window.ascii_text()
+        if text is None:
+            return None
+        try:
+            entry, end = _decoder.raw_decode(text, pos - window.offset)
+            break
+        except ValueError:
+            if retry or not window.extend(pos):
+                return None
+    resource = entry.get('resource') if isinstance(entry, dict) else None
+    if not isinstance(resource, dict):
+        return window.offset + end, []
+    for match in RESOURCE_KEY.finditer(window.data, pos - window.offset, end):
+        try:
+            value, value_end = _decoder.raw_decode(text, match.end())
+        except ValueError:
+            continue
+        if value == resource:
+            found = {key: resource[key] for key in fields if resource.get(key) is not None}
+            return window.offset + end, [(window.offset + match.end(), value_end - match.end(), found)]
+    return None
+
+def iter_bundle_resources(f, fields=('resourceType', 'id'), top_level=None, chunk_size=64 * 1024):
+    window = ByteWindow(f, chunk_size)
+    pos = skip_whitespace(window, 0)
+    if window.byte_at(pos) != b'{':
+        raise JsonStreamError("Top-level value is not an object")
+    pos += 1
+    first = True
+    while True:
+        key, pos = next_member(window, pos, first)
+        if key is None:
+            expect_end(window, pos)
+            return
+        first = False
+        if key != 'entry' or window.byte_at(pos) != b'[':
+            if top_level is not None and key in fields:
+                value, pos = read_scalar(window, pos)
+                if value is not None:
+                    top_level[key] = value
+            else:
+                pos = skip_value(window, pos)
+            continue
+        pos += 1
+        first_entry = True
+        while True:
+            item, pos = next_item(window, pos, first_entry)
+            if item is None:
+                break
+            first_entry = False
+            buffered = _read_buffered_entry(window, item, fields)
+            if buffered is not None:
+                pos, resources = buffered
+                yield from resources
+                continue
+            resources = []
+
+            def on_entry_value(entry_key, value_pos):
+                if entry_key != 'resource' or window.byte_at(value_pos) != b'{':
+                    return skip_value(window, value_pos)
+                found, end = scan_object_fields(window, value_pos, fields)
+                resources.append((value_pos, end - value_pos, found))
+                return end
+
+            pos = scan_object(window, item, on_entry_value)
+            yield from resources
+
+def iter_ndjson_records(f, fields=('resourceType', 'id'), chunk_size=64 * 1024):
+    window = ByteWindow(f, chunk_size)
+    pos = 0
+    while True:
+        end = window.search(NEWLINE, pos, keep_from=pos)
+        line_end = window.end if end is None else end
+        line = window.slice(pos, line_end)
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise JsonStreamError(f"Invalid NDJSON line at byte {pos}: {e}")
+            if isinstance(record, dict):
+                yield pos, len(line.rstrip(b'\r')), {key: record[key] for key in fields if record.get(key) is not None}
+        if end is None:
+            return
+        pos = end + 1
@@ -0,0 +1,53 @@
+"""test data file stats
+
+Revision ID: 1d5b7c9e3a60
+Revises: 4b8a2d6e9c17
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d5b7c9e3a60'
+down_revision = '4b8a2d6e9c17'
+branch_labels = None
+depends_on = None
+
+# Rows are a cache of the test-data folder and are rebuilt by the next scan, so both
+# directions recreate the table instead of migrating rows.
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'test_data_resource' not in inspector.get_table_names():
+        return
+    if 'file_mtime_ns' in {column['name'] for column in inspector.get_columns('test_data_resource')}:
+        return
+    op.drop_table('test_data_resource')
+    op.create_table('test_data_resource',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=256), nullable=False),
+    sa.Column('file_path', sa.String(length=512), nullable=False),
+    sa.Column('file_mtime_ns', sa.BigInteger(), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('resource_type', sa.String(length=64), nullable=False),
+    sa.Column('resource_id', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_path')
+    )
+
+
+def downgrade():
+    op.drop_table('test_data_resource')
+    op.create_table('test_data_resource',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=256), nullable=False),
+    sa.Column('file_path', sa.String(length=512), nullable=False),
+    sa.Column('resource_type', sa.String(length=64), nullable=False),
+    sa.Column('resource_id', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('filename')
+    )
@@ -0,0 +1,38 @@
+"""registry feed cache
+
+Revision ID: 2c6d8e4a1f03
+Revises:
+Create Date: 2026-10-18 12:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c6d8e4a1f03'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'registry_feed_cache' in inspector.get_table_names():
+        return
+    op.create_table('registry_feed_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('feed_name', sa.String(length=128), nullable=False),
+    sa.Column('feed_url', sa.String(length=512), nullable=False),
+    sa.Column('etag', sa.String(length=256), nullable=True),
+    sa.Column('last_modified', sa.String(length=64), nullable=True),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('packages', sa.JSON(), nullable=True),
+    sa.Column('last_fetch_timestamp', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('feed_url')
+    )
+
+
+def downgrade():
+    op.drop_table('registry_feed_cache')
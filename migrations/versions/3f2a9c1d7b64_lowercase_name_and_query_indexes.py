@@ -0,0 +1,41 @@
+"""lowercase package name and query indexes
+
+Revision ID: 3f2a9c1d7b64
+Revises: a0d4f2b8e615
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b64'
+down_revision = 'a0d4f2b8e615'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'cached_package' in tables:
+        columns = {column['name'] for column in inspector.get_columns('cached_package')}
+        indexes = {index['name'] for index in inspector.get_indexes('cached_package')}
+        if 'package_name_lower' not in columns:
+            op.add_column('cached_package', sa.Column('package_name_lower', sa.String(length=128), nullable=True))
+            op.execute("UPDATE cached_package SET package_name_lower = lower(package_name)")
+        for name, column in (('ix_cached_package_package_name_lower', 'package_name_lower'),
+                             ('ix_cached_package_registry', 'registry'),
+                             ('ix_cached_package_fhir_version', 'fhir_version')):
+            if name not in indexes:
+                op.create_index(name, 'cached_package', [column], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cached_package_fhir_version', table_name='cached_package')
+    op.drop_index('ix_cached_package_registry', table_name='cached_package')
+    op.drop_index('ix_cached_package_package_name_lower', table_name='cached_package')
+    with op.batch_alter_table('cached_package') as batch_op:
+        batch_op.drop_column('package_name_lower')
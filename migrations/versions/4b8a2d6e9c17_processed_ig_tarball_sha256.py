@@ -0,0 +1,29 @@
+"""processed ig tarball sha256
+
+Revision ID: 4b8a2d6e9c17
+Revises: 9e1f7b3c5a28
+Create Date: 2026-10-18 12:25:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8a2d6e9c17'
+down_revision = '9e1f7b3c5a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'processed_ig' not in inspector.get_table_names():
+        return
+    if 'tarball_sha256' not in {column['name'] for column in inspector.get_columns('processed_ig')}:
+        op.add_column('processed_ig', sa.Column('tarball_sha256', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('processed_ig') as batch_op:
+        batch_op.drop_column('tarball_sha256')
@@ -0,0 +1,41 @@
+"""test data scan state
+
+Revision ID: 5d7e3a9f1c20
+Revises: 8c41e2b5d9a3
+Create Date: 2026-10-18 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7e3a9f1c20'
+down_revision = '8c41e2b5d9a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'test_data_scan_state' in inspector.get_table_names():
+        return
+    op.create_table('test_data_scan_state',
+    sa.Column('file_path', sa.String(length=512), nullable=False),
+    sa.Column('file_mtime_ns', sa.BigInteger(), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('resource_count', sa.Integer(), nullable=False),
+    sa.Column('scanned_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('file_path')
+    )
+    # Files indexed before the scan state existed keep their fingerprints and are not parsed again.
+    op.execute(
+        "INSERT INTO test_data_scan_state (file_path, file_mtime_ns, file_size, status, resource_count) "
+        "SELECT file_path, MAX(file_mtime_ns), MAX(file_size), 'indexed', COUNT(*) FROM test_data_resource "
+        "WHERE file_mtime_ns IS NOT NULL GROUP BY file_path"
+    )
+
+
+def downgrade():
+    op.drop_table('test_data_scan_state')
@@ -0,0 +1,58 @@
+"""test data byte offsets
+
+Revision ID: 6f3c1e9a7d42
+Revises: 1d5b7c9e3a60
+Create Date: 2026-10-18 12:35:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f3c1e9a7d42'
+down_revision = '1d5b7c9e3a60'
+branch_labels = None
+depends_on = None
+
+
+# Rows are a cache of the test-data folder and are rebuilt by the next scan, so both
+# directions recreate the table instead of migrating rows.
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'test_data_resource' not in inspector.get_table_names():
+        return
+    if 'byte_offset' in {column['name'] for column in inspector.get_columns('test_data_resource')}:
+        return
+    op.drop_table('test_data_resource')
+    op.create_table('test_data_resource',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=256), nullable=False),
+    sa.Column('file_path', sa.String(length=512), nullable=False),
+    sa.Column('file_mtime_ns', sa.BigInteger(), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('byte_offset', sa.BigInteger(), nullable=False),
+    sa.Column('byte_length', sa.BigInteger(), nullable=True),
+    sa.Column('resource_type', sa.String(length=64), nullable=False),
+    sa.Column('resource_id', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_path', 'byte_offset', name='uq_test_data_location')
+    )
+
+
+def downgrade():
+    op.drop_table('test_data_resource')
+    op.create_table('test_data_resource',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=256), nullable=False),
+    sa.Column('file_path', sa.String(length=512), nullable=False),
+    sa.Column('file_mtime_ns', sa.BigInteger(), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('resource_type', sa.String(length=64), nullable=False),
+    sa.Column('resource_id', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_path')
+    )
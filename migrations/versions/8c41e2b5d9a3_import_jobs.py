@@ -0,0 +1,49 @@
+"""import jobs
+
+Revision ID: 8c41e2b5d9a3
+Revises: 3f2a9c1d7b64
+Create Date: 2026-10-18 14:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e2b5d9a3'
+down_revision = '3f2a9c1d7b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'import_job' in inspector.get_table_names():
+        return
+    op.create_table('import_job',
+    sa.Column('id', sa.String(length=64), nullable=False),
+    sa.Column('package_name', sa.String(length=128), nullable=False),
+    sa.Column('version', sa.String(length=64), nullable=False),
+    sa.Column('dependency_mode', sa.String(length=32), nullable=False),
+    sa.Column('dedupe_key', sa.String(length=256), nullable=False),
+    sa.Column('active_key', sa.String(length=256), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('progress', sa.JSON(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('errors', sa.JSON(), nullable=True),
+    sa.Column('message', sa.String(length=512), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('active_key')
+    )
+    op.create_index('ix_import_job_dedupe_key', 'import_job', ['dedupe_key'], unique=False)
+    op.create_index('ix_import_job_status', 'import_job', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_import_job_status', table_name='import_job')
+    op.drop_index('ix_import_job_dedupe_key', table_name='import_job')
+    op.drop_table('import_job')
@@ -0,0 +1,43 @@
+"""package manifest
+
+Revision ID: 9e1f7b3c5a28
+Revises: 2c6d8e4a1f03
+Create Date: 2026-10-18 12:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e1f7b3c5a28'
+down_revision = '2c6d8e4a1f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'package_manifest' in inspector.get_table_names():
+        return
+    op.create_table('package_manifest',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tgz_filename', sa.String(length=256), nullable=False),
+    sa.Column('package_name', sa.String(length=128), nullable=True),
+    sa.Column('version', sa.String(length=64), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('file_mtime_ns', sa.BigInteger(), nullable=True),
+    sa.Column('sha256', sa.String(length=64), nullable=True),
+    sa.Column('package_json', sa.JSON(), nullable=True),
+    sa.Column('files', sa.JSON(), nullable=True),
+    sa.Column('resource_counts', sa.JSON(), nullable=True),
+    sa.Column('member_count', sa.Integer(), nullable=True),
+    sa.Column('uncompressed_size', sa.BigInteger(), nullable=True),
+    sa.Column('indexed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('tgz_filename')
+    )
+
+
+def downgrade():
+    op.drop_table('package_manifest')
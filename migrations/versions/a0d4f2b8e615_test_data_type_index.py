@@ -0,0 +1,28 @@
+"""test data type index
+
+Revision ID: a0d4f2b8e615
+Revises: 6f3c1e9a7d42
+Create Date: 2026-10-18 12:36:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0d4f2b8e615'
+down_revision = '6f3c1e9a7d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'test_data_resource' not in inspector.get_table_names():
+        return
+    if 'ix_test_data_type_id' not in {index['name'] for index in inspector.get_indexes('test_data_resource')}:
+        op.create_index('ix_test_data_type_id', 'test_data_resource', ['resource_type', 'resource_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_test_data_type_id', table_name='test_data_resource')
@@ -0,0 +1,71 @@
+"""registry feed entries per package
+
+Revision ID: b7e2c4f81a06
+Revises: 5d7e3a9f1c20
+Create Date: 2026-10-18 17:20:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4f81a06'
+down_revision = '5d7e3a9f1c20'
+branch_labels = None
+depends_on = None
+
+
+def _package_key(entry):
+    raw_name = entry.get('name') or entry.get('title') or ''
+    return raw_name.split('#', 1)[0].strip().lower()
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if 'registry_feed_entry' not in tables:
+        op.create_table('registry_feed_entry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('feed_url', sa.String(length=512), nullable=False),
+        sa.Column('package_name_lower', sa.String(length=128), nullable=False),
+        sa.Column('entries', sa.JSON(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_registry_feed_entry_feed_url', 'registry_feed_entry', ['feed_url'], unique=False)
+        op.create_index('ix_registry_feed_entry_package_name_lower', 'registry_feed_entry', ['package_name_lower'], unique=False)
+
+    if 'registry_feed_cache' not in tables:
+        return
+    if 'packages' not in {column['name'] for column in inspector.get_columns('registry_feed_cache')}:
+        return
+    # Split each stored feed into one row per package so version lookups read a single key.
+    entry_table = sa.table('registry_feed_entry',
+                           sa.column('feed_url', sa.String),
+                           sa.column('package_name_lower', sa.String),
+                           sa.column('entries', sa.JSON))
+    for feed_url, packages in bind.execute(sa.text("SELECT feed_url, packages FROM registry_feed_cache")).fetchall():
+        if isinstance(packages, str):
+            packages = json.loads(packages)
+        groups = {}
+        for entry in packages or []:
+            if isinstance(entry, dict) and _package_key(entry):
+                groups.setdefault(_package_key(entry), []).append(entry)
+        if groups:
+            op.bulk_insert(entry_table, [
+                {'feed_url': feed_url, 'package_name_lower': key, 'entries': entries}
+                for key, entries in groups.items()
+            ])
+    with op.batch_alter_table('registry_feed_cache') as batch_op:
+        batch_op.drop_column('packages')
+
+
+def downgrade():
+    with op.batch_alter_table('registry_feed_cache') as batch_op:
+        batch_op.add_column(sa.Column('packages', sa.JSON(), nullable=True))
+    op.drop_index('ix_registry_feed_entry_package_name_lower', table_name='registry_feed_entry')
+    op.drop_index('ix_registry_feed_entry_feed_url', table_name='registry_feed_entry')
+    op.drop_table('registry_feed_entry')
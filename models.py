@@ -1,3 +1,4 @@
+import datetime
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
@@ -5,9 +6,10 @@ db = SQLAlchemy()
 class CachedPackage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     package_name = db.Column(db.String(128), nullable=False)
+    package_name_lower = db.Column(db.String(128), index=True)
     version = db.Column(db.String(64), nullable=False)
     author = db.Column(db.String(128))
-    fhir_version = db.Column(db.String(64))
+    fhir_version = db.Column(db.String(64), index=True)
     version_count = db.Column(db.Integer)
     url = db.Column(db.String(256))
     all_versions = db.Column(db.JSON, nullable=True)
@@ -15,13 +17,43 @@ class CachedPackage(db.Model):
     latest_absolute_version = db.Column(db.String(64))
     latest_official_version = db.Column(db.String(64))
     canonical = db.Column(db.String(256))
-    registry = db.Column(db.String(256))
+    registry = db.Column(db.String(256), index=True)
     __table_args__ = (db.UniqueConstraint('package_name', 'version', name='uq_cached_package_version'),)
 
 class RegistryCacheInfo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     last_fetch_timestamp = db.Column(db.DateTime(timezone=True), nullable=True)
 
+class RegistryFeedCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    feed_name = db.Column(db.String(128), nullable=False)
+    feed_url = db.Column(db.String(512), nullable=False, unique=True)
+    etag = db.Column(db.String(256))
+    last_modified = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))
+    last_fetch_timestamp = db.Column(db.DateTime(timezone=True), nullable=True)
+
+class RegistryFeedEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    feed_url = db.Column(db.String(512), nullable=False, index=True)
+    package_name_lower = db.Column(db.String(128), nullable=False, index=True)
+    entries = db.Column(db.JSON, nullable=False)
+
+class PackageManifest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tgz_filename = db.Column(db.String(256), nullable=False, unique=True)
+    package_name = db.Column(db.String(128))
+    version = db.Column(db.String(64))
+    file_size = db.Column(db.BigInteger)
+    file_mtime_ns = db.Column(db.BigInteger)
+    sha256 = db.Column(db.String(64))
+    package_json = db.Column(db.JSON, nullable=True)
+    files = db.Column(db.JSON, nullable=True)
+    resource_counts = db.Column(db.JSON, nullable=True)
+    member_count = db.Column(db.Integer)
+    uncompressed_size = db.Column(db.BigInteger)
+    indexed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
 class ProcessedIg(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     package_name = db.Column(db.String(128), nullable=False)
@@ -34,12 +66,46 @@ class ProcessedIg(db.Model):
     imposed_profiles = db.Column(db.JSON, nullable=True)
     optional_usage_elements = db.Column(db.JSON, nullable=True)
     search_param_conformance = db.Column(db.JSON, nullable=True)
+    tarball_sha256 = db.Column(db.String(64), nullable=True)
     __table_args__ = (db.UniqueConstraint('package_name', 'version', name='uq_package_version'),)
 
 class TestDataResource(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(256), nullable=False, unique=True)
+    filename = db.Column(db.String(256), nullable=False)
     file_path = db.Column(db.String(512), nullable=False)
+    file_mtime_ns = db.Column(db.BigInteger, nullable=True)
+    file_size = db.Column(db.BigInteger, nullable=True)
+    byte_offset = db.Column(db.BigInteger, nullable=False, default=0)
+    byte_length = db.Column(db.BigInteger, nullable=True)
     resource_type = db.Column(db.String(64), nullable=False)
     resource_id = db.Column(db.String(128), nullable=False)
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.now)
\ No newline at end of file
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.now)
+    __table_args__ = (
+        db.UniqueConstraint('file_path', 'byte_offset', name='uq_test_data_location'),
+        db.Index('ix_test_data_type_id', 'resource_type', 'resource_id', 'id'),
+    )
+
+class TestDataScanState(db.Model):
+    file_path = db.Column(db.String(512), primary_key=True)
+    file_mtime_ns = db.Column(db.BigInteger, nullable=True)
+    file_size = db.Column(db.BigInteger, nullable=True)
+    status = db.Column(db.String(16), nullable=False)
+    resource_count = db.Column(db.Integer, nullable=False, default=0)
+    scanned_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.now)
+
+class ImportJob(db.Model):
+    id = db.Column(db.String(64), primary_key=True)
+    package_name = db.Column(db.String(128), nullable=False)
+    version = db.Column(db.String(64), nullable=False)
+    dependency_mode = db.Column(db.String(32), nullable=False)
+    dedupe_key = db.Column(db.String(256), nullable=False, index=True)
+    active_key = db.Column(db.String(256), unique=True)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    progress = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    errors = db.Column(db.JSON, nullable=True)
+    message = db.Column(db.String(512))
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    started_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
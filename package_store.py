@@ -0,0 +1,199 @@
+import os
+import json
+import mmap
+import shutil
+import tarfile
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+STORE_INDEX_FILENAME = '_store.json'
+MMAP_THRESHOLD = 1024 * 1024
+
+_index_memo = {}
+_extract_locks = {}
+_locks_guard = threading.Lock()
+
+class PackageStoreError(Exception):
+    pass
+
+def _store_key(tgz_path):
+    base_name = os.path.basename(tgz_path)
+    return base_name[:-4] if base_name.endswith('.tgz') else base_name
+
+def _source_stamp(tgz_path):
+    stat = os.stat(tgz_path)
+    return {'filename': os.path.basename(tgz_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _safe_member_path(name):
+    normalized = os.path.normpath(name)
+    if normalized.startswith(('/', '..')) or os.path.isabs(normalized) or '..' in normalized.split(os.sep):
+        return None
+    return normalized
+
+def _resolve(root, relative_path):
+    full_path = os.path.join(root, relative_path)
+    if not os.path.realpath(full_path).startswith(os.path.realpath(root) + os.sep):
+        raise PackageStoreError(f"Path escapes package store: {relative_path}")
+    # Keep the path under the package link so it follows a republish instead of the retired copy.
+    return full_path
+
+def _read_index_entries(root, index_path):
+    try:
+        with open(os.path.join(root, index_path), 'rb') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable {index_path}: {e}")
+        return []
+    base_dir = os.path.dirname(index_path)
+    return [
+        (os.path.join(base_dir, entry['filename']), entry)
+        for entry in data.get('files', []) if isinstance(entry, dict) and entry.get('filename')
+    ]
+
+def _build_store_index(root, files):
+    resources = {}
+    canonicals = {}
+    covered = set()
+    for index_path in [path for path in files if os.path.basename(path) == '.index.json']:
+        for file_path, entry in _read_index_entries(root, index_path):
+            if file_path not in files:
+                continue
+            covered.add(file_path)
+            if entry.get('resourceType') and entry.get('id'):
+                resources.setdefault(f"{entry['resourceType']}/{entry['id']}", file_path)
+            if entry.get('url'):
+                canonicals.setdefault(entry['url'], file_path)
+    for file_path in files:
+        if file_path in covered or not file_path.endswith('.json') or os.path.basename(file_path).startswith('.'):
+            continue
+        if os.path.basename(file_path) == 'package.json':
+            continue
+        try:
+            with open(os.path.join(root, file_path), 'rb') as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(content, dict) and content.get('resourceType') and content.get('id'):
+            resources.setdefault(f"{content['resourceType']}/{content['id']}", file_path)
+            if isinstance(content.get('url'), str):
+                canonicals.setdefault(content['url'], file_path)
+    return resources, canonicals
+
+def _load_store_index(target):
+    index_path = os.path.join(target, STORE_INDEX_FILENAME)
+    try:
+        stat = os.stat(index_path)
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    memo = _index_memo.get(target)
+    if memo and memo[0] == stamp:
+        return memo[1]
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    index['root'] = target
+    _index_memo[target] = (stamp, index)
+    return index
+
+def _extract(tgz_path, store_dir, key):
+    staging = tempfile.mkdtemp(dir=store_dir, prefix=f".{key}.", suffix='.tmp')
+    files = {}
+    try:
+        with tarfile.open(tgz_path, 'r|gz') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                relative_path = _safe_member_path(member.name)
+                if relative_path is None:
+                    logger.warning(f"Skipping unsafe member {member.name} in {tgz_path}")
+                    continue
+                destination = os.path.join(staging, relative_path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                with tar.extractfile(member) as source, open(destination, 'wb') as out:
+                    shutil.copyfileobj(source, out, 1024 * 1024)
+                files[relative_path] = member.size
+        resources, canonicals = _build_store_index(staging, files)
+        index = {'source': _source_stamp(tgz_path), 'files': files, 'resources': resources, 'canonicals': canonicals}
+        with open(os.path.join(staging, STORE_INDEX_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        return staging
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+def _publish(staging, target):
+    # The target is a symlink to the unpacked copy; replacing the link is atomic, so readers never
+    # see the package missing while it is republished.
+    previous = os.path.realpath(target) if os.path.islink(target) else None
+    link = f"{staging}.link"
+    os.symlink(os.path.basename(staging), link)
+    retired = None
+    try:
+        if previous is None and os.path.isdir(target):
+            # Unpacked before the store used links; a directory cannot be swapped in place.
+            retired = f"{target}.old.{os.getpid()}.{threading.get_ident()}"
+            os.rename(target, retired)
+        os.replace(link, target)
+    except Exception:
+        if os.path.lexists(link):
+            os.unlink(link)
+        raise
+    for old in (previous, retired):
+        if old and old != os.path.realpath(staging):
+            shutil.rmtree(old, ignore_errors=True)
+
+def ensure_unpacked_package(tgz_path, store_dir):
+    key = _store_key(tgz_path)
+    target = os.path.join(store_dir, key)
+    stamp = _source_stamp(tgz_path)
+    index = _load_store_index(target)
+    if index is not None and index.get('source') == stamp:
+        return index
+    os.makedirs(store_dir, exist_ok=True)
+    with _locks_guard:
+        extract_lock = _extract_locks.setdefault(target, threading.Lock())
+    with extract_lock:
+        index = _load_store_index(target)
+        if index is not None and index.get('source') == stamp:
+            return index
+        logger.info(f"Unpacking {os.path.basename(tgz_path)} into package store")
+        staging = _extract(tgz_path, store_dir, key)
+        _publish(staging, target)
+    return _load_store_index(target)
+
+def resolve_resource_path(index, path=None, resource_type=None, resource_id=None, canonical=None):
+    if path:
+        relative_path = path if path.startswith('package/') else f"package/{path}"
+        if relative_path not in index['files']:
+            return None
+    elif canonical:
+        relative_path = index['canonicals'].get(canonical)
+    else:
+        relative_path = index['resources'].get(f"{resource_type}/{resource_id}")
+    if not relative_path:
+        return None
+    return _resolve(index['root'], relative_path)
+
+def open_resource_bytes(full_path, mmap_threshold=MMAP_THRESHOLD):
+    with open(full_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= mmap_threshold:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+def load_resource(full_path):
+    with open(full_path, 'rb') as f:
+        return json.load(f)
+
+def remove_unpacked_package(tgz_path, store_dir):
+    target = os.path.join(store_dir, _store_key(tgz_path))
+    _index_memo.pop(target, None)
+    if os.path.islink(target):
+        unpacked = os.path.realpath(target)
+        os.unlink(target)
+        shutil.rmtree(unpacked, ignore_errors=True)
+    else:
+        shutil.rmtree(target, ignore_errors=True)
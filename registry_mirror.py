@@ -0,0 +1,182 @@
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+import requests
+from cachetools import TTLCache
+from flask import Blueprint, current_app, jsonify, request, send_file, url_for
+from sqlalchemy import func
+from models import db, PackageManifest
+from services import (
+    construct_tgz_filename,
+    download_package_tarball,
+    get_http_session,
+    get_package_manifest,
+    package_in_use,
+    safe_parse_version,
+    store_package_manifest
+)
+
+logger = logging.getLogger(__name__)
+
+mirror_bp = Blueprint('registry_mirror', __name__)
+
+PACKAGE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$')
+PACKAGE_VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._+-]{0,63}$')
+TARBALL_MIMETYPE = 'application/tar+gzip'
+
+_metadata_cache = None
+_metadata_lock = threading.Lock()
+_pull_locks = {}
+_pull_locks_guard = threading.Lock()
+
+def _error(status, message):
+    return jsonify({"error": message}), status
+
+def _upstream_url(*parts):
+    base = current_app.config['REGISTRY_MIRROR_UPSTREAM'].rstrip('/')
+    return '/'.join([base] + [quote(part) for part in parts])
+
+def _tarball_url(name, version):
+    return url_for('registry_mirror.package_tarball', name=name, version=version, _external=True)
+
+def _get_metadata_cache():
+    global _metadata_cache
+    if _metadata_cache is None:
+        with _metadata_lock:
+            if _metadata_cache is None:
+                _metadata_cache = TTLCache(maxsize=1024, ttl=current_app.config['REGISTRY_MIRROR_METADATA_TTL'])
+    return _metadata_cache
+
+def _fetch_upstream_metadata(name):
+    timeout = (current_app.config['FEED_CONNECT_TIMEOUT'], current_app.config['FEED_READ_TIMEOUT'])
+    response = get_http_session().get(_upstream_url(name), timeout=timeout)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    metadata = response.json()
+    if not isinstance(metadata, dict):
+        raise ValueError(f"Unexpected metadata document for {name}")
+    return metadata
+
+def _with_mirror_urls(metadata, name):
+    # Point every tarball at this mirror, as seen by the caller, so clients pull through it as well.
+    versions = {}
+    for version, info in (metadata.get('versions') or {}).items():
+        if isinstance(info, dict):
+            tarball = _tarball_url(info.get('name') or name, version)
+            info = dict(info, url=tarball, dist=dict(info.get('dist') or {}, tarball=tarball))
+        versions[version] = info
+    return dict(metadata, versions=versions)
+
+def _local_metadata(name):
+    rows = PackageManifest.query.filter(func.lower(PackageManifest.package_name) == name.lower()).all()
+    versions = {}
+    for row in rows:
+        if not row.version:
+            continue
+        package_json = row.package_json or {}
+        versions[row.version] = {
+            'name': row.package_name,
+            'version': row.version,
+            'description': package_json.get('description'),
+            'fhirVersion': (package_json.get('fhirVersions') or [None])[0]
+        }
+    if not versions:
+        return None
+    package_name = rows[0].package_name
+    latest = max(versions, key=safe_parse_version)
+    return {
+        '_id': package_name,
+        'name': package_name,
+        'dist-tags': {'latest': latest},
+        'versions': versions
+    }
+
+@contextmanager
+def _pull_lock(tgz_filename):
+    # Locks are counted so the entry is dropped once the last request for that tarball is done.
+    with _pull_locks_guard:
+        entry = _pull_locks.setdefault(tgz_filename, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _pull_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _pull_locks[tgz_filename]
+
+def _pull_through(name, version, tgz_path):
+    # One download per tarball per worker; concurrent requests wait for it and then serve the file.
+    with _pull_lock(os.path.basename(tgz_path)):
+        if os.path.exists(tgz_path):
+            return
+        url = _upstream_url(name, version)
+        logger.info(f"Mirror miss for {name}#{version}; pulling from {url}")
+        download = download_package_tarball(url, tgz_path, get_http_session())
+        store_package_manifest(tgz_path, download)
+
+@mirror_bp.route('/<name>')
+def package_metadata(name):
+    if not PACKAGE_NAME_PATTERN.match(name):
+        return _error(400, f"Invalid package name {name}")
+    cache = _get_metadata_cache()
+    key = name.lower()
+    metadata = cache.get(key)
+    if metadata is None:
+        try:
+            metadata = _fetch_upstream_metadata(name)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Upstream metadata for {name} unavailable, serving local versions: {e}")
+            metadata = _local_metadata(name)
+        if metadata is None:
+            return _error(404, f"Package {name} not found")
+        cache[key] = metadata
+    response = jsonify(_with_mirror_urls(metadata, name))
+    response.cache_control.public = True
+    response.cache_control.max_age = int(current_app.config['REGISTRY_MIRROR_METADATA_TTL'])
+    response.add_etag()
+    return response.make_conditional(request)
+
+@mirror_bp.route('/<name>/<version>')
+def package_tarball(name, version):
+    if not PACKAGE_NAME_PATTERN.match(name) or not PACKAGE_VERSION_PATTERN.match(version):
+        return _error(400, f"Invalid package {name}#{version}")
+    tgz_filename = construct_tgz_filename(name, version)
+    tgz_path = os.path.join(current_app.config['FHIR_PACKAGES_DIR'], tgz_filename)
+    # Held until send_file has opened the tarball, so a tree-shaking import does not remove it mid-request.
+    with package_in_use(tgz_path):
+        if not os.path.exists(tgz_path):
+            if not current_app.config['REGISTRY_MIRROR_PULL_THROUGH']:
+                return _error(404, f"Package {name}#{version} is not cached")
+            try:
+                os.makedirs(os.path.dirname(tgz_path), exist_ok=True)
+                _pull_through(name, version, tgz_path)
+            except requests.HTTPError as e:
+                db.session.rollback()
+                status = e.response.status_code if e.response is not None else 502
+                if status == 404:
+                    return _error(404, f"Package {name}#{version} not found upstream")
+                logger.error(f"Upstream error pulling {name}#{version}: {e}")
+                return _error(502, f"Upstream error: {e}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Could not pull {name}#{version} through the mirror: {e}", exc_info=True)
+                return _error(502, f"Could not fetch {name}#{version} from upstream")
+        try:
+            sha256 = get_package_manifest(tgz_path)['sha256'] or True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Could not index {tgz_filename}: {e}", exc_info=True)
+            sha256 = True
+        # send_file hands the open file to the server (sendfile under gunicorn) and answers Range and
+        # conditional requests; a version's tarball never changes, so it can be cached for good.
+        response = send_file(tgz_path, mimetype=TARBALL_MIMETYPE, download_name=tgz_filename, conditional=True,
+                             etag=sha256, max_age=current_app.config['REGISTRY_MIRROR_MAX_AGE'])
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
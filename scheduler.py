@@ -0,0 +1,93 @@
+import fcntl
+import logging
+import os
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+class SingleFlightTask:
+    def __init__(self, name, func, interval=0, jitter=0.1, lock_path=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.lock_path = lock_path
+        self._running = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def running(self):
+        return self._running.locked()
+
+    def _acquire(self):
+        if not self._running.acquire(blocking=False):
+            return None
+        if not self.lock_path:
+            return (None,)
+        try:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            self._running.release()
+            raise
+        try:
+            # Single flight across worker processes: whoever holds the flock runs the task.
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            self._running.release()
+            return None
+        return (fd,)
+
+    def _release(self, token):
+        fd = token[0]
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._running.release()
+
+    def _run(self, token, args, kwargs):
+        try:
+            self.func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Task {self.name} failed: {e}", exc_info=True)
+        finally:
+            self._release(token)
+
+    def trigger(self, *args, **kwargs):
+        token = self._acquire()
+        if token is None:
+            return False
+        thread = threading.Thread(target=self._run, args=(token, args, kwargs), name=f"{self.name}-run", daemon=True)
+        thread.start()
+        return True
+
+    def next_delay(self):
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name=f"{self.name}-scheduler", daemon=True)
+            self._thread.start()
+            logger.info(f"Scheduled {self.name} every {self.interval}s (jitter {self.jitter:.0%})")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.next_delay()):
+            token = self._acquire()
+            if token is None:
+                logger.debug(f"Skipping scheduled {self.name}: already running")
+                continue
+            self._run(token, (), {'scheduled': True})
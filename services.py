@@ -1,370 +1,1689 @@
-import requests
-import os
-import tarfile
-import json
-import re
-import logging
-from flask import current_app, Blueprint
-from collections import defaultdict
-from urllib.parse import quote
-from pathlib import Path
-from models import db, TestDataResource
-
-services_bp = Blueprint('services', __name__)
-logger = logging.getLogger(__name__)
-
-FHIR_REGISTRY_BASE_URL = "https://packages.fhir.org"
-
-try:
-    import packaging.version as pkg_version
-    HAS_PACKAGING_LIB = True
-except ImportError:
-    HAS_PACKAGING_LIB = False
-    class BasicVersion:
-        def __init__(self, v_str): self.v_str = str(v_str)
-        def __lt__(self, other): return self.v_str < str(other)
-        def __gt__(self, other): return self.v_str > str(other)
-        def __eq__(self, other): return self.v_str == str(other)
-        def __str__(self): return self.v_str
-    pkg_version = SimpleNamespace(parse=BasicVersion, InvalidVersion=ValueError)
-
-def safe_parse_version(v_str):
-    if not v_str or not isinstance(v_str, str):
-        return pkg_version.parse("0.0.0a0")
-    try:
-        return pkg_version.parse(v_str)
-    except pkg_version.InvalidVersion:
-        v_str_norm = v_str.lower()
-        base_part = v_str_norm.split('-', 1)[0] if '-' in v_str_norm else v_str_norm
-        suffix = v_str_norm.split('-', 1)[1] if '-' in v_str_norm else None
-        if re.match(r'^\d+(\.\d+)*$', base_part):
-            try:
-                if suffix in ['dev', 'snapshot', 'ci-build']: return pkg_version.parse(f"{base_part}a0")
-                elif suffix in ['draft', 'ballot', 'preview']: return pkg_version.parse(f"{base_part}b0")
-                elif suffix and suffix.startswith('rc'): return pkg_version.parse(f"{base_part}rc{''.join(filter(str.isdigit, suffix)) or '0'}")
-                return pkg_version.parse(base_part)
-            except pkg_version.InvalidVersion:
-                logger.warning(f"Invalid version '{base_part}'. Treating as alpha.")
-                return pkg_version.parse("0.0.0a0")
-        else:
-            logger.warning(f"Unparseable version '{v_str}'. Treating as alpha.")
-            return pkg_version.parse("0.0.0a0")
-
-def get_additional_registries():
-    feed_registry_url = 'https://raw.githubusercontent.com/FHIR/ig-registry/master/package-feeds.json'
-    feeds = []
-    try:
-        response = requests.get(feed_registry_url, timeout=15)
-        response.raise_for_status()
-        data = json.loads(response.text)
-        feeds = [{'name': feed['name'], 'url': feed['url']} for feed in data.get('feeds', []) if 'name' in feed and 'url' in feed]
-    except Exception as e:
-        logger.error(f"Error fetching registries: {e}", exc_info=True)
-    return feeds
-
-def fetch_packages_from_registries(search_term=''):
-    packages_dict = defaultdict(list)
-    feed_registries = get_additional_registries()
-    if not feed_registries:
-        logger.warning("No registries available.")
-        return []
-    for feed in feed_registries:
-        try:
-            response = requests.get(feed['url'], timeout=30)
-            response.raise_for_status()
-            try:
-                data = json.loads(response.text)
-                for pkg in data.get('packages', []):
-                    if not isinstance(pkg, dict) or not pkg.get('name'):
-                        continue
-                    if search_term and search_term.lower() not in pkg['name'].lower():
-                        continue
-                    packages_dict[pkg['name']].append(pkg)
-            except json.JSONDecodeError:
-                logger.warning(f"Non-JSON feed: {feed['name']}")
-        except Exception as e:
-            logger.error(f"Error fetching feed {feed['name']}: {e}")
-    packages = []
-    for pkg_name, entries in packages_dict.items():
-        versions = [{"version": entry.get('version', ''), "pubDate": entry.get('pubDate', '')} for entry in entries if entry.get('version')]
-        versions.sort(key=lambda x: x.get('pubDate', ''), reverse=True)
-        if not versions:
-            continue
-        latest_entry = entries[0]
-        package = {
-            'name': pkg_name,
-            'version': latest_entry.get('version', ''),
-            'author': latest_entry.get('author', ''),
-            'fhirVersion': latest_entry.get('fhirVersion', ''),
-            'url': latest_entry.get('url', ''),
-            'canonical': latest_entry.get('canonical', ''),
-            'dependencies': latest_entry.get('dependencies', []),
-            'versions': versions,
-            'registry': latest_entry.get('registry', '')
-        }
-        packages.append(package)
-    return packages
-
-def normalize_package_data(raw_packages):
-    packages_grouped = defaultdict(list)
-    for entry in raw_packages:
-        if not isinstance(entry, dict):
-            continue
-        raw_name = entry.get('name') or entry.get('title') or ''
-        name_part = raw_name.split('#', 1)[0].strip().lower()
-        if name_part:
-            packages_grouped[name_part].append(entry)
-    normalized_list = []
-    for name_key, entries in packages_grouped.items():
-        latest_absolute_data = None
-        latest_official_data = None
-        latest_absolute_ver = safe_parse_version("0.0.0a0")
-        latest_official_ver = safe_parse_version("0.0.0a0")
-        all_versions = []
-        package_name_display = name_key
-        processed_versions = set()
-        for package_entry in entries:
-            for version_info in package_entry.get('versions', []):
-                if isinstance(version_info, dict) and 'version' in version_info:
-                    version_str = version_info.get('version', '')
-                    if version_str and version_str not in processed_versions:
-                        all_versions.append(version_info)
-                        processed_versions.add(version_str)
-        processed_entries = []
-        for package_entry in entries:
-            version_str = package_entry.get('version') or (raw_name.split('#')[1] if '#' in raw_name else '')
-            if not version_str:
-                continue
-            current_display_name = raw_name.split('#')[0].strip()
-            if current_display_name and current_display_name != name_key:
-                package_name_display = current_display_name
-            entry_with_version = package_entry.copy()
-            entry_with_version['version'] = version_str
-            processed_entries.append(entry_with_version)
-            try:
-                current_ver = safe_parse_version(version_str)
-                if latest_absolute_data is None or current_ver > latest_absolute_ver:
-                    latest_absolute_ver = current_ver
-                    latest_absolute_data = entry_with_version
-                if re.match(r'^\d+\.\d+\.\d+(?:-[a-zA-Z0-9\.]+)?$', version_str):
-                    if latest_official_data is None or current_ver > latest_official_ver:
-                        latest_official_ver = current_ver
-                        latest_official_data = entry_with_version
-            except Exception as e:
-                logger.error(f"Error comparing version '{version_str}': {e}")
-        if latest_absolute_data:
-            final_absolute_version = latest_absolute_data.get('version', 'unknown')
-            final_official_version = latest_official_data.get('version') if latest_official_data else None
-            author = str(latest_absolute_data.get('author') or '')
-            fhir_version = latest_absolute_data.get('fhirVersion') or 'unknown'
-            url = str(latest_absolute_data.get('url') or '')
-            canonical = str(latest_absolute_data.get('canonical') or url)
-            dependencies = []
-            dependencies_raw = latest_absolute_data.get('dependencies', [])
-            if isinstance(dependencies_raw, dict):
-                dependencies = [{"name": str(dn), "version": str(dv)} for dn, dv in dependencies_raw.items()]
-            elif isinstance(dependencies_raw, list):
-                for dep in dependencies_raw:
-                    if isinstance(dep, str) and '@' in dep:
-                        dep_name, dep_version = dep.split('@', 1)
-                        dependencies.append({"name": dep_name, "version": dep_version})
-                    elif isinstance(dep, dict) and 'name' in dep:
-                        dependencies.append(dep)
-            all_versions.sort(key=lambda x: x.get('pubDate', ''), reverse=True)
-            normalized_entry = {
-                'name': package_name_display,
-                'version': final_absolute_version,
-                'latest_absolute_version': final_absolute_version,
-                'latest_official_version': final_official_version,
-                'author': author.strip(),
-                'fhir_version': fhir_version.strip(),
-                'url': url.strip(),
-                'canonical': canonical.strip(),
-                'dependencies': dependencies,
-                'version_count': len(all_versions),
-                'all_versions': all_versions,
-                'versions_data': processed_entries,
-                'registry': latest_absolute_data.get('registry', '')
-            }
-            normalized_list.append(normalized_entry)
-    normalized_list.sort(key=lambda x: x.get('name', '').lower())
-    return normalized_list
-
-def cache_packages(normalized_packages, db, CachedPackage):
-    try:
-        for package in normalized_packages:
-            existing = CachedPackage.query.filter_by(package_name=package['name'], version=package['version']).first()
-            if existing:
-                existing.author = package['author']
-                existing.fhir_version = package['fhir_version']
-                existing.version_count = package['version_count']
-                existing.url = package['url']
-                existing.all_versions = package['all_versions']
-                existing.dependencies = package['dependencies']
-                existing.latest_absolute_version = package['latest_absolute_version']
-                existing.latest_official_version = package['latest_official_version']
-                existing.canonical = package['canonical']
-                existing.registry = package.get('registry', '')
-            else:
-                new_package = CachedPackage(
-                    package_name=package['name'],
-                    version=package['version'],
-                    author=package['author'],
-                    fhir_version=package['fhir_version'],
-                    version_count=package['version_count'],
-                    url=package['url'],
-                    all_versions=package['all_versions'],
-                    dependencies=package['dependencies'],
-                    latest_absolute_version=package['latest_absolute_version'],
-                    latest_official_version=package['latest_official_version'],
-                    canonical=package['canonical'],
-                    registry=package.get('registry', '')
-                )
-                db.session.add(new_package)
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error caching packages: {e}")
-        raise
-
-def _get_download_dir():
-    packages_dir = current_app.config.get('FHIR_PACKAGES_DIR')
-    os.makedirs(packages_dir, exist_ok=True)
-    return packages_dir
-
-def sanitize_filename_part(text):
-    if not isinstance(text, str):
-        text = str(text)
-    safe_text = "".join(c if c.isalnum() or c in ['.', '-'] else '_' for c in text)
-    safe_text = re.sub(r'_+', '_', safe_text).strip('_-.')
-    return safe_text or "invalid_name"
-
-def construct_tgz_filename(name, version):
-    if not name or not version:
-        logger.error(f"Missing name ('{name}') or version ('{version}')")
-        return None
-    return f"{sanitize_filename_part(name)}-{sanitize_filename_part(version)}.tgz"
-
-def parse_package_filename(filename):
-    if not filename or not filename.endswith('.tgz'):
-        return None, None
-    base_name = filename[:-4]
-    version_pattern = r'(\d+\.\d+\.\d+)(?:-(?:preview|ballot|draft|snapshot|alpha|beta|RC\d*|buildnumbersuffix\d*|alpha\d+\.\d+\.\d+|snapshot-\d+|ballot-\d+|alpha\.\d+))?$'
-    match = None
-    for i in range(len(base_name), 0, -1):
-        substring = base_name[:i]
-        if re.search(version_pattern, substring):
-            match = re.search(version_pattern, base_name[:i])
-            if match:
-                break
-    if not match:
-        name = base_name.replace('_', '.')
-        version = ""
-        return name, version
-    version_start_idx = match.start(1)
-    name = base_name[:version_start_idx].rstrip('-').replace('_', '.')
-    version = base_name[version_start_idx:]
-    if not name or not version:
-        name = base_name.replace('_', '.')
-        version = ""
-    return name, version
-
-def get_package_description(package_name, package_version, packages_dir):
-    tgz_filename = construct_tgz_filename(package_name, package_version)
-    if not tgz_filename:
-        return "Error: Could not construct filename."
-    tgz_path = os.path.join(packages_dir, tgz_filename)
-    if not os.path.exists(tgz_path):
-        return f"Error: Package file not found."
-    try:
-        with tarfile.open(tgz_path, "r:gz") as tar:
-            pkg_json_member = next((m for m in tar if m.name == 'package/package.json'), None)
-            if pkg_json_member:
-                with tar.extractfile(pkg_json_member) as f:
-                    pkg_data = json.load(f)
-                    return pkg_data.get('description', 'No description found.')
-            return "Error: package.json not found."
-    except Exception as e:
-        logger.error(f"Error reading description: {e}")
-        return f"Error reading package details: {e}"
-
-def import_package_and_dependencies(name, version, dependency_mode='recursive'):
-    download_dir = _get_download_dir()
-    result = {
-        'requested': f"{name}#{version}",
-        'downloaded': {},
-        'dependencies': [],
-        'errors': []
-    }
-    try:
-        tgz_filename = construct_tgz_filename(name, version)
-        if not tgz_filename:
-            result['errors'].append(f"Invalid filename for {name}#{version}")
-            return result
-        tgz_path = os.path.join(download_dir, tgz_filename)
-        if os.path.exists(tgz_path):
-            result['downloaded'][name, version] = tgz_path
-            logger.info(f"Package {name}#{version} already exists at {tgz_path}")
-        else:
-            url = f"{FHIR_REGISTRY_BASE_URL}/{quote(name)}/{quote(version)}"
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            with open(tgz_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            result['downloaded'][name, version] = tgz_path
-            logger.info(f"Downloaded {name}#{version} to {tgz_path}")
-        with tarfile.open(tgz_path, "r:gz") as tar:
-            pkg_json_member = next((m for m in tar if m.name == 'package/package.json'), None)
-            if pkg_json_member:
-                with tar.extractfile(pkg_json_member) as f:
-                    pkg_data = json.load(f)
-                    dependencies = pkg_data.get('dependencies', {})
-                    for dep_name, dep_version in dependencies.items():
-                        if dependency_mode == 'recursive':
-                            dep_result = import_package_and_dependencies(dep_name, dep_version, dependency_mode)
-                            result['downloaded'].update(dep_result['downloaded'])
-                            result['dependencies'].extend(dep_result['dependencies'])
-                            result['errors'].extend(dep_result['errors'])
-                        result['dependencies'].append({'name': dep_name, 'version': dep_version})
-    except requests.HTTPError as e:
-        result['errors'].append(f"HTTP error downloading {name}#{version}: {e}")
-    except requests.RequestException as e:
-        result['errors'].append(f"Connection error downloading {name}#{version}: {e}")
-    except Exception as e:
-        result['errors'].append(f"Error importing {name}#{version}: {e}")
-        logger.error(f"Import error for {name}#{version}: {e}", exc_info=True)
-    return result
-
-def parse_test_data_folder(folder_path):
-    if not os.path.exists(folder_path):
-        logger.error(f"Test data folder not found: {folder_path}")
-        return
-    try:
-        db.session.query(TestDataResource).delete()
-        for root, _, files in os.walk(folder_path):
-            for filename in files:
-                if filename.lower().endswith('.json'):
-                    file_path = os.path.join(root, filename)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = json.load(f)
-                        resource_type = content.get('resourceType')
-                        resource_id = content.get('id')
-                        if resource_type and resource_id:
-                            existing = TestDataResource.query.filter_by(filename=filename).first()
-                            if not existing:
-                                test_resource = TestDataResource(
-                                    filename=filename,
-                                    file_path=file_path,
-                                    resource_type=resource_type,
-                                    resource_id=resource_id
-                                )
-                                db.session.add(test_resource)
-                    except Exception as e:
-                        logger.error(f"Error parsing {filename}: {e}")
-        db.session.commit()
-        logger.info(f"Parsed test data folder: {folder_path}")
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error parsing test data folder: {e}", exc_info=True)
+import requests
+import os
+import atexit
+import json
+import re
+import sys
+import functools
+import time
+import hashlib
+import datetime
+import tempfile
+import shutil
+import logging
+import multiprocessing
+import contextvars
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, Blueprint, has_app_context
+from collections import defaultdict
+from cachetools import LRUCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote
+from pathlib import Path
+from tarstream import TarStreamScanner
+from jsonstream import JsonStreamError, iter_array_member, read_top_level_fields, iter_bundle_resources, iter_ndjson_records
+from ig_analysis import is_analysis_member, analyze_chunk, merge_analysis
+from package_store import MMAP_THRESHOLD, ensure_unpacked_package, resolve_resource_path, load_resource, open_resource_bytes, remove_unpacked_package
+from models import db, CachedPackage, RegistryCacheInfo, RegistryFeedCache, RegistryFeedEntry, PackageManifest, ProcessedIg, TestDataResource, TestDataScanState, ImportJob
+
+services_bp = Blueprint('services', __name__)
+logger = logging.getLogger(__name__)
+
+FHIR_REGISTRY_BASE_URL = "https://packages.fhir.org"
+NUMERIC_VERSION_PATTERN = re.compile(r'^\d+(\.\d+)*$')
+OFFICIAL_VERSION_PATTERN = re.compile(r'^\d+\.\d+\.\d+(?:-[a-zA-Z0-9\.]+)?$')
+VERSION_KEY_CACHE_SIZE = 65536
+MANIFEST_MEMO_SIZE = 1024
+IG_RESOURCE_TYPES_MEMO_SIZE = 256
+
+try:
+    import packaging.version as pkg_version
+    HAS_PACKAGING_LIB = True
+except ImportError:
+    HAS_PACKAGING_LIB = False
+    class BasicVersion:
+        def __init__(self, v_str): self.v_str = str(v_str)
+        def __lt__(self, other): return self.v_str < str(other)
+        def __gt__(self, other): return self.v_str > str(other)
+        def __eq__(self, other): return self.v_str == str(other)
+        def __str__(self): return self.v_str
+    pkg_version = SimpleNamespace(parse=BasicVersion, InvalidVersion=ValueError)
+
+def safe_parse_version(v_str):
+    if not v_str or not isinstance(v_str, str):
+        return pkg_version.parse("0.0.0a0")
+    try:
+        return pkg_version.parse(v_str)
+    except pkg_version.InvalidVersion:
+        v_str_norm = v_str.lower()
+        base_part = v_str_norm.split('-', 1)[0] if '-' in v_str_norm else v_str_norm
+        suffix = v_str_norm.split('-', 1)[1] if '-' in v_str_norm else None
+        if NUMERIC_VERSION_PATTERN.match(base_part):
+            try:
+                if suffix in ['dev', 'snapshot', 'ci-build']: return pkg_version.parse(f"{base_part}a0")
+                elif suffix in ['draft', 'ballot', 'preview']: return pkg_version.parse(f"{base_part}b0")
+                elif suffix and suffix.startswith('rc'): return pkg_version.parse(f"{base_part}rc{''.join(filter(str.isdigit, suffix)) or '0'}")
+                return pkg_version.parse(base_part)
+            except pkg_version.InvalidVersion:
+                logger.warning(f"Invalid version '{base_part}'. Treating as alpha.")
+                return pkg_version.parse("0.0.0a0")
+        else:
+            logger.warning(f"Unparseable version '{v_str}'. Treating as alpha.")
+            return pkg_version.parse("0.0.0a0")
+
+@functools.lru_cache(maxsize=VERSION_KEY_CACHE_SIZE)
+def _version_key(v_str):
+    parsed = safe_parse_version(v_str)
+    key = getattr(parsed, '_key', None)
+    return key if key is not None else (str(parsed),)
+
+def version_key(v_str):
+    if not isinstance(v_str, str):
+        return _version_key(None)
+    return _version_key(sys.intern(v_str))
+
+def _config_value(key, default=None):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+# Set by the import job engine; long loops call it so a live job is never taken for abandoned.
+job_heartbeat = contextvars.ContextVar('job_heartbeat', default=None)
+
+def _heartbeat():
+    beat = job_heartbeat.get()
+    if beat is not None:
+        beat()
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    global _http_session
+    if _http_session is not None:
+        return _http_session
+    with _http_session_lock:
+        if _http_session is not None:
+            return _http_session
+        retries = Retry(
+            total=_config_value('FEED_FETCH_RETRIES', 2),
+            backoff_factor=_config_value('FEED_FETCH_BACKOFF', 0.5),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True
+        )
+        pool_size = max(10, _config_value('FEED_FETCH_WORKERS', 8))
+        adapter = HTTPAdapter(max_retries=retries, pool_connections=pool_size, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Accept': 'application/json'})
+        _http_session = session
+    return _http_session
+
+def get_additional_registries():
+    feed_registry_url = 'https://raw.githubusercontent.com/FHIR/ig-registry/master/package-feeds.json'
+    feeds = []
+    try:
+        response = get_http_session().get(feed_registry_url, timeout=15)
+        response.raise_for_status()
+        data = json.loads(response.text)
+        feeds = [{'name': feed['name'], 'url': feed['url']} for feed in data.get('feeds', []) if 'name' in feed and 'url' in feed]
+    except Exception as e:
+        logger.error(f"Error fetching registries: {e}", exc_info=True)
+    return feeds
+
+class FeedTooLarge(Exception):
+    pass
+
+class FeedEntryBudget:
+    # Caps the feed entries held at once across every feed of a refresh.
+    def __init__(self, limit):
+        self.limit = limit
+        self.remaining = limit
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if self.remaining <= 0:
+                raise FeedTooLarge(f"Feeds list more than {self.limit} packages in total")
+            self.remaining -= 1
+
+    def release(self, count):
+        with self._lock:
+            self.remaining = min(self.remaining + count, self.limit)
+
+class FeedReader:
+    def __init__(self, response, max_bytes, chunk_size=64 * 1024):
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise FeedTooLarge(f"Feed declares {content_length} bytes, limit is {max_bytes}")
+        self.chunks = response.iter_content(chunk_size)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = next(self.chunks, b'')
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise FeedTooLarge(f"Feed exceeds {self.max_bytes} bytes")
+        self.sha256.update(chunk)
+        return chunk
+
+    def content_hash(self):
+        return self.sha256.hexdigest()
+
+def iter_feed_packages(reader, max_entry_bytes, max_packages, budget=None):
+    count = 0
+    for entry in iter_array_member(reader, 'packages', max_entry_bytes):
+        count += 1
+        if count > max_packages:
+            raise FeedTooLarge(f"Feed lists more than {max_packages} packages")
+        if isinstance(entry, dict) and entry.get('name'):
+            if budget is not None:
+                budget.take()
+            yield entry
+    # Whatever follows the packages array still counts towards the content hash.
+    while reader.read():
+        pass
+
+def fetch_feed(feed, session=None, timeout=None, validators=None, budget=None):
+    session = session or get_http_session()
+    timeout = timeout or (_config_value('FEED_CONNECT_TIMEOUT', 5), _config_value('FEED_READ_TIMEOUT', 30))
+    validators = validators or {}
+    report = {'name': feed['name'], 'url': feed['url'], 'status': 'error', 'http_status': None,
+              'elapsed': 0.0, 'packages': 0, 'error': None,
+              'etag': validators.get('etag'), 'last_modified': validators.get('last_modified'),
+              'content_hash': validators.get('content_hash')}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    entries = []
+    started = time.monotonic()
+    try:
+        with session.get(feed['url'], timeout=timeout, headers=headers, stream=True) as response:
+            report['http_status'] = response.status_code
+            if response.status_code == 304:
+                report['status'] = 'not_modified'
+            else:
+                response.raise_for_status()
+                report['etag'] = response.headers.get('ETag')
+                report['last_modified'] = response.headers.get('Last-Modified')
+                # Entries are parsed as they arrive; the raw body and the full JSON tree are never held.
+                try:
+                    reader = FeedReader(response, _config_value('FEED_MAX_BYTES', 256 * 1024 * 1024),
+                                        _config_value('FEED_READ_CHUNK_SIZE', 64 * 1024))
+                    for entry in iter_feed_packages(reader, _config_value('FEED_MAX_ENTRY_BYTES', 1024 * 1024),
+                                                    _config_value('FEED_MAX_PACKAGES', 500000), budget):
+                        entries.append(entry)
+                except (JsonStreamError, FeedTooLarge) as e:
+                    if budget is not None:
+                        budget.release(len(entries))
+                    entries = []
+                    report['error'] = f"Rejected feed: {e}"
+                    logger.warning(f"Rejected feed {feed['name']}: {e}")
+                else:
+                    content_hash = reader.content_hash()
+                    if content_hash == validators.get('content_hash'):
+                        if budget is not None:
+                            budget.release(len(entries))
+                        entries = []
+                        report['status'] = 'unchanged'
+                    else:
+                        report['content_hash'] = content_hash
+                        report['status'] = 'ok'
+                        report['packages'] = len(entries)
+    except Exception as e:
+        if budget is not None:
+            budget.release(len(entries))
+        entries = []
+        report['error'] = str(e)
+        logger.error(f"Error fetching feed {feed['name']}: {e}")
+    report['elapsed'] = round(time.monotonic() - started, 3)
+    return entries, report
+
+def fetch_registry_feeds(feeds, max_workers=None, deadline=None, validators=None):
+    max_workers = max_workers or _config_value('FEED_FETCH_WORKERS', 8)
+    deadline = deadline or _config_value('FEED_FETCH_DEADLINE', 60)
+    timeout = (_config_value('FEED_CONNECT_TIMEOUT', 5), _config_value('FEED_READ_TIMEOUT', 30))
+    session = get_http_session()
+    budget = FeedEntryBudget(_config_value('FEED_MAX_RETAINED_ENTRIES', 1000000))
+    results = []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(feeds) or 1)), thread_name_prefix='feed-fetch')
+    try:
+        validators = validators or {}
+        futures = {
+            executor.submit(contextvars.copy_context().run, fetch_feed, feed, session, timeout,
+                            validators.get(feed['url']), budget): feed
+            for feed in feeds
+        }
+        done, pending = wait(futures, timeout=deadline)
+        for future, feed in futures.items():
+            if future in done:
+                results.append(future.result())
+            else:
+                future.cancel()
+                logger.error(f"Feed {feed['name']} did not complete within {deadline}s; skipping.")
+                results.append(([], {'name': feed['name'], 'url': feed['url'], 'status': 'timeout', 'http_status': None,
+                                     'elapsed': float(deadline), 'packages': 0, 'error': f"Exceeded {deadline}s deadline",
+                                     'etag': None, 'last_modified': None, 'content_hash': None}))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def log_feed_report(report):
+    for entry in report:
+        if entry['status'] == 'ok':
+            logger.info(f"Feed {entry['name']}: {entry['packages']} packages in {entry['elapsed']:.2f}s")
+        elif entry['status'] in ('not_modified', 'unchanged'):
+            logger.info(f"Feed {entry['name']}: unchanged ({entry['status']}) in {entry['elapsed']:.2f}s")
+        else:
+            logger.info(f"Feed {entry['name']}: {entry['status']} after {entry['elapsed']:.2f}s ({entry['error']})")
+
+def group_feed_entries(feed_entries, search_term=''):
+    packages_dict = defaultdict(list)
+    for pkg in feed_entries:
+        if search_term and search_term.lower() not in pkg['name'].lower():
+            continue
+        packages_dict[pkg['name']].append(pkg)
+    packages = []
+    for pkg_name, entries in packages_dict.items():
+        versions = [{"version": entry.get('version', ''), "pubDate": entry.get('pubDate', '')} for entry in entries if entry.get('version')]
+        versions.sort(key=lambda x: x.get('pubDate', ''), reverse=True)
+        if not versions:
+            continue
+        latest_entry = entries[0]
+        package = {
+            'name': pkg_name,
+            'version': latest_entry.get('version', ''),
+            'author': latest_entry.get('author', ''),
+            'fhirVersion': latest_entry.get('fhirVersion', ''),
+            'url': latest_entry.get('url', ''),
+            'canonical': latest_entry.get('canonical', ''),
+            'dependencies': latest_entry.get('dependencies', []),
+            'versions': versions,
+            'registry': latest_entry.get('registry', '')
+        }
+        packages.append(package)
+    return packages
+
+def fetch_packages_from_registries(search_term='', report=None):
+    feed_registries = get_additional_registries()
+    if not feed_registries:
+        logger.warning("No registries available.")
+        return []
+    feed_entries = []
+    for entries, feed_report in fetch_registry_feeds(feed_registries):
+        if report is not None:
+            report.append(feed_report)
+        feed_entries.extend(entries)
+    return group_feed_entries(feed_entries, search_term=search_term)
+
+def normalize_package_data(raw_packages):
+    packages_grouped = defaultdict(list)
+    for entry in raw_packages:
+        if not isinstance(entry, dict):
+            continue
+        raw_name = entry.get('name') or entry.get('title') or ''
+        name_part = raw_name.split('#', 1)[0].strip().lower()
+        if name_part:
+            packages_grouped[name_part].append(entry)
+    normalized_list = []
+    for name_key, entries in packages_grouped.items():
+        latest_absolute_data = None
+        latest_official_data = None
+        latest_absolute_key = None
+        latest_official_key = None
+        all_versions = []
+        package_name_display = name_key
+        processed_versions = set()
+        for package_entry in entries:
+            for version_info in package_entry.get('versions', []):
+                if isinstance(version_info, dict) and 'version' in version_info:
+                    listed_version = version_info.get('version', '')
+                    if listed_version and listed_version not in processed_versions:
+                        all_versions.append(version_info)
+                        processed_versions.add(listed_version)
+            raw_name = package_entry.get('name') or package_entry.get('title') or ''
+            version_str = package_entry.get('version')
+            entry_with_version = package_entry
+            if not version_str:
+                version_str = raw_name.split('#')[1] if '#' in raw_name else ''
+                if not version_str:
+                    continue
+                entry_with_version = dict(package_entry, version=version_str)
+            current_display_name = raw_name.split('#')[0].strip()
+            if current_display_name and current_display_name != name_key:
+                package_name_display = current_display_name
+            current_key = version_key(version_str)
+            if latest_absolute_data is None or current_key > latest_absolute_key:
+                latest_absolute_key = current_key
+                latest_absolute_data = entry_with_version
+            if isinstance(version_str, str) and OFFICIAL_VERSION_PATTERN.match(version_str):
+                if latest_official_data is None or current_key > latest_official_key:
+                    latest_official_key = current_key
+                    latest_official_data = entry_with_version
+        if latest_absolute_data:
+            final_absolute_version = latest_absolute_data.get('version', 'unknown')
+            final_official_version = latest_official_data.get('version') if latest_official_data else None
+            author = str(latest_absolute_data.get('author') or '')
+            fhir_version = latest_absolute_data.get('fhirVersion') or 'unknown'
+            url = str(latest_absolute_data.get('url') or '')
+            canonical = str(latest_absolute_data.get('canonical') or url)
+            dependencies = []
+            dependencies_raw = latest_absolute_data.get('dependencies', [])
+            if isinstance(dependencies_raw, dict):
+                dependencies = [{"name": str(dn), "version": str(dv)} for dn, dv in dependencies_raw.items()]
+            elif isinstance(dependencies_raw, list):
+                for dep in dependencies_raw:
+                    if isinstance(dep, str) and '@' in dep:
+                        dep_name, dep_version = dep.split('@', 1)
+                        dependencies.append({"name": dep_name, "version": dep_version})
+                    elif isinstance(dep, dict) and 'name' in dep:
+                        dependencies.append(dep)
+            all_versions.sort(key=lambda x: x.get('pubDate', ''), reverse=True)
+            normalized_entry = {
+                'name': package_name_display,
+                'version': final_absolute_version,
+                'latest_absolute_version': final_absolute_version,
+                'latest_official_version': final_official_version,
+                'author': author.strip(),
+                'fhir_version': fhir_version.strip(),
+                'url': url.strip(),
+                'canonical': canonical.strip(),
+                'dependencies': dependencies,
+                'version_count': len(all_versions),
+                'all_versions': all_versions,
+                'registry': latest_absolute_data.get('registry', ''),
+                'display_version': final_official_version or final_absolute_version or 'N/A'
+            }
+            normalized_list.append(normalized_entry)
+    normalized_list.sort(key=lambda x: x.get('name', '').lower())
+    return normalized_list
+
+def cached_package_to_dict(pkg):
+    return {
+        'name': pkg.package_name,
+        'version': pkg.version,
+        'latest_absolute_version': pkg.latest_absolute_version,
+        'latest_official_version': pkg.latest_official_version,
+        'author': pkg.author or '',
+        'fhir_version': pkg.fhir_version or '',
+        'url': pkg.url or '',
+        'canonical': pkg.canonical or '',
+        'dependencies': pkg.dependencies or [],
+        'version_count': pkg.version_count or 1,
+        'all_versions': pkg.all_versions or [{'version': pkg.version, 'pubDate': ''}],
+        'registry': pkg.registry or '',
+        'display_version': pkg.latest_official_version or pkg.latest_absolute_version or 'N/A'
+    }
+
+def load_package_versions_data(name):
+    # Raw feed entries are only needed on demand, so they stay in the stored feeds instead of the catalog.
+    key = (name or '').strip().lower()
+    versions_data = []
+    rows = RegistryFeedEntry.query.filter_by(package_name_lower=key).order_by(RegistryFeedEntry.feed_url).all()
+    for row in rows:
+        for entry in row.entries or []:
+            if not isinstance(entry, dict):
+                continue
+            if not entry.get('version'):
+                raw_name = entry.get('name') or entry.get('title') or ''
+                if '#' not in raw_name:
+                    continue
+                entry = dict(entry, version=raw_name.split('#', 1)[1])
+            versions_data.append(entry)
+    versions_data.sort(key=lambda entry: version_key(entry['version']), reverse=True)
+    return versions_data
+
+def load_cached_packages(registry=None, fhir_version=None):
+    query = CachedPackage.query
+    if registry is not None:
+        query = query.filter_by(registry=registry)
+    if fhir_version is not None:
+        query = query.filter_by(fhir_version=fhir_version)
+    cached_packages = query.order_by(CachedPackage.package_name_lower).all()
+    return [cached_package_to_dict(pkg) for pkg in cached_packages]
+
+CACHED_PACKAGE_UPDATE_COLUMNS = (
+    'author', 'fhir_version', 'version_count', 'url', 'all_versions', 'dependencies',
+    'latest_absolute_version', 'latest_official_version', 'canonical', 'registry'
+)
+
+def _cached_package_row(package):
+    return {
+        'package_name': package['name'],
+        'package_name_lower': package['name'].lower(),
+        'version': package['version'],
+        'author': package['author'],
+        'fhir_version': package['fhir_version'],
+        'version_count': package['version_count'],
+        'url': package['url'],
+        'all_versions': package['all_versions'],
+        'dependencies': package['dependencies'],
+        'latest_absolute_version': package['latest_absolute_version'],
+        'latest_official_version': package['latest_official_version'],
+        'canonical': package['canonical'],
+        'registry': package.get('registry', '')
+    }
+
+def _dialect_insert(dialect_name):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+def cache_packages(normalized_packages, db, CachedPackage, commit=True):
+    batch_size = _config_value('CACHE_UPSERT_BATCH_SIZE', 500)
+    rows = {}
+    for package in normalized_packages:
+        row = _cached_package_row(package)
+        rows[row['package_name'], row['version']] = row
+    rows = list(rows.values())
+    stats = {'inserted': 0, 'updated': 0}
+    try:
+        existing = {
+            (name, version): pkg_id
+            for pkg_id, name, version in db.session.query(CachedPackage.id, CachedPackage.package_name, CachedPackage.version)
+        }
+        stats['updated'] = sum(1 for row in rows if (row['package_name'], row['version']) in existing)
+        stats['inserted'] = len(rows) - stats['updated']
+        dialect_insert = _dialect_insert(db.session.get_bind().dialect.name)
+        if dialect_insert is not None:
+            stmt = dialect_insert(CachedPackage)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['package_name', 'version'],
+                set_={column: stmt.excluded[column] for column in CACHED_PACKAGE_UPDATE_COLUMNS}
+            )
+            for i in range(0, len(rows), batch_size):
+                db.session.execute(stmt, rows[i:i + batch_size])
+        else:
+            inserts = [row for row in rows if (row['package_name'], row['version']) not in existing]
+            updates = [
+                dict(row, id=existing[row['package_name'], row['version']])
+                for row in rows if (row['package_name'], row['version']) in existing
+            ]
+            for i in range(0, len(inserts), batch_size):
+                db.session.execute(db.insert(CachedPackage), inserts[i:i + batch_size])
+            for i in range(0, len(updates), batch_size):
+                db.session.execute(db.update(CachedPackage), updates[i:i + batch_size])
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error caching packages: {e}")
+        raise
+    return stats
+
+def _package_key(entry):
+    raw_name = entry.get('name') or entry.get('title') or ''
+    return raw_name.split('#', 1)[0].strip().lower()
+
+def _group_hash(entries):
+    payload = json.dumps(entries, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _group_by_key(entries, groups=None):
+    groups = groups if groups is not None else defaultdict(list)
+    for entry in entries:
+        key = _package_key(entry)
+        if key:
+            groups[key].append(entry)
+    return groups
+
+def _merge_groups(source, groups):
+    for key, entries in source.items():
+        groups[key].extend(entries)
+    return groups
+
+def _load_stored_feed_groups():
+    stored = defaultdict(dict)
+    for feed_url, key, entries in db.session.query(
+            RegistryFeedEntry.feed_url, RegistryFeedEntry.package_name_lower, RegistryFeedEntry.entries
+    ).order_by(RegistryFeedEntry.id):
+        stored[feed_url][key] = entries or []
+    return stored
+
+def _store_feed_groups(feed_url, groups):
+    batch_size = _config_value('CACHE_UPSERT_BATCH_SIZE', 500)
+    RegistryFeedEntry.query.filter_by(feed_url=feed_url).delete(synchronize_session=False)
+    rows = [{'feed_url': feed_url, 'package_name_lower': key, 'entries': entries} for key, entries in groups.items()]
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(RegistryFeedEntry), rows[i:i + batch_size])
+
+def refresh_package_cache(current_packages=None):
+    result = {
+        'fetch_failed': False,
+        'added': 0,
+        'changed': 0,
+        'removed': 0,
+        'feeds': [],
+        'packages': current_packages,
+        'timestamp': None
+    }
+    feeds = get_additional_registries()
+    if not feeds:
+        logger.warning("No registries available.")
+        result['fetch_failed'] = True
+        return result
+    states = {state.feed_url: state for state in RegistryFeedCache.query.all()}
+    validators = {
+        url: {'etag': state.etag, 'last_modified': state.last_modified, 'content_hash': state.content_hash}
+        for url, state in states.items()
+    }
+    feed_results = fetch_registry_feeds(feeds, validators=validators)
+    result['feeds'] = [feed_report for _, feed_report in feed_results]
+    if not any(report['status'] in ('ok', 'not_modified', 'unchanged') for report in result['feeds']):
+        logger.warning("No registry feed could be fetched; keeping the existing cache.")
+        result['fetch_failed'] = True
+        return result
+
+    current_urls = {feed['url'] for feed in feeds}
+    new_groups = defaultdict(list)
+    old_groups = defaultdict(list)
+    touched_keys = set()
+    changed_reports = []
+    stored_groups = _load_stored_feed_groups()
+    for entries, report in feed_results:
+        stored = stored_groups.get(report['url'], {})
+        if report['status'] == 'ok':
+            feed_groups = _group_by_key(entries)
+            changed_reports.append((report, feed_groups))
+            touched_keys.update(feed_groups.keys())
+            touched_keys.update(stored.keys())
+            _merge_groups(feed_groups, new_groups)
+        else:
+            _merge_groups(stored, new_groups)
+        _merge_groups(stored, old_groups)
+    for key in [key for key, entries in new_groups.items() if not any(entry.get('version') for entry in entries)]:
+        del new_groups[key]
+    for url in states:
+        if url not in current_urls:
+            stale_groups = stored_groups.get(url, {})
+            touched_keys.update(stale_groups.keys())
+            _merge_groups(stale_groups, old_groups)
+
+    db_keys = {name for (name,) in db.session.query(CachedPackage.package_name_lower).distinct() if name}
+    new_keys = set(new_groups.keys())
+    added_keys = new_keys - db_keys
+    removed_keys = db_keys - new_keys
+    kept_keys = set()
+    unattributed = [report['name'] for _, report in feed_results
+                    if report['status'] not in ('ok', 'not_modified', 'unchanged') and report['url'] not in states]
+    if unattributed and removed_keys:
+        # A failed feed with no stored state (e.g. the first refresh of an upgraded DB) cannot be told
+        # apart from a removed one, so keep every cached package that might have come from it.
+        logger.warning(f"Keeping {len(removed_keys)} cached packages: no stored state for failed feeds {', '.join(unattributed)}")
+        kept_keys, removed_keys = removed_keys, set()
+    changed_keys = {
+        key for key in (touched_keys & new_keys & db_keys)
+        if key not in old_groups or _group_hash(old_groups[key]) != _group_hash(new_groups[key])
+    }
+    result['added'] = len(added_keys)
+    result['changed'] = len(changed_keys)
+    result['removed'] = len(removed_keys)
+
+    try:
+        rebuild_keys = added_keys | changed_keys
+        if current_packages is None:
+            rebuild_keys = new_keys
+        normalized_updates = normalize_package_data(
+            group_feed_entries([entry for key in rebuild_keys for entry in new_groups[key]])
+        )
+        stale_keys = list(changed_keys | removed_keys)
+        for i in range(0, len(stale_keys), 500):
+            chunk = stale_keys[i:i + 500]
+            CachedPackage.query.filter(CachedPackage.package_name_lower.in_(chunk)).delete(synchronize_session=False)
+        if normalized_updates:
+            db_updates = [pkg for pkg in normalized_updates if pkg['name'].lower() in added_keys or pkg['name'].lower() in changed_keys]
+            cache_packages(db_updates, db, CachedPackage, commit=False)
+        now_ts = datetime.datetime.now(datetime.timezone.utc)
+        for report, feed_groups in changed_reports:
+            state = states.get(report['url'])
+            if state is None:
+                state = RegistryFeedCache(feed_url=report['url'])
+                db.session.add(state)
+            state.feed_name = report['name']
+            state.etag = report['etag']
+            state.last_modified = report['last_modified']
+            state.content_hash = report['content_hash']
+            state.last_fetch_timestamp = now_ts
+            _store_feed_groups(report['url'], feed_groups)
+        for report in result['feeds']:
+            state = states.get(report['url'])
+            if state is not None and report['status'] in ('not_modified', 'unchanged'):
+                state.last_fetch_timestamp = now_ts
+        for url, state in states.items():
+            if url not in current_urls:
+                RegistryFeedEntry.query.filter_by(feed_url=url).delete(synchronize_session=False)
+                db.session.delete(state)
+        timestamp_info = RegistryCacheInfo.query.first()
+        if timestamp_info:
+            timestamp_info.last_fetch_timestamp = now_ts
+        else:
+            db.session.add(RegistryCacheInfo(last_fetch_timestamp=now_ts))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error applying registry refresh: {e}", exc_info=True)
+        raise
+
+    if current_packages is None:
+        packages = normalized_updates
+        if kept_keys:
+            kept_keys = list(kept_keys)
+            for i in range(0, len(kept_keys), 500):
+                chunk = kept_keys[i:i + 500]
+                packages.extend(cached_package_to_dict(row) for row in
+                                CachedPackage.query.filter(CachedPackage.package_name_lower.in_(chunk)))
+            packages.sort(key=lambda x: x.get('name', '').lower())
+    else:
+        dropped = added_keys | changed_keys | removed_keys
+        packages = [pkg for pkg in current_packages if pkg.get('name', '').lower() not in dropped]
+        packages.extend(normalized_updates)
+        packages.sort(key=lambda x: x.get('name', '').lower())
+    result['packages'] = packages
+    result['timestamp'] = now_ts
+    logger.info(f"Registry refresh: {result['added']} added, {result['changed']} changed, {result['removed']} removed")
+    return result
+
+def _get_download_dir():
+    packages_dir = current_app.config.get('FHIR_PACKAGES_DIR')
+    os.makedirs(packages_dir, exist_ok=True)
+    return packages_dir
+
+def sanitize_filename_part(text):
+    if not isinstance(text, str):
+        text = str(text)
+    safe_text = "".join(c if c.isalnum() or c in ['.', '-'] else '_' for c in text)
+    safe_text = re.sub(r'_+', '_', safe_text).strip('_-.')
+    return safe_text or "invalid_name"
+
+def construct_tgz_filename(name, version):
+    if not name or not version:
+        logger.error(f"Missing name ('{name}') or version ('{version}')")
+        return None
+    return f"{sanitize_filename_part(name)}-{sanitize_filename_part(version)}.tgz"
+
+def parse_package_filename(filename):
+    if not filename or not filename.endswith('.tgz'):
+        return None, None
+    base_name = filename[:-4]
+    version_pattern = r'(\d+\.\d+\.\d+)(?:-(?:preview|ballot|draft|snapshot|alpha|beta|RC\d*|buildnumbersuffix\d*|alpha\d+\.\d+\.\d+|snapshot-\d+|ballot-\d+|alpha\.\d+))?$'
+    match = None
+    for i in range(len(base_name), 0, -1):
+        substring = base_name[:i]
+        if re.search(version_pattern, substring):
+            match = re.search(version_pattern, base_name[:i])
+            if match:
+                break
+    if not match:
+        name = base_name.replace('_', '.')
+        version = ""
+        return name, version
+    version_start_idx = match.start(1)
+    name = base_name[:version_start_idx].rstrip('-').replace('_', '.')
+    version = base_name[version_start_idx:]
+    if not name or not version:
+        name = base_name.replace('_', '.')
+        version = ""
+    return name, version
+
+MANIFEST_MEMBERS = ('package/package.json', 'package/.index.json')
+
+_manifest_memo = LRUCache(maxsize=MANIFEST_MEMO_SIZE)
+_manifest_memo_lock = threading.Lock()
+
+def _load_member_json(members, name):
+    data = members.get(name)
+    return json.loads(data) if data else None
+
+def _summarize_index(index_data):
+    files = [f for f in ((index_data or {}).get('files') or []) if isinstance(f, dict)]
+    resource_counts = defaultdict(int)
+    for entry in files:
+        if entry.get('resourceType'):
+            resource_counts[entry['resourceType']] += 1
+    return files, dict(resource_counts)
+
+def scan_package_tarball(tgz_path):
+    chunk_size = _config_value('DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+    scanner = TarStreamScanner(capture=MANIFEST_MEMBERS)
+    sha256 = hashlib.sha256()
+    with open(tgz_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+            scanner.feed(chunk)
+    scanner.close()
+    return {
+        'sha256': sha256.hexdigest(),
+        'manifest': _load_member_json(scanner.members, 'package/package.json'),
+        'index': _load_member_json(scanner.members, 'package/.index.json'),
+        'member_count': scanner.member_count,
+        'uncompressed_size': scanner.uncompressed_size
+    }
+
+def _manifest_record(row):
+    return {
+        'tgz_filename': row.tgz_filename,
+        'package_name': row.package_name,
+        'version': row.version,
+        'size': row.file_size,
+        'sha256': row.sha256,
+        'package_json': row.package_json or {},
+        'files': row.files or [],
+        'resource_counts': row.resource_counts or {},
+        'member_count': row.member_count,
+        'uncompressed_size': row.uncompressed_size
+    }
+
+def store_package_manifest(tgz_path, scan):
+    stat = os.stat(tgz_path)
+    tgz_filename = os.path.basename(tgz_path)
+    package_json = scan.get('manifest') or {}
+    files, resource_counts = _summarize_index(scan.get('index'))
+    row = PackageManifest.query.filter_by(tgz_filename=tgz_filename).first()
+    if row is None:
+        row = PackageManifest(tgz_filename=tgz_filename)
+        db.session.add(row)
+    row.package_name = package_json.get('name')
+    row.version = package_json.get('version')
+    row.file_size = stat.st_size
+    row.file_mtime_ns = stat.st_mtime_ns
+    row.sha256 = scan.get('sha256')
+    row.package_json = package_json
+    row.files = files
+    row.resource_counts = resource_counts
+    row.member_count = scan.get('member_count')
+    row.uncompressed_size = scan.get('uncompressed_size')
+    row.indexed_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+    record = _manifest_record(row)
+    with _manifest_memo_lock:
+        _manifest_memo[tgz_filename] = (stat.st_mtime_ns, stat.st_size, record)
+    return record
+
+def get_package_manifest(tgz_path):
+    stat = os.stat(tgz_path)
+    tgz_filename = os.path.basename(tgz_path)
+    with _manifest_memo_lock:
+        memo = _manifest_memo.get(tgz_filename)
+    if memo and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+        return memo[2]
+    row = PackageManifest.query.filter_by(tgz_filename=tgz_filename).first()
+    if row is not None and row.file_mtime_ns == stat.st_mtime_ns and row.file_size == stat.st_size:
+        record = _manifest_record(row)
+        with _manifest_memo_lock:
+            _manifest_memo[tgz_filename] = (stat.st_mtime_ns, stat.st_size, record)
+        return record
+    logger.info(f"Indexing package manifest for {tgz_filename}")
+    return store_package_manifest(tgz_path, scan_package_tarball(tgz_path))
+
+def get_package_description(package_name, package_version, packages_dir):
+    tgz_filename = construct_tgz_filename(package_name, package_version)
+    if not tgz_filename:
+        return "Error: Could not construct filename."
+    tgz_path = os.path.join(packages_dir, tgz_filename)
+    if not os.path.exists(tgz_path):
+        return f"Error: Package file not found."
+    try:
+        if _config_value('PACKAGE_STORE_ENABLED', False):
+            pkg_data = read_package_resource(package_name, package_version, path='package.json')
+        else:
+            pkg_data = get_package_manifest(tgz_path)['package_json']
+        if not pkg_data:
+            return "Error: package.json not found."
+        return pkg_data.get('description', 'No description found.')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error reading description: {e}")
+        return f"Error reading package details: {e}"
+
+def download_package_tarball(url, tgz_path, session):
+    chunk_size = _config_value('DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+    scanner = TarStreamScanner(capture=MANIFEST_MEMBERS)
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(tgz_path), prefix=f".{os.path.basename(tgz_path)}.", suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with session.get(url, stream=True, timeout=(10, 60)) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    scanner.feed(chunk)
+                    _heartbeat()
+                expected = response.headers.get('Content-Length')
+                if expected and not response.headers.get('Content-Encoding') and int(expected) != size:
+                    raise IOError(f"Incomplete download: received {size} of {expected} bytes")
+            scanner.close()
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, tgz_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return {
+        'size': size,
+        'sha256': sha256.hexdigest(),
+        'manifest': _load_member_json(scanner.members, 'package/package.json'),
+        'index': _load_member_json(scanner.members, 'package/.index.json'),
+        'member_count': scanner.member_count,
+        'uncompressed_size': scanner.uncompressed_size
+    }
+
+def _download_package(name, version, tgz_path, session, store_dir=None):
+    base_url = _config_value('FHIR_REGISTRY_BASE_URL', FHIR_REGISTRY_BASE_URL).rstrip('/')
+    url = f"{base_url}/{quote(name)}/{quote(version)}"
+    download = download_package_tarball(url, tgz_path, session)
+    logger.info(f"Downloaded {name}#{version} to {tgz_path} ({download['size']} bytes, sha256 {download['sha256'][:12]})")
+    if store_dir:
+        try:
+            ensure_unpacked_package(tgz_path, store_dir)
+        except Exception as e:
+            logger.error(f"Could not unpack {name}#{version} into the package store: {e}")
+    return download
+
+def get_package_store_dir():
+    return os.path.join(_get_download_dir(), 'unpacked')
+
+def get_unpacked_package(name, version):
+    tgz_filename = construct_tgz_filename(name, version)
+    if not tgz_filename:
+        raise ValueError(f"Invalid filename for {name}#{version}")
+    tgz_path = os.path.join(_get_download_dir(), tgz_filename)
+    if not os.path.exists(tgz_path):
+        raise FileNotFoundError(f"Package {name}#{version} has not been downloaded")
+    return ensure_unpacked_package(tgz_path, get_package_store_dir())
+
+def get_package_resource_path(name, version, path=None, resource_type=None, resource_id=None, canonical=None):
+    index = get_unpacked_package(name, version)
+    return resolve_resource_path(index, path=path, resource_type=resource_type, resource_id=resource_id, canonical=canonical)
+
+def read_package_resource(name, version, path=None, resource_type=None, resource_id=None, canonical=None):
+    full_path = get_package_resource_path(name, version, path, resource_type, resource_id, canonical)
+    return load_resource(full_path) if full_path else None
+
+def read_package_resource_bytes(name, version, path=None, resource_type=None, resource_id=None, canonical=None):
+    full_path = get_package_resource_path(name, version, path, resource_type, resource_id, canonical)
+    if not full_path:
+        return None
+    return open_resource_bytes(full_path, _config_value('PACKAGE_STORE_MMAP_THRESHOLD', MMAP_THRESHOLD))
+
+def _fetch_error_message(name, version, error):
+    if isinstance(error, requests.HTTPError):
+        return f"HTTP error downloading {name}#{version}: {error}"
+    if isinstance(error, requests.RequestException):
+        return f"Connection error downloading {name}#{version}: {error}"
+    return f"Error importing {name}#{version}: {error}"
+
+def _find_dependency_cycles(edges):
+    adjacency = defaultdict(list)
+    for edge in edges:
+        adjacency[edge['from']].append(edge['to'])
+    cycles = []
+    order = []
+    state = {}
+    for root in list(adjacency.keys()):
+        if root in state:
+            continue
+        state[root] = 'active'
+        path = [root]
+        stack = [(root, iter(adjacency[root]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                path.pop()
+                state[node] = 'done'
+                order.append(node)
+            elif state.get(child) == 'active':
+                cycles.append(path[path.index(child):] + [child])
+            elif child not in state:
+                state[child] = 'active'
+                path.append(child)
+                stack.append((child, iter(adjacency[child])))
+    return cycles, order
+
+def resolve_package_graph(name, version, dependency_mode='recursive', max_workers=None, progress=None):
+    download_dir = _get_download_dir()
+    max_workers = max_workers or _config_value('IMPORT_MAX_WORKERS', 4)
+    session = get_http_session()
+    store_dir = get_package_store_dir() if _config_value('PACKAGE_STORE_ENABLED', False) else None
+    root_key = f"{name}#{version}"
+    graph = {'root': root_key, 'nodes': {}, 'edges': [], 'waves': [], 'order': [], 'cycles': []}
+    packages = {}
+    errors = []
+    seen = {(name, version)}
+    wave = [(name, version)]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='pkg-fetch') as executor:
+        while wave:
+            graph['waves'].append([f"{n}#{v}" for n, v in wave])
+            pending = {}
+            for pkg_name, pkg_version in wave:
+                tgz_filename = construct_tgz_filename(pkg_name, pkg_version)
+                if tgz_filename and not os.path.exists(os.path.join(download_dir, tgz_filename)):
+                    tgz_path = os.path.join(download_dir, tgz_filename)
+                    pending[pkg_name, pkg_version] = executor.submit(
+                        contextvars.copy_context().run, _download_package, pkg_name, pkg_version, tgz_path, session, store_dir)
+            next_wave = []
+            for pkg_name, pkg_version in wave:
+                key = f"{pkg_name}#{pkg_version}"
+                try:
+                    tgz_filename = construct_tgz_filename(pkg_name, pkg_version)
+                    if not tgz_filename:
+                        raise ValueError(f"Invalid filename for {key}")
+                    tgz_path = os.path.join(download_dir, tgz_filename)
+                    future = pending.get((pkg_name, pkg_version))
+                    if future is None:
+                        logger.info(f"Package {key} already exists at {tgz_path}")
+                        record = get_package_manifest(tgz_path)
+                        package = {'path': tgz_path, 'downloaded': False, 'size': record['size'],
+                                   'sha256': record['sha256'], 'manifest': record['package_json']}
+                    else:
+                        download = future.result()
+                        store_package_manifest(tgz_path, download)
+                        package = dict(download, path=tgz_path, downloaded=True)
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(_fetch_error_message(pkg_name, pkg_version, e))
+                    if not isinstance(e, requests.RequestException):
+                        logger.error(f"Import error for {key}: {e}", exc_info=True)
+                    graph['nodes'][key] = {'name': pkg_name, 'version': pkg_version, 'status': 'error'}
+                    if progress is not None:
+                        progress(len(graph['nodes']), len(seen))
+                    continue
+                packages[pkg_name, pkg_version] = package
+                graph['nodes'][key] = {
+                    'name': pkg_name,
+                    'version': pkg_version,
+                    'status': 'downloaded' if package['downloaded'] else 'cached',
+                    'path': package['path'],
+                    'size': package['size'],
+                    'sha256': package['sha256']
+                }
+                dependencies = (package['manifest'] or {}).get('dependencies') or {}
+                for dep_name, dep_version in dependencies.items():
+                    graph['edges'].append({'from': key, 'to': f"{dep_name}#{dep_version}"})
+                    if dependency_mode in ('recursive', 'tree-shaking') and (dep_name, dep_version) not in seen:
+                        seen.add((dep_name, dep_version))
+                        next_wave.append((dep_name, dep_version))
+                if progress is not None:
+                    progress(len(graph['nodes']), len(seen))
+            wave = next_wave
+    graph['cycles'], graph['order'] = _find_dependency_cycles(graph['edges'])
+    if root_key not in graph['order']:
+        graph['order'].append(root_key)
+    for cycle in graph['cycles']:
+        logger.warning(f"Dependency cycle detected: {' -> '.join(cycle)}")
+    return graph, packages, errors
+
+SHAKE_SEED_TYPES = ('StructureDefinition', 'ValueSet', 'CodeSystem', 'SearchParameter', 'CapabilityStatement')
+
+def _strip_canonical_version(url):
+    return url.split('|', 1)[0] if isinstance(url, str) else None
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _collect_canonical_references(resource):
+    references = set()
+    def add(value):
+        # STU3 carries some of these as Reference elements rather than canonical strings.
+        if isinstance(value, dict):
+            value = value.get('reference')
+        url = _strip_canonical_version(value)
+        if url:
+            references.add(url)
+    resource_type = resource.get('resourceType')
+    if resource_type == 'StructureDefinition':
+        add(resource.get('baseDefinition'))
+        for section in ('snapshot', 'differential'):
+            for element in (resource.get(section) or {}).get('element', []):
+                for element_type in element.get('type', []) or []:
+                    for profile in _as_list(element_type.get('profile')) + _as_list(element_type.get('targetProfile')):
+                        add(profile)
+                binding = element.get('binding') or {}
+                add(binding.get('valueSet'))
+                add(binding.get('valueSetReference'))
+                add(binding.get('valueSetUri'))
+    elif resource_type == 'ValueSet':
+        for section in ('include', 'exclude'):
+            for include in (resource.get('compose') or {}).get(section, []):
+                add(include.get('system'))
+                for value_set in _as_list(include.get('valueSet')):
+                    add(value_set)
+    elif resource_type == 'CodeSystem':
+        add(resource.get('supplements'))
+    elif resource_type == 'SearchParameter':
+        add(resource.get('derivedFrom'))
+    elif resource_type == 'CapabilityStatement':
+        for rest in resource.get('rest', []):
+            for rest_resource in rest.get('resource', []):
+                add(rest_resource.get('profile'))
+                for profile in _as_list(rest_resource.get('supportedProfile')):
+                    add(profile)
+                for search_param in rest_resource.get('searchParam', []) or []:
+                    add(search_param.get('definition'))
+    return references
+
+def read_tarball_members(tgz_path, members):
+    if _config_value('PACKAGE_STORE_ENABLED', False):
+        index = ensure_unpacked_package(tgz_path, get_package_store_dir())
+        found = {}
+        for member in members:
+            full_path = resolve_resource_path(index, path=member)
+            if full_path:
+                with open(full_path, 'rb') as f:
+                    found[member] = f.read()
+        return found
+    chunk_size = _config_value('DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+    scanner = TarStreamScanner(capture=members)
+    with open(tgz_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            scanner.feed(chunk)
+            if scanner.finished or len(scanner.members) == len(members):
+                break
+    return scanner.members
+
+def _is_package_resource_member(name):
+    filename = name[len('package/'):] if name.startswith('package/') else None
+    return bool(filename) and filename.endswith('.json') and '/' not in filename and \
+        not filename.startswith('.') and filename != 'package.json'
+
+def scan_package_resource_entries(tgz_path):
+    entries = []
+    def on_capture(name, data):
+        try:
+            resource = json.loads(data)
+        except ValueError:
+            return
+        if isinstance(resource, dict) and resource.get('resourceType'):
+            url = resource.get('url')
+            entries.append({'filename': name[len('package/'):], 'resourceType': resource['resourceType'],
+                            'id': resource.get('id'), 'url': url if isinstance(url, str) else None})
+    chunk_size = _config_value('DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+    scanner = TarStreamScanner(capture=_is_package_resource_member, on_capture=on_capture)
+    with open(tgz_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            scanner.feed(chunk)
+            if scanner.finished:
+                break
+    return entries
+
+def _package_resource_entries(tgz_path, record):
+    if record['files']:
+        return record['files']
+    logger.info(f"{os.path.basename(tgz_path)} has no .index.json; scanning its resources")
+    return scan_package_resource_entries(tgz_path)
+
+_packages_in_use = defaultdict(int)
+_imports_in_flight = 0
+_usage_lock = threading.Lock()
+
+@contextlib.contextmanager
+def package_in_use(tgz_path):
+    tgz_filename = os.path.basename(tgz_path)
+    with _usage_lock:
+        _packages_in_use[tgz_filename] += 1
+    try:
+        yield
+    finally:
+        with _usage_lock:
+            _packages_in_use[tgz_filename] -= 1
+            if _packages_in_use[tgz_filename] <= 0:
+                del _packages_in_use[tgz_filename]
+
+@contextlib.contextmanager
+def _track_import():
+    global _imports_in_flight
+    with _usage_lock:
+        _imports_in_flight += 1
+    try:
+        yield
+    finally:
+        with _usage_lock:
+            _imports_in_flight -= 1
+
+def _other_import_jobs_active(root_name, root_version):
+    try:
+        active = ImportJob.query.filter(ImportJob.active_key.isnot(None)).all()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not check for running import jobs: {e}")
+        return True
+    return any((job.package_name, job.version, job.dependency_mode) != (root_name, root_version, 'tree-shaking')
+               for job in active)
+
+def _dependency_removal_blocker(root_name, root_version, unresolved, paths):
+    if unresolved:
+        return f"{len(unresolved)} canonical references are unresolved"
+    with _usage_lock:
+        if _imports_in_flight > 1:
+            return "another import is in progress"
+        busy = [os.path.basename(path) for path in paths if _packages_in_use.get(os.path.basename(path))]
+    if busy:
+        return f"{', '.join(sorted(busy))} in use"
+    if _other_import_jobs_active(root_name, root_version):
+        return "another import job is running"
+    return None
+
+def _remove_package_artifacts(tgz_path):
+    if os.path.exists(tgz_path):
+        os.unlink(tgz_path)
+    remove_unpacked_package(tgz_path, get_package_store_dir())
+    PackageManifest.query.filter_by(tgz_filename=os.path.basename(tgz_path)).delete()
+    with _manifest_memo_lock:
+        _manifest_memo.pop(os.path.basename(tgz_path), None)
+
+def tree_shake_dependencies(root_name, root_version, packages, remove_dependencies=False):
+    root_key = (root_name, root_version)
+    root_path = packages[root_key]['path']
+    root_entries = _package_resource_entries(root_path, get_package_manifest(root_path))
+    root_canonicals = {entry['url'] for entry in root_entries if entry.get('url')}
+    canonical_map = {}
+    records = {}
+    for key, package in packages.items():
+        if key == root_key:
+            continue
+        records[key] = get_package_manifest(package['path'])
+        for entry in _package_resource_entries(package['path'], records[key]):
+            if entry.get('url') and entry.get('filename'):
+                canonical_map.setdefault(entry['url'], (key, f"package/{entry['filename']}"))
+
+    seed_members = {f"package/{entry['filename']}" for entry in root_entries
+                    if entry.get('resourceType') in SHAKE_SEED_TYPES and entry.get('filename')}
+    pending = set()
+    for raw in read_tarball_members(root_path, seed_members).values():
+        pending |= _collect_canonical_references(json.loads(raw))
+
+    retained = {}
+    visited = set()
+    unresolved = set()
+    while pending:
+        wanted = defaultdict(set)
+        for url in pending - visited:
+            visited.add(url)
+            location = canonical_map.get(url)
+            if location is None:
+                if url not in root_canonicals:
+                    unresolved.add(url)
+            elif location not in retained:
+                wanted[location[0]].add(location[1])
+        pending = set()
+        for key, members in wanted.items():
+            for member, raw in read_tarball_members(packages[key]['path'], members).items():
+                retained[key, member] = raw
+                pending |= _collect_canonical_references(json.loads(raw))
+
+    output_root = os.path.join(_get_download_dir(), 'shaken')
+    os.makedirs(output_root, exist_ok=True)
+    target = os.path.join(output_root, construct_tgz_filename(root_name, root_version)[:-4])
+    staging = tempfile.mkdtemp(dir=output_root, prefix='.shake.', suffix='.tmp')
+    closure = defaultdict(list)
+    try:
+        for (key, member), raw in retained.items():
+            package_dir = construct_tgz_filename(*key)[:-4]
+            destination = os.path.join(staging, package_dir, member)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open(destination, 'wb') as f:
+                f.write(raw)
+            closure[f"{key[0]}#{key[1]}"].append(member[len('package/'):])
+        with open(os.path.join(staging, 'closure.json'), 'w', encoding='utf-8') as f:
+            json.dump({'root': f"{root_name}#{root_version}", 'packages': closure, 'unresolved': sorted(unresolved)}, f, indent=2)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    retained_bytes = sum(len(raw) for raw in retained.values())
+    dependency_bytes = sum(record['size'] or 0 for record in records.values())
+    dependency_uncompressed = sum(record['uncompressed_size'] or 0 for record in records.values())
+    removed_bytes = 0
+    removable = [key for key in records if packages[key]['downloaded']]
+    kept_reason = None
+    if not remove_dependencies:
+        kept_reason = "dependency removal is disabled"
+    elif removable:
+        kept_reason = _dependency_removal_blocker(root_name, root_version, unresolved,
+                                                  [packages[key]['path'] for key in removable])
+    if kept_reason is None:
+        for key in removable:
+            removed_bytes += records[key]['size'] or 0
+            _remove_package_artifacts(packages[key]['path'])
+        db.session.commit()
+    elif removable:
+        logger.info(f"Keeping {len(removable)} dependency packages of {root_name}#{root_version}: {kept_reason}")
+    report = {
+        'output_dir': target,
+        'dependency_packages': len(records),
+        'retained_resources': len(retained),
+        'unresolved_canonicals': sorted(unresolved),
+        'dependency_bytes': dependency_bytes,
+        'dependency_uncompressed_bytes': dependency_uncompressed,
+        'retained_bytes': retained_bytes,
+        'removed_packages': [f"{key[0]}#{key[1]}" for key in removable] if kept_reason is None else [],
+        'kept_reason': kept_reason,
+        'disk_saved_bytes': max(removed_bytes - retained_bytes, 0),
+        'memory_saved_bytes': max(dependency_uncompressed - retained_bytes, 0)
+    }
+    logger.info(f"Tree-shaking {root_name}#{root_version}: kept {len(retained)} dependency resources "
+                f"({retained_bytes} bytes of {dependency_uncompressed} uncompressed), "
+                f"saved {report['disk_saved_bytes']} bytes on disk")
+    return report
+
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def get_analysis_pool():
+    # One pool per worker process, shared by every import it runs.
+    global _analysis_pool
+    if _analysis_pool is None:
+        with _analysis_pool_lock:
+            if _analysis_pool is None:
+                workers = max(1, _config_value('IG_PROCESS_WORKERS', 1))
+                _analysis_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                atexit.register(_analysis_pool.shutdown, cancel_futures=True)
+    return _analysis_pool
+
+def _discard_analysis_pool(pool):
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is pool:
+            _analysis_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def analyze_package_tarball(tgz_path, max_workers=None, chunk_bytes=None):
+    max_workers = max_workers or _config_value('IG_PROCESS_WORKERS', 1)
+    chunk_bytes = chunk_bytes or _config_value('IG_PROCESS_CHUNK_BYTES', 4 * 1024 * 1024)
+    read_size = _config_value('DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+    partials = []
+    in_flight = set()
+    batch = []
+    batch_bytes = 0
+    pool = None
+
+    def collect(futures):
+        for future in futures:
+            in_flight.discard(future)
+            partials.append(future.result())
+
+    def submit(members):
+        nonlocal pool
+        if max_workers <= 1:
+            partials.append(analyze_chunk(members))
+            return
+        if pool is None:
+            pool = get_analysis_pool()
+        while len(in_flight) >= max_workers * 2:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+            _heartbeat()
+        in_flight.add(pool.submit(analyze_chunk, members))
+
+    def on_capture(name, data):
+        nonlocal batch, batch_bytes
+        batch.append((name, data))
+        batch_bytes += len(data)
+        if batch_bytes >= chunk_bytes:
+            submit(batch)
+            batch, batch_bytes = [], 0
+
+    scanner = TarStreamScanner(capture=is_analysis_member, on_capture=on_capture)
+    try:
+        with open(tgz_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(read_size), b''):
+                scanner.feed(chunk)
+                _heartbeat()
+        scanner.close()
+        if batch:
+            if pool is None:
+                partials.append(analyze_chunk(batch))
+            else:
+                submit(batch)
+        collect(list(in_flight))
+    except BrokenProcessPool:
+        _discard_analysis_pool(pool)
+        raise
+    finally:
+        for future in in_flight:
+            future.cancel()
+    return merge_analysis(partials)
+
+def process_ig_package(name, version, force=False):
+    tgz_filename = construct_tgz_filename(name, version)
+    tgz_path = os.path.join(_get_download_dir(), tgz_filename)
+    if not os.path.exists(tgz_path):
+        return {'status': 'error', 'error': f"Package file not found: {tgz_filename}"}
+    try:
+        record = get_package_manifest(tgz_path)
+        row = ProcessedIg.query.filter_by(package_name=name, version=version).first()
+        if row is not None and not force and row.tarball_sha256 == record['sha256']:
+            logger.info(f"Skipping analysis of {name}#{version}: tarball unchanged since {row.processed_date}")
+            return {'status': 'unchanged'}
+        started = time.monotonic()
+        analysis = analyze_package_tarball(tgz_path)
+        if row is None:
+            row = ProcessedIg(package_name=name, version=version)
+            db.session.add(row)
+        row.processed_date = datetime.datetime.now(datetime.timezone.utc)
+        row.tarball_sha256 = record['sha256']
+        for field in ('resource_types_info', 'must_support_elements', 'examples', 'complies_with_profiles',
+                      'imposed_profiles', 'optional_usage_elements', 'search_param_conformance'):
+            setattr(row, field, analysis[field])
+        db.session.commit()
+        elapsed = time.monotonic() - started
+        logger.info(f"Analysed {name}#{version}: {analysis['profile_count']} profiles, "
+                    f"{analysis['example_count']} examples, {len(analysis['search_param_conformance'])} searchable types "
+                    f"in {elapsed:.2f}s")
+        if analysis['parse_errors']:
+            logger.warning(f"{analysis['parse_errors']} unparseable JSON members in {tgz_filename}")
+        return {'status': 'processed', 'profiles': analysis['profile_count'], 'examples': analysis['example_count'], 'elapsed': elapsed}
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error analysing {name}#{version}: {e}", exc_info=True)
+        return {'status': 'error', 'error': str(e)}
+
+def import_package_and_dependencies(name, version, dependency_mode='recursive', progress=None):
+    result = {
+        'requested': f"{name}#{version}",
+        'downloaded': {},
+        'dependencies': [],
+        'errors': [],
+        'graph': None,
+        'tree_shaking': None,
+        'processing': None
+    }
+    with _track_import():
+        try:
+            graph, packages, errors = resolve_package_graph(name, version, dependency_mode=dependency_mode, progress=progress)
+            result['graph'] = graph
+            result['errors'].extend(errors)
+            for (pkg_name, pkg_version), package in packages.items():
+                result['downloaded'][pkg_name, pkg_version] = package['path']
+            root_key = graph['root']
+            dependency_keys = {edge['to'] for edge in graph['edges'] if dependency_mode != 'patch-canonical' or edge['from'] == root_key}
+            dependency_keys.discard(root_key)
+            result['dependencies'] = [
+                {'name': key.split('#', 1)[0], 'version': key.split('#', 1)[1]}
+                for key in graph['order'] if key in dependency_keys
+            ]
+            logger.info(f"Resolved {len(graph['nodes'])} unique packages for {root_key} in {len(graph['waves'])} waves")
+            if dependency_mode == 'tree-shaking' and (name, version) in packages:
+                result['tree_shaking'] = tree_shake_dependencies(
+                    name, version, packages, remove_dependencies=_config_value('TREE_SHAKE_REMOVE_DEPENDENCIES', False))
+                for removed in result['tree_shaking']['removed_packages']:
+                    result['downloaded'].pop(tuple(removed.split('#', 1)), None)
+            if (name, version) in packages and _config_value('IG_PROCESS_ON_IMPORT', True):
+                result['processing'] = process_ig_package(name, version)
+        except Exception as e:
+            result['errors'].append(f"Error importing {name}#{version}: {e}")
+            logger.error(f"Import error for {name}#{version}: {e}", exc_info=True)
+    return result
+
+TEST_DATA_EXTENSIONS = ('.json', '.ndjson')
+
+def _walk_test_data_files(folder_path):
+    files = {}
+    for root, _, filenames in os.walk(folder_path):
+        for filename in filenames:
+            if not filename.lower().endswith(TEST_DATA_EXTENSIONS):
+                continue
+            file_path = os.path.join(root, filename)
+            try:
+                stat = os.stat(file_path)
+            except OSError as e:
+                logger.warning(f"Cannot stat {file_path}: {e}")
+                continue
+            files[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def _scan_test_data_file(file_path):
+    if file_path.lower().endswith('.ndjson'):
+        return {'resourceType': None, 'stream': True}, None
+    try:
+        with open(file_path, 'rb') as f:
+            fields = read_top_level_fields(f, ('resourceType', 'id'))
+    except (OSError, JsonStreamError, ValueError) as e:
+        return None, str(e)
+    if fields.get('resourceType') == 'Bundle':
+        fields['stream'] = True
+    return fields, None
+
+def _test_data_row(file_path, fingerprint, resource_type, resource_id, byte_offset=0, byte_length=None):
+    if not isinstance(resource_type, str) or not isinstance(resource_id, (str, int)):
+        return None
+    mtime_ns, size = fingerprint or (None, None)
+    return {
+        'filename': os.path.basename(file_path),
+        'file_path': file_path,
+        'file_mtime_ns': mtime_ns,
+        'file_size': size,
+        'byte_offset': byte_offset,
+        'byte_length': byte_length,
+        'resource_type': resource_type,
+        'resource_id': str(resource_id)
+    }
+
+def iter_test_data_records(f, file_format):
+    if file_format == 'ndjson':
+        for offset, length, fields in iter_ndjson_records(f):
+            yield offset, length, fields.get('resourceType'), fields.get('id')
+        return
+    top_level = {}
+    for offset, length, fields in iter_bundle_resources(f, top_level=top_level):
+        yield offset, length, fields.get('resourceType'), fields.get('id')
+    yield 0, None, top_level.get('resourceType'), top_level.get('id')
+
+def ingest_test_data_stream(f, file_path, file_format, fingerprint=None):
+    batch_size = _config_value('TEST_DATA_BATCH_SIZE', 1000)
+    rows = []
+    count = 0
+    for offset, length, resource_type, resource_id in iter_test_data_records(f, file_format):
+        row = _test_data_row(file_path, fingerprint, resource_type, resource_id, offset, length)
+        if row is None:
+            continue
+        rows.append(row)
+        if len(rows) >= batch_size:
+            db.session.execute(db.insert(TestDataResource), rows)
+            count += len(rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(TestDataResource), rows)
+        count += len(rows)
+    return count
+
+def _test_data_format(filename):
+    return 'ndjson' if filename.lower().endswith('.ndjson') else 'json'
+
+def parse_test_data_folder(folder_path):
+    if not os.path.exists(folder_path):
+        logger.error(f"Test data folder not found: {folder_path}")
+        return None
+    started = time.monotonic()
+    batch_size = _config_value('TEST_DATA_BATCH_SIZE', 1000)
+    max_workers = _config_value('TEST_DATA_SCAN_WORKERS', 8)
+    stats = {'files': 0, 'parsed': 0, 'added': 0, 'removed': 0, 'skipped': 0, 'errors': 0}
+    try:
+        on_disk = _walk_test_data_files(folder_path)
+        stats['files'] = len(on_disk)
+        recorded = {
+            file_path: (mtime_ns, size)
+            for file_path, mtime_ns, size in db.session.query(
+                TestDataScanState.file_path, TestDataScanState.file_mtime_ns, TestDataScanState.file_size
+            ).filter(TestDataScanState.file_path.startswith(os.path.join(folder_path, ''), autoescape=True))
+        }
+        changed = [path for path, fingerprint in on_disk.items() if recorded.get(path) != fingerprint]
+        removed = [path for path in recorded if path not in on_disk]
+        stale = changed + removed
+        for i in range(0, len(stale), batch_size):
+            db.session.query(TestDataResource).filter(
+                TestDataResource.file_path.in_(stale[i:i + batch_size])).delete(synchronize_session=False)
+            db.session.query(TestDataScanState).filter(
+                TestDataScanState.file_path.in_(stale[i:i + batch_size])).delete(synchronize_session=False)
+        stats['removed'] = len(removed)
+
+        # Every scanned file is recorded, including ones that were skipped, failed or held no
+        # resources, so an unchanged file is never parsed again.
+        outcomes = {}
+        rows = []
+        streamed = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for file_path, (fields, error) in zip(changed, executor.map(_scan_test_data_file, changed)):
+                if error:
+                    stats['errors'] += 1
+                    outcomes[file_path] = ('error', 0)
+                    logger.error(f"Error parsing {file_path}: {error}")
+                    continue
+                if fields.get('stream'):
+                    streamed.append(file_path)
+                    continue
+                row = _test_data_row(file_path, on_disk[file_path], fields.get('resourceType'), fields.get('id'))
+                if row is None:
+                    stats['skipped'] += 1
+                    outcomes[file_path] = ('skipped', 0)
+                    continue
+                outcomes[file_path] = ('indexed', 1)
+                rows.append(row)
+                if len(rows) >= batch_size:
+                    db.session.execute(db.insert(TestDataResource), rows)
+                    stats['added'] += len(rows)
+                    rows = []
+        if rows:
+            db.session.execute(db.insert(TestDataResource), rows)
+            stats['added'] += len(rows)
+        for file_path in streamed:
+            try:
+                with db.session.begin_nested(), open(file_path, 'rb') as f:
+                    count = ingest_test_data_stream(f, file_path, _test_data_format(file_path), on_disk[file_path])
+                stats['added'] += count
+                outcomes[file_path] = ('indexed', count) if count else ('empty', 0)
+            except (OSError, JsonStreamError, ValueError) as e:
+                stats['errors'] += 1
+                outcomes[file_path] = ('error', 0)
+                logger.error(f"Error parsing {file_path}: {e}")
+        scanned_at = datetime.datetime.now(datetime.timezone.utc)
+        states = [
+            {'file_path': file_path, 'file_mtime_ns': on_disk[file_path][0], 'file_size': on_disk[file_path][1],
+             'status': status, 'resource_count': count, 'scanned_at': scanned_at}
+            for file_path, (status, count) in outcomes.items()
+        ]
+        for i in range(0, len(states), batch_size):
+            db.session.execute(db.insert(TestDataScanState), states[i:i + batch_size])
+        stats['parsed'] = len(changed)
+        db.session.commit()
+        logger.info(f"Parsed test data folder {folder_path}: {stats['files']} files, {stats['parsed']} new or changed, "
+                    f"{stats['added']} resources added, {stats['removed']} removed in {time.monotonic() - started:.2f}s")
+        return stats
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error parsing test data folder: {e}", exc_info=True)
+        return None
+
+class _TeeReader:
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.sink.write(data)
+            self.bytes_read += len(data)
+        return data
+
+def ingest_test_data_upload(stream, filename):
+    upload_dir = current_app.config['TEST_DATA_UPLOAD_FOLDER']
+    os.makedirs(upload_dir, exist_ok=True)
+    file_path = os.path.join(upload_dir, filename)
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix=f".{filename}.", suffix='.part')
+    chunk_size = _config_value('DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+    started = time.monotonic()
+    try:
+        db.session.query(TestDataResource).filter_by(file_path=file_path).delete(synchronize_session=False)
+        with os.fdopen(fd, 'wb') as out:
+            tee = _TeeReader(stream, out)
+            count = ingest_test_data_stream(tee, file_path, _test_data_format(filename))
+            while tee.read(chunk_size):
+                pass
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+        stat = os.stat(file_path)
+        db.session.query(TestDataResource).filter_by(file_path=file_path).update(
+            {'file_mtime_ns': stat.st_mtime_ns, 'file_size': stat.st_size}, synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    elapsed = max(time.monotonic() - started, 1e-6)
+    result = {
+        'filename': filename,
+        'resources': count,
+        'bytes': tee.bytes_read,
+        'seconds': round(elapsed, 3),
+        'mb_per_second': round(tee.bytes_read / elapsed / (1024 * 1024), 2),
+        'resources_per_second': round(count / elapsed, 1)
+    }
+    logger.info(f"Ingested upload {filename}: {count} resources from {tee.bytes_read} bytes in {elapsed:.2f}s "
+                f"({result['mb_per_second']} MB/s)")
+    return result
+
+_ig_resource_types = LRUCache(maxsize=IG_RESOURCE_TYPES_MEMO_SIZE)
+_ig_resource_types_lock = threading.Lock()
+
+def get_ig_resource_types(package_name, version):
+    row = db.session.query(ProcessedIg.id, ProcessedIg.processed_date).filter_by(
+        package_name=package_name, version=version).first()
+    if row is None:
+        return None
+    with _ig_resource_types_lock:
+        cached = _ig_resource_types.get((package_name, version))
+    if cached and cached[0] == row.processed_date:
+        return cached[1]
+    resource_types_info = db.session.query(ProcessedIg.resource_types_info).filter_by(id=row.id).scalar() or []
+    types = frozenset(info['type'] for info in resource_types_info if info.get('type'))
+    with _ig_resource_types_lock:
+        _ig_resource_types[package_name, version] = (row.processed_date, types)
+    return types
+
+def query_test_data_page(resource_types=None, after=None, per_page=100):
+    query = TestDataResource.query
+    if resource_types is not None:
+        query = query.filter(TestDataResource.resource_type.in_(sorted(resource_types)))
+    if after:
+        anchor = db.session.query(TestDataResource.resource_type, TestDataResource.resource_id).filter_by(id=after).first()
+        if anchor is not None:
+            query = query.filter(db.tuple_(TestDataResource.resource_type, TestDataResource.resource_id, TestDataResource.id)
+                                 > db.tuple_(anchor.resource_type, anchor.resource_id, after))
+    rows = query.order_by(TestDataResource.resource_type, TestDataResource.resource_id, TestDataResource.id).limit(per_page + 1).all()
+    next_after = rows[per_page - 1].id if len(rows) > per_page else None
+    return rows[:per_page], next_after
+
+def read_test_data_resource(resource):
+    with open(resource.file_path, 'rb') as f:
+        f.seek(resource.byte_offset or 0)
+        return f.read(resource.byte_length) if resource.byte_length is not None else f.read()
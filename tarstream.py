@@ -0,0 +1,154 @@
+import zlib
+
+BLOCK_SIZE = 512
+REGULAR_TYPES = (b'0', b'\0', b'7')
+
+def _padded(size):
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+def _parse_size(field):
+    if field and field[0] & 0x80:
+        return int.from_bytes(field[1:], 'big')
+    field = field.rstrip(b'\0 ').strip()
+    return int(field, 8) if field else 0
+
+def _parse_pax(data):
+    headers = {}
+    pos = 0
+    while pos < len(data):
+        space = data.index(b' ', pos)
+        length = int(data[pos:space])
+        record = data[space + 1:pos + length - 1]
+        key, _, value = record.partition(b'=')
+        headers[key.decode('utf-8')] = value.decode('utf-8', 'replace')
+        pos += length
+    return headers
+
+class TarStreamError(Exception):
+    pass
+
+class TarStreamScanner:
+    def __init__(self, capture=(), max_capture_size=64 * 1024 * 1024, on_member=None, on_capture=None):
+        self.capture = capture if callable(capture) else set(capture)
+        self.max_capture_size = max_capture_size
+        self.on_member = on_member
+        self.on_capture = on_capture
+        self.members = {}
+        self.member_count = 0
+        self.uncompressed_size = 0
+        self.finished = False
+        self._inflater = zlib.decompressobj(wbits=31)
+        self._buffer = bytearray()
+        self._skip = 0
+        self._target = None
+        self._target_size = 0
+        self._target_received = 0
+        self._pending_name = None
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        data = self._inflater.decompress(chunk)
+        while self._inflater.eof and self._inflater.unused_data:
+            unused = self._inflater.unused_data
+            self._inflater = zlib.decompressobj(wbits=31)
+            data += self._inflater.decompress(unused)
+        self.uncompressed_size += len(data)
+        if not self.finished:
+            self._buffer += data
+            self._process()
+
+    def close(self):
+        self._buffer += self._inflater.flush()
+        if not self._inflater.eof:
+            raise TarStreamError("Truncated gzip stream")
+        if not self.finished:
+            self._process()
+        if self._target is not None:
+            raise TarStreamError(f"Truncated tar member {self._target[0]}")
+
+    def _process(self):
+        buffer = self._buffer
+        offset = 0
+        while True:
+            if self._skip:
+                step = min(self._skip, len(buffer) - offset)
+                offset += step
+                self._skip -= step
+                if self._skip:
+                    break
+            if self._target is not None:
+                name, kind, chunks = self._target
+                needed = self._target_size - self._target_received
+                piece = bytes(buffer[offset:offset + needed])
+                chunks.append(piece)
+                self._target_received += len(piece)
+                offset += len(piece)
+                if len(piece) < needed:
+                    break
+                self._target = None
+                self._skip = _padded(self._target_size) - self._target_size
+                self._complete(name, kind, b''.join(chunks))
+                continue
+            if len(buffer) - offset < BLOCK_SIZE:
+                break
+            header = bytes(buffer[offset:offset + BLOCK_SIZE])
+            offset += BLOCK_SIZE
+            if header == b'\0' * BLOCK_SIZE:
+                self.finished = True
+                break
+            self._start_member(header)
+        del buffer[:offset]
+        if self.finished:
+            buffer.clear()
+
+    def _start_member(self, header):
+        name = header[0:100].split(b'\0', 1)[0].decode('utf-8', 'replace')
+        size = _parse_size(header[124:136])
+        typeflag = header[156:157]
+        if header[257:262] == b'ustar':
+            prefix = header[345:500].split(b'\0', 1)[0].decode('utf-8', 'replace')
+            if prefix:
+                name = f"{prefix}/{name}"
+        if typeflag in (b'L', b'x'):
+            self._begin_capture(None, typeflag, size)
+            return
+        if self._pending_name:
+            name, self._pending_name = self._pending_name, None
+        if typeflag not in REGULAR_TYPES:
+            self._skip = _padded(size)
+            return
+        self.member_count += 1
+        if self.on_member is not None:
+            self.on_member(name, size)
+        if self._wants(name):
+            if size > self.max_capture_size:
+                raise TarStreamError(f"Member {name} exceeds {self.max_capture_size} bytes")
+            self._begin_capture(name, typeflag, size)
+        else:
+            self._skip = _padded(size)
+
+    def _wants(self, name):
+        if callable(self.capture):
+            return self.capture(name)
+        return name in self.capture
+
+    def _begin_capture(self, name, kind, size):
+        self._target = (name, kind, [])
+        self._target_size = size
+        self._target_received = 0
+        if size == 0:
+            self._target = None
+            self._complete(name, kind, b'')
+
+    def _complete(self, name, kind, data):
+        if kind == b'L':
+            self._pending_name = data.split(b'\0', 1)[0].decode('utf-8', 'replace')
+        elif kind == b'x':
+            path = _parse_pax(data).get('path')
+            if path:
+                self._pending_name = path
+        elif self.on_capture is not None:
+            self.on_capture(name, data)
+        else:
+            self.members[name] = data
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import db
+
+
+@pytest.fixture
+def db_app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['FHIR_PACKAGES_DIR'] = str(tmp_path / 'packages')
+    db.init_app(app)
+    Migrate(app, db, directory=os.path.join(ROOT, 'migrations'))
+    with app.app_context():
+        # Same order as startup: models first, then the migrations on top.
+        db.create_all()
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        yield app
+        db.session.remove()
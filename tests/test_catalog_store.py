@@ -0,0 +1,157 @@
+import datetime
+import gzip
+import os
+
+import pytest
+
+from catalog import CatalogSnapshot
+from catalog_store import CatalogStore, CatalogStoreError
+
+
+def package(name, author='HL7', canonical=None, versions=('1.0.0',), **extra):
+    values = {
+        'name': name,
+        'version': versions[-1],
+        'latest_absolute_version': versions[-1],
+        'latest_official_version': versions[-1],
+        'author': author,
+        'fhir_version': '4.0.1',
+        'url': f'https://packages.fhir.org/{name}',
+        'canonical': canonical or f'http://example.org/fhir/{name}',
+        'registry': 'https://packages.fhir.org',
+        'display_version': versions[-1],
+        'dependencies': [{'name': 'hl7.fhir.r4.core', 'version': '4.0.1'}],
+        'version_count': len(versions),
+        'all_versions': [{'version': version, 'pubDate': f'2024-01-0{i + 1}'} for i, version in enumerate(versions)],
+    }
+    values.update(extra)
+    return values
+
+
+@pytest.fixture
+def packages():
+    return [
+        package('hl7.fhir.us.core', versions=('6.1.0', '7.0.0')),
+        package('de.basisprofil.r4', author='HL7 Deutschland', versions=('1.4.0',)),
+        package('example.ünïcode', author=None, canonical='', versions=('0.1.0',), dependencies=[]),
+    ]
+
+
+def test_published_snapshot_loads_the_same_records(tmp_path, packages):
+    store = CatalogStore(str(tmp_path))
+    assert store.generation() == 0
+    assert store.load() is None
+
+    timestamp = datetime.datetime(2026, 10, 18, 12, 0, tzinfo=datetime.timezone.utc)
+    assert store.publish(packages, timestamp) == 1
+    mapped = store.load()
+
+    assert (mapped.generation, mapped.timestamp, len(mapped)) == (1, timestamp, 3)
+    assert [record.to_dict() for record in mapped] == [CatalogSnapshot(packages).packages[i].to_dict() for i in range(3)]
+    snapshot = CatalogSnapshot(mapped)
+    assert snapshot.get('HL7.FHIR.US.Core')['latest_absolute_version'] == '7.0.0'
+    assert snapshot.get('example.ünïcode')['author'] is None
+    assert snapshot.get('missing') is None
+
+
+def test_every_store_on_a_directory_sees_new_generations(tmp_path, packages):
+    writer = CatalogStore(str(tmp_path))
+    reader = CatalogStore(str(tmp_path))
+    writer.publish(packages[:1])
+    assert reader.generation() == 1
+
+    writer.publish(packages)
+    assert reader.generation() == 2
+    assert [record['name'] for record in reader.load()] == [pkg['name'] for pkg in packages]
+
+
+@pytest.fixture
+def ranked_packages():
+    return [
+        package('acme.core.extensions', author='Acme'),
+        package('core', author='Core Team'),
+        package('hl7.fhir.r4.core', author='HL7'),
+        package('core.profiles', author='Acme'),
+        package('other.package', author='Hardcore Devs', canonical='https://www.example.org/other'),
+        package('unrelated', author='Nobody'),
+    ]
+
+
+@pytest.mark.parametrize('mapped', [False, True], ids=['in-memory', 'mapped'])
+def test_search_ranks_exact_then_prefix_then_substring_then_other_fields(tmp_path, ranked_packages, mapped):
+    if mapped:
+        store = CatalogStore(str(tmp_path))
+        store.publish(ranked_packages)
+        snapshot = CatalogSnapshot(store.load())
+    else:
+        snapshot = CatalogSnapshot(ranked_packages)
+
+    results, total = snapshot.search_page('Core', 1, 10)
+
+    assert [record['name'] for record in results] == [
+        'core', 'core.profiles', 'acme.core.extensions', 'hl7.fhir.r4.core', 'other.package']
+    assert total == 5
+    assert [record['name'] for record in snapshot.search_page('example.org/other', 1, 10)[0]] == ['other.package']
+    assert [record['name'] for record in snapshot.search_page('co', 1, 2)[0]] == ['core', 'core.profiles']
+    assert snapshot.search_page('zzz', 1, 10) == ([], 0)
+
+
+def test_mapped_postings_match_a_rebuilt_index(tmp_path, ranked_packages):
+    store = CatalogStore(str(tmp_path))
+    store.publish(ranked_packages)
+    mapped = store.load()
+    rebuilt = CatalogSnapshot(ranked_packages).search_index._postings
+
+    assert {gram: list(mapped.postings.get(gram)) for gram in rebuilt} == {
+        gram: list(posting) for gram, posting in rebuilt.items()}
+    assert mapped.postings.get('qqq') is None
+
+
+def test_exported_snapshot_imports_as_the_next_generation(tmp_path, packages):
+    source = CatalogStore(str(tmp_path / 'source'))
+    source.publish(packages)
+    source.publish(packages)
+    export_path = str(tmp_path / 'catalog.bin.gz')
+    source.export_snapshot(export_path)
+
+    target = CatalogStore(str(tmp_path / 'target'))
+    assert target.import_snapshot(export_path) == 1
+    assert target.import_snapshot(export_path, if_missing=True) is None
+    imported = target.load()
+
+    assert imported.generation == 1
+    assert [record.to_dict() for record in imported] == [record.to_dict() for record in source.load()]
+    assert CatalogSnapshot(imported).search_page('us.core', 1, 10)[0][0]['name'] == 'hl7.fhir.us.core'
+
+
+def test_export_without_a_snapshot_fails(tmp_path):
+    with pytest.raises(CatalogStoreError, match='No catalog snapshot'):
+        CatalogStore(str(tmp_path)).export_snapshot(str(tmp_path / 'catalog.bin.gz'))
+
+
+@pytest.mark.parametrize('damage', ['truncate', 'not-gzip', 'wrong-magic'])
+def test_bad_exports_leave_the_current_snapshot_in_place(tmp_path, packages, damage):
+    source = CatalogStore(str(tmp_path / 'source'))
+    source.publish(packages)
+    export_path = tmp_path / 'catalog.bin.gz'
+    source.export_snapshot(str(export_path))
+    data = export_path.read_bytes()
+    if damage == 'truncate':
+        with gzip.open(export_path, 'rb') as f:
+            raw = f.read()
+        export_path.write_bytes(gzip.compress(raw[:len(raw) // 2]))
+    elif damage == 'not-gzip':
+        export_path.write_bytes(data[10:])
+    else:
+        with gzip.open(export_path, 'rb') as f:
+            raw = f.read()
+        export_path.write_bytes(gzip.compress(b'NOTCAT\0\0' + raw[8:]))
+
+    target = CatalogStore(str(tmp_path / 'target'))
+    target.publish(packages[:1])
+    with pytest.raises(CatalogStoreError):
+        target.import_snapshot(str(export_path))
+
+    assert target.generation() == 1
+    assert [record['name'] for record in target.load()] == [packages[0]['name']]
+    assert not [name for name in os.listdir(target.directory) if name.endswith('.part')]
@@ -0,0 +1,108 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+import jobs
+import models
+from job_logs import LogBroker
+from models import db
+
+
+class FakeImport:
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, name, version, dependency_mode='recursive', progress=None):
+        self.calls.append((name, version, dependency_mode))
+        self.started.set()
+        assert self.release.wait(10)
+        progress(1, 1)
+        return {'requested': f"{name}#{version}", 'downloaded': {(name, version): '/tmp/x.tgz'}, 'dependencies': [],
+                'errors': [], 'graph': None, 'tree_shaking': None, 'processing': None}
+
+
+@pytest.fixture
+def fake_import(monkeypatch):
+    fake = FakeImport()
+    monkeypatch.setattr(jobs, 'import_package_and_dependencies', fake)
+    yield fake
+    fake.release.set()
+
+
+@pytest.fixture
+def engine(db_app, tmp_path):
+    engine = jobs.ImportJobEngine(db_app, LogBroker(spool_dir=str(tmp_path / 'logs')), max_workers=2, stale_after=60)
+    yield engine
+    engine.executor.shutdown(wait=True)
+
+
+def job_row(job_id):
+    db.session.expire_all()
+    return db.session.get(models.ImportJob, job_id)
+
+
+def wait_until_finished(job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job_row(job_id).status in jobs.ACTIVE_STATUSES:
+        assert time.monotonic() < deadline, f"job {job_id} did not finish"
+        time.sleep(0.01)
+
+
+def test_same_import_joins_the_active_job(engine, fake_import):
+    job_id, created = engine.submit('hl7.fhir.us.core', '6.1.0')
+    assert created
+    assert fake_import.started.wait(10)
+
+    assert engine.submit('HL7.FHIR.US.Core', '6.1.0') == (job_id, False)
+    other_mode, created = engine.submit('hl7.fhir.us.core', '6.1.0', 'tree-shaking')
+    assert created and other_mode != job_id
+
+    fake_import.release.set()
+    engine.executor.shutdown(wait=True)
+    assert fake_import.calls.count(('hl7.fhir.us.core', '6.1.0', 'recursive')) == 1
+    row = job_row(job_id)
+    assert (row.status, row.active_key, row.progress) == ('succeeded', None, {'done': 1, 'total': 1})
+
+
+def test_finished_import_starts_a_new_job(engine, fake_import):
+    fake_import.release.set()
+    first, _ = engine.submit('hl7.fhir.us.core', '6.1.0')
+    wait_until_finished(first)
+
+    second, created = engine.submit('hl7.fhir.us.core', '6.1.0')
+    assert created and second != first
+
+
+def test_stale_job_is_replaced_and_cannot_overwrite_its_row(engine, fake_import):
+    job_id, _ = engine.submit('hl7.fhir.us.core', '6.1.0')
+    assert fake_import.started.wait(10)
+    long_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=600)
+    with db.engine.begin() as conn:
+        conn.execute(models.ImportJob.__table__.update().values(updated_at=long_ago))
+
+    replacement, created = engine.submit('hl7.fhir.us.core', '6.1.0')
+    assert created and replacement != job_id
+    fake_import.release.set()
+    engine.executor.shutdown(wait=True)
+
+    abandoned = job_row(job_id)
+    assert (abandoned.status, abandoned.message) == ('failed', "Job was abandoned by its worker.")
+    assert job_row(replacement).status == 'succeeded'
+
+
+def test_heartbeat_keeps_a_running_job_fresh(engine, fake_import):
+    job_id, _ = engine.submit('hl7.fhir.us.core', '6.1.0')
+    assert fake_import.started.wait(10)
+    long_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=600)
+    with db.engine.begin() as conn:
+        conn.execute(models.ImportJob.__table__.update().values(updated_at=long_ago))
+
+    heartbeat = jobs.JobHeartbeat(engine, job_id, jobs.import_job_key('hl7.fhir.us.core', '6.1.0', 'recursive'))
+    heartbeat._last -= heartbeat.interval
+    heartbeat()
+
+    assert engine.submit('hl7.fhir.us.core', '6.1.0') == (job_id, False)
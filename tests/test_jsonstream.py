@@ -0,0 +1,109 @@
+import io
+import json
+
+import pytest
+
+from jsonstream import JsonStreamError, iter_array_member, iter_bundle_resources, iter_ndjson_records
+
+
+def resource_at(data, offset, length):
+    return json.loads(data[offset:offset + length])
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64 * 1024])
+def test_bundle_resource_offsets_point_at_resources(chunk_size):
+    resources = [
+        {'resourceType': 'Patient', 'id': 'p1', 'name': [{'family': 'Ünïcode'}]},
+        {'resourceType': 'Observation', 'id': 'o1', 'note': [{'text': 'has "resource": {} in it'}]},
+    ]
+    bundle = {'resourceType': 'Bundle', 'id': 'b1', 'type': 'collection',
+              'entry': [{'fullUrl': 'urn:uuid:1', 'resource': resources[0]}, {'search': {}},
+                        {'resource': resources[1]}]}
+    data = json.dumps(bundle, ensure_ascii=False, indent=1).encode('utf-8')
+    top_level = {}
+
+    found = list(iter_bundle_resources(io.BytesIO(data), top_level=top_level, chunk_size=chunk_size))
+
+    assert [fields for _, _, fields in found] == [{'resourceType': 'Patient', 'id': 'p1'},
+                                                   {'resourceType': 'Observation', 'id': 'o1'}]
+    assert [resource_at(data, offset, length) for offset, length, _ in found] == resources
+    assert top_level == {'resourceType': 'Bundle', 'id': 'b1'}
+
+
+@pytest.mark.parametrize('chunk_size', [5, 64 * 1024])
+def test_ndjson_offsets_skip_blank_lines_and_carriage_returns(chunk_size):
+    data = b'{"resourceType":"Patient","id":"p1"}\r\n\n  \n{"resourceType":"Patient","id":"p2"}'
+
+    found = list(iter_ndjson_records(io.BytesIO(data), chunk_size=chunk_size))
+
+    assert [fields['id'] for _, _, fields in found] == ['p1', 'p2']
+    assert [resource_at(data, offset, length)['id'] for offset, length, _ in found] == ['p1', 'p2']
+
+
+def test_ndjson_reports_offset_of_invalid_line():
+    data = b'{"resourceType":"Patient","id":"p1"}\n{"resourceType":\n'
+
+    with pytest.raises(JsonStreamError, match='byte 37'):
+        list(iter_ndjson_records(io.BytesIO(data)))
+
+
+def packages(data, max_item_bytes=None, chunk_size=64 * 1024):
+    return list(iter_array_member(io.BytesIO(data), 'packages', max_item_bytes=max_item_bytes, chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64 * 1024])
+def test_array_member_yields_items_and_skips_other_members(chunk_size):
+    data = b' {"name": "feed", "nested": {"packages": [0]}, "packages" : [ {"name": "a"} , {"name": "b,]"} ],' \
+           b' "other": [1, 2]}\n'
+    assert packages(data, chunk_size=chunk_size) == [{'name': 'a'}, {'name': 'b,]'}]
+
+
+@pytest.mark.parametrize('document', [
+    b'{"packages": [],}',
+    b'{,"packages": []}',
+    b'{"packages": [],,"x": 1}',
+    b'{"a": 1 "packages": []}',
+    b'{"packages": [1,]}',
+    b'{"packages": [,1]}',
+    b'{"packages": [1,,2]}',
+    b'{"packages": [1 2]}',
+    b'{"packages": [1]} {}',
+    b'{"packages": [1]},',
+    b'{"packages": [1]',
+    b'{"packages": ["unterminated]}',
+    b'',
+], ids=['trailing-comma', 'leading-comma', 'double-comma', 'missing-comma', 'item-trailing-comma',
+        'item-leading-comma', 'item-double-comma', 'item-missing-comma', 'trailing-value', 'trailing-comma-after-object',
+        'truncated', 'unterminated-string', 'empty'])
+@pytest.mark.parametrize('chunk_size', [2, 64 * 1024])
+def test_array_member_rejects_what_json_rejects(document, chunk_size):
+    with pytest.raises(ValueError):
+        json.loads(document)
+    with pytest.raises(JsonStreamError):
+        packages(document, chunk_size=chunk_size)
+
+
+def test_array_member_requires_a_top_level_object():
+    with pytest.raises(JsonStreamError, match='not an object'):
+        packages(b'[{"packages": []}]')
+
+
+def test_oversized_item_is_rejected_before_it_is_buffered():
+    data = json.dumps({'packages': [{'name': 'small'}, {'name': 'x' * 10000}]}).encode()
+
+    items = iter_array_member(io.BytesIO(data), 'packages', max_item_bytes=1024, chunk_size=256)
+
+    assert next(items) == {'name': 'small'}
+    with pytest.raises(JsonStreamError, match='larger than 1024 bytes'):
+        next(items)
+
+
+@pytest.mark.parametrize('document', [
+    b'{"resourceType": "Bundle", "entry": [{"resource": {"resourceType": "Patient", "id": "p"}},]}',
+    b'{"resourceType": "Bundle",, "entry": []}',
+    b'{"resourceType": "Bundle", "entry": []}\n{"resourceType": "Bundle"}',
+    b'{"resourceType": "Bundle", "entry": [{"resource": {"resourceType": "Patient", "id": "p"}}',
+])
+def test_bundle_rejects_malformed_documents(document):
+    with pytest.raises(JsonStreamError):
+        list(iter_bundle_resources(io.BytesIO(document)))
@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import event
+
+import models
+import services
+from models import db
+
+
+@pytest.fixture
+def app(db_app):
+    db.session.add(models.TestDataResource(filename='p.json', file_path='/data/p.json', byte_offset=0,
+                                           resource_type='Patient', resource_id='example'))
+    db.session.commit()
+    return db_app
+
+
+def explain(statement, parameters=()):
+    connection = db.session.connection()
+    return '\n'.join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+
+
+def captured_plans(call):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        call()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    return [explain(statement, parameters) for statement, parameters in statements]
+
+
+@pytest.mark.parametrize('call, index_name', [
+    (lambda: services.load_cached_packages(registry='https://packages.fhir.org'), 'ix_cached_package_registry'),
+    (lambda: services.load_cached_packages(fhir_version='4.0.1'), 'ix_cached_package_fhir_version'),
+    (lambda: services.query_test_data_page(['Observation', 'Patient']), 'ix_test_data_type_id'),
+    (lambda: services.query_test_data_page(['Patient'], after=1), 'ix_test_data_type_id'),
+    (lambda: services.load_package_versions_data('hl7.fhir.us.core'), 'ix_registry_feed_entry_package_name_lower'),
+], ids=['packages-by-registry', 'packages-by-fhir-version', 'test-data-page', 'test-data-next-page',
+        'package-versions'])
+def test_service_queries_use_index(app, call, index_name):
+    plans = captured_plans(call)
+    assert plans, "no SELECT was issued"
+    assert any(index_name in plan for plan in plans), '\n---\n'.join(plans)
+
+
+@pytest.mark.parametrize('build_query, index_name', [
+    (lambda: models.CachedPackage.query.filter_by(package_name_lower='hl7.fhir.us.core'),
+     'ix_cached_package_package_name_lower'),
+    (lambda: models.CachedPackage.query.filter_by(registry='https://packages.fhir.org'), 'ix_cached_package_registry'),
+    (lambda: models.CachedPackage.query.filter_by(fhir_version='4.0.1'), 'ix_cached_package_fhir_version'),
+    (lambda: models.TestDataResource.query.filter(
+        models.TestDataResource.resource_type.in_(['Observation', 'Patient'])).order_by(
+        models.TestDataResource.resource_type, models.TestDataResource.resource_id,
+        models.TestDataResource.id).limit(101), 'ix_test_data_type_id'),
+    (lambda: models.TestDataResource.query.filter_by(resource_type='Patient', resource_id='example'),
+     'ix_test_data_type_id'),
+], ids=['package-details', 'packages-by-registry', 'packages-by-fhir-version', 'test-data-by-type',
+        'test-data-by-type-and-id'])
+def test_queries_use_index(app, build_query, index_name):
+    query = build_query()
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    plan = explain(sql)
+    assert index_name in plan, plan
@@ -0,0 +1,72 @@
+import json
+import os
+
+import models
+import services
+
+
+def write_json(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def scan_states():
+    return {os.path.basename(row.file_path): (row.status, row.resource_count)
+            for row in models.TestDataScanState.query}
+
+
+def test_unchanged_files_are_not_parsed_again(db_app, tmp_path):
+    folder = str(tmp_path / 'test_data')
+    write_json(os.path.join(folder, 'patient.json'), {'resourceType': 'Patient', 'id': 'p1'})
+    write_json(os.path.join(folder, 'nested', 'observation.json'), {'resourceType': 'Observation', 'id': 'o1'})
+
+    first = services.parse_test_data_folder(folder)
+    assert (first['files'], first['parsed'], first['added']) == (2, 2, 2)
+    second = services.parse_test_data_folder(folder)
+    assert (second['parsed'], second['added'], second['removed']) == (0, 0, 0)
+    assert models.TestDataResource.query.count() == 2
+
+
+def test_changed_and_removed_files_are_detected(db_app, tmp_path):
+    folder = str(tmp_path / 'test_data')
+    patient = os.path.join(folder, 'patient.json')
+    observation = os.path.join(folder, 'observation.json')
+    write_json(patient, {'resourceType': 'Patient', 'id': 'p1'})
+    write_json(observation, {'resourceType': 'Observation', 'id': 'o1'})
+    services.parse_test_data_folder(folder)
+
+    write_json(patient, {'resourceType': 'Patient', 'id': 'p2-renamed'})
+    bump_mtime(patient)
+    os.unlink(observation)
+    stats = services.parse_test_data_folder(folder)
+
+    assert (stats['parsed'], stats['added'], stats['removed']) == (1, 1, 1)
+    rows = [(row.resource_type, row.resource_id) for row in models.TestDataResource.query]
+    assert rows == [('Patient', 'p2-renamed')]
+    assert set(scan_states()) == {'patient.json'}
+
+
+def test_skipped_failed_and_empty_files_are_recorded(db_app, tmp_path):
+    folder = str(tmp_path / 'test_data')
+    os.makedirs(folder)
+    with open(os.path.join(folder, 'broken.json'), 'w') as f:
+        f.write('{"resourceType": "Pat')
+    write_json(os.path.join(folder, 'no-id.json'), {'resourceType': 'Patient'})
+    write_json(os.path.join(folder, 'empty-bundle.json'), {'resourceType': 'Bundle', 'type': 'collection', 'entry': []})
+    open(os.path.join(folder, 'empty.ndjson'), 'w').close()
+
+    first = services.parse_test_data_folder(folder)
+    assert first['parsed'] == 4
+    assert scan_states() == {
+        'broken.json': ('error', 0),
+        'no-id.json': ('skipped', 0),
+        'empty-bundle.json': ('empty', 0),
+        'empty.ndjson': ('empty', 0),
+    }
+    assert services.parse_test_data_folder(folder)['parsed'] == 0